@@ -3,7 +3,7 @@
 
 {
     'name': 'Agora connector',
-    'version': '15.0.1.5.10',
+    'version': '15.0.1.8.0',
     'category': 'Extra Tools',
     'summary': """Agora connector: Sales in Odoo""",
     'description': """Agora connector: Sales, Customer, Invoice address, Products in Odoo""",
@@ -47,6 +47,7 @@
         'views/account_mapping.xml',
         'views/payments_method_views.xml',
         'views/account_batch_payment_views.xml',
+        'views/agora_product_outbox.xml',
         'views/menus.xml'
     ],
     'post_init_hook': 'create_data',
@@ -0,0 +1,45 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """
+    Migration to send the product changes through the outbox
+    """
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    fill_product_outbox(env)
+    update_sync_status(env)
+    update_products_cron(env)
+
+
+def fill_product_outbox(env):
+    """
+    Method that add to the outbox the products waiting to be sent to Agora
+    """
+    products = env['product.template'].with_context(active_test=False).search(
+        [('sync_status', 'in', ['new', 'modified', 'error'])])
+    env['agora.product.outbox'].enqueue(products)
+
+
+def update_sync_status(env):
+    """
+    Method that set as done the modified products and with error, their changes are now in the outbox.
+    The ones never created in Agora are set as new
+    """
+    env.cr.execute("""
+        UPDATE product_template
+           SET sync_status = CASE WHEN COALESCE(agora_id, 0) = 0 AND COALESCE(sale_format, 0) = 0
+                                  THEN 'new' ELSE 'done' END
+         WHERE sync_status IN ('modified', 'error')
+    """)
+
+
+def update_products_cron(env):
+    """
+    Method that run the cron to send the products each few minutes, the cron is noupdate
+    """
+    cron = env.ref('rap_connector_agora.ir_cron_update_products_in_agora', raise_if_not_found=False)
+    if cron:
+        cron.write({'interval_number': 5, 'interval_type': 'minutes'})
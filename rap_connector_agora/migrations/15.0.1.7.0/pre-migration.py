@@ -0,0 +1,51 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Migration to prepare the unique ticket constraint of the queue
+    """
+    store_line_company(cr)
+    remove_duplicated_tickets(cr)
+
+
+def store_line_company(cr):
+    """
+    Method that create and fill the company column of the queue lines, before the ORM compute it line by line
+    """
+    cr.execute("ALTER TABLE sale_api_line ADD COLUMN IF NOT EXISTS company_id INTEGER")
+    cr.execute("""
+        UPDATE sale_api_line l SET company_id = a.company_id
+          FROM sale_api a
+         WHERE a.id = l.sale_api_id AND l.company_id IS NULL
+    """)
+
+
+def remove_duplicated_tickets(cr):
+    """
+    Method that delete the tickets queued twice in the same company.
+    The line with a Sale Order, or else the done one, or else the oldest one is kept.
+    Each line deleted is logged, to be able to audit them
+    """
+    cr.execute("""
+        DELETE FROM sale_api_line l
+         USING (SELECT id, row_number() OVER (
+                           PARTITION BY company_id, COALESCE(ticket_serial, ''), COALESCE(ticket_number, 0),
+                                        COALESCE(document_type, '')
+                           ORDER BY sale_order_id IS NULL, state != 'done', id) AS position
+                  FROM sale_api_line
+                 WHERE company_id IS NOT NULL) d
+         WHERE d.id = l.id AND d.position > 1
+        RETURNING l.id, l.company_id, l.ticket_serial, l.ticket_number, l.document_type, l.state, l.sale_order_id
+    """)
+    for line_id, company_id, serial, number, document_type, state, sale_order_id in cr.fetchall():
+        _logger.warning("Duplicated Agora ticket removed from the queue: line %s, company %s, ticket %s-%s (%s), "
+                        "state %s, sale order %s", line_id, company_id, serial, number, document_type, state,
+                        sale_order_id)
+    if cr.rowcount:
+        _logger.info("%s duplicated tickets removed from the Agora queue", cr.rowcount)
@@ -0,0 +1,106 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Migration to store the Agora tickets of the queue as jsonb
+    """
+    create_safe_casts(cr)
+    move_order_data_to_jsonb(cr)
+    fill_ticket_keys(cr)
+
+
+def create_safe_casts(cr):
+    """
+    Method that create the temporary functions to cast the values of the tickets,
+    a value that can't be cast is NULL instead of stopping the migration
+    """
+    for name, sql_type in [('jsonb', 'JSONB'), ('date', 'DATE'), ('float', 'DOUBLE PRECISION'),
+                           ('integer', 'INTEGER')]:
+        cr.execute("""
+            CREATE OR REPLACE FUNCTION pg_temp.agora_safe_{name}(value TEXT) RETURNS {sql_type} AS $$
+            BEGIN
+                RETURN value::{sql_type};
+            EXCEPTION WHEN others THEN
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql IMMUTABLE
+        """.format(name=name, sql_type=sql_type))
+
+
+def move_order_data_to_jsonb(cr):
+    """
+    Method that copy the JSON text of the tickets to the new jsonb column and remove the text column,
+    the Order Data is now computed from the jsonb
+    """
+    cr.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'sale_api_line' AND column_name = 'order_data'")
+    if not cr.fetchone():
+        return
+    cr.execute("ALTER TABLE sale_api_line ADD COLUMN IF NOT EXISTS order_json JSONB")
+    cr.execute("""
+        UPDATE sale_api_line SET order_json = pg_temp.agora_safe_jsonb(order_data)
+         WHERE order_data IS NOT NULL AND order_data != ''
+    """)
+    _logger.info("%s Agora tickets moved to jsonb", cr.rowcount)
+    # The tickets that are not a valid JSON are kept in the message, and can't be processed
+    cr.execute("""
+        UPDATE sale_api_line
+           SET message = concat_ws(E'\\n', message, 'Invalid Agora ticket: ' || order_data),
+               state = CASE WHEN state = 'done' THEN state ELSE 'fail' END
+         WHERE order_json IS NULL AND order_data IS NOT NULL AND order_data != ''
+     RETURNING id
+    """)
+    invalid_ids = [row[0] for row in cr.fetchall()]
+    if invalid_ids:
+        _logger.warning("%s Agora tickets are not a valid JSON, kept in their message: sale.api.line %s",
+                        len(invalid_ids), invalid_ids)
+    cr.execute("ALTER TABLE sale_api_line DROP COLUMN order_data")
+
+
+def fill_ticket_keys(cr):
+    """
+    Method that create and fill the columns of the ticket keys, before the ORM compute them line by line
+    """
+    cr.execute("""
+        ALTER TABLE sale_api_line
+            ADD COLUMN IF NOT EXISTS business_day DATE,
+            ADD COLUMN IF NOT EXISTS gross_amount DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS work_place_agora_id INTEGER,
+            ADD COLUMN IF NOT EXISTS sale_center_agora_id INTEGER
+    """)
+    keys = """
+        pg_temp.agora_safe_date(order_json ->> 'BusinessDay') AS business_day,
+        pg_temp.agora_safe_float(order_json -> 'Totals' ->> 'GrossAmount') AS gross_amount,
+        pg_temp.agora_safe_integer(order_json -> 'Workplace' ->> 'Id') AS work_place_agora_id,
+        pg_temp.agora_safe_integer(order_json -> 'InvoiceItems' -> 0 -> 'SaleCenter' ->> 'Id') AS sale_center_agora_id
+    """
+    cr.execute("""
+        UPDATE sale_api_line line
+           SET business_day = keys.business_day,
+               gross_amount = COALESCE(keys.gross_amount, 0.0),
+               work_place_agora_id = COALESCE(keys.work_place_agora_id, 0),
+               sale_center_agora_id = COALESCE(keys.sale_center_agora_id, 0)
+          FROM (SELECT id, {} FROM sale_api_line WHERE order_json IS NOT NULL) keys
+         WHERE keys.id = line.id
+    """.format(keys))
+    # The keys with a value that can't be cast are left empty
+    cr.execute("""
+        SELECT id FROM sale_api_line
+         WHERE order_json IS NOT NULL
+           AND ((order_json ->> 'BusinessDay' IS NOT NULL AND business_day IS NULL)
+                OR (order_json -> 'Totals' ->> 'GrossAmount' IS NOT NULL
+                    AND pg_temp.agora_safe_float(order_json -> 'Totals' ->> 'GrossAmount') IS NULL)
+                OR (order_json -> 'Workplace' ->> 'Id' IS NOT NULL
+                    AND pg_temp.agora_safe_integer(order_json -> 'Workplace' ->> 'Id') IS NULL)
+                OR (order_json -> 'InvoiceItems' -> 0 -> 'SaleCenter' ->> 'Id' IS NOT NULL
+                    AND pg_temp.agora_safe_integer(order_json -> 'InvoiceItems' -> 0 -> 'SaleCenter' ->> 'Id') IS NULL))
+    """)
+    invalid_ids = [row[0] for row in cr.fetchall()]
+    if invalid_ids:
+        _logger.warning("%s Agora tickets with invalid keys, the keys are left empty: sale.api.line %s",
+                        len(invalid_ids), invalid_ids)
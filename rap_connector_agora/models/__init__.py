@@ -16,4 +16,8 @@ from . import work_place
 from . import agora_reports_config
 from . import payments_method
 from . import account_mapping
+from . import agora_sync_state
+from . import agora_product_outbox
+from . import agora_ticket_watermark
+from . import sale_api_line_archive
 
@@ -6,10 +6,20 @@ from odoo.exceptions import UserError
 import requests
 import logging
 from odoo.exceptions import ValidationError
+from psycopg2 import errorcodes, OperationalError
 from dateutil import parser
 from datetime import datetime, timedelta
-from itertools import groupby
+from itertools import groupby, islice
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
 import json
+import hashlib
+from odoo.tools import float_compare, split_every
+from odoo.modules.registry import Registry
+import calendar
+from .sale_api_line_archive import ARCHIVE_BATCH_SIZE
+from ..tools import fetch_pool, http_session, id_allocator, json_stream, master_dag, master_resolver, product_index, \
+    rate_guard
 
 try:
     # Intenta el método antiguo
@@ -23,6 +33,80 @@ except AttributeError:
 _logger = logging.getLogger(__name__)
 
 
+def _load_circuit(key):
+    """"
+    Function to load the circuit breaker state of a connection, saved by any worker
+    Params:
+        key: (dbname, api.connection id)
+    Return: Dict, see rate_guard.CircuitBreaker.snapshot. None if the connection doesn't exist
+    """
+    dbname, connection_id = key
+    with Registry(dbname).cursor() as cr:
+        cr.execute("""
+            SELECT circuit_state, circuit_failures, circuit_retry_at, circuit_last_error
+              FROM api_connection WHERE id = %s
+        """, (connection_id,))
+        row = cr.fetchone()
+    if not row:
+        return None
+    state, failures, retry_at, last_error = row
+    return {'state': state, 'failures': failures, 'retry_at': retry_at and calendar.timegm(retry_at.timetuple()),
+            'last_error': last_error}
+
+
+def _save_circuit(key, snapshot):
+    """"
+    Function to save the circuit breaker state of a connection in its own cursor, so it's kept
+    even if the transaction that made the request is rolled back, and it's visible for all the workers
+    Return: False if the connection was locked by other transaction, the state is saved with the next request
+    """
+    dbname, connection_id = key
+    with Registry(dbname).cursor() as cr:
+        cr.execute("""
+            UPDATE api_connection
+               SET circuit_state = %s, circuit_failures = %s, circuit_retry_at = %s, circuit_last_error = %s
+             WHERE id IN (SELECT id FROM api_connection WHERE id = %s FOR UPDATE SKIP LOCKED)
+        """, (snapshot['state'], snapshot['failures'],
+              snapshot['retry_at'] and datetime.utcfromtimestamp(snapshot['retry_at']) or None,
+              (snapshot['last_error'] or '')[:500] or None, connection_id))
+        return bool(cr.rowcount)
+
+
+rate_guard.set_store(_load_circuit, _save_circuit)
+
+# Number of tickets written in the queue at once
+QUEUE_BATCH_SIZE = 200
+# Number of /import calls made with the events taken at once from the products outbox
+OUTBOX_BATCHES = 4
+# Number of new Agora Products created at once during the import
+PRODUCT_CHUNK_SIZE = 200
+# Seconds waited for the lock of the connection row to reserve new Agora IDs
+ID_LOCK_TIMEOUT = 5
+# Masters that should be imported before each master. The product prices need the pricelists
+MASTER_DEPENDENCIES = {
+    'PriceLists': [],
+    'WorkplacesSummary': [],
+    'Families': [],
+    'SaleCenters': ['PriceLists'],
+    'Products': ['Families', 'PriceLists'],
+}
+# Functions to be executed once all the chunks of a master are imported
+MASTER_FINALIZERS = {
+    'Products': 'link_missing_addins',
+}
+# Agora master filters and the function to import each one
+MASTER_IMPORTS = {
+    'PriceLists': 'import_master_pricelist',
+    'WorkplacesSummary': 'import_master_work_places',
+    'SaleCenters': 'import_master_sale_center',
+    'Families': 'import_master_categories',
+    'Products': 'import_master_products',
+}
+# Masters in the order they should be imported (Sale Centers need Pricelists, Products need Families)
+FIRST_SYNC_MASTERS = ['PriceLists', 'WorkplacesSummary', 'SaleCenters', 'Families', 'Products']
+UPDATE_MASTERS = ['PriceLists', 'WorkplacesSummary', 'SaleCenters', 'Families']
+
+
 class APIConnection(models.Model):
     _name = 'api.connection'
     _description = 'API Connection'
@@ -76,10 +160,117 @@ class APIConnection(models.Model):
         string='Last Connection'
     )
     last_product_id = fields.Integer(
-        string='Last Product ID'
+        string='Last Product ID',
+        help='Last Agora Product ID reserved for the products created in Odoo'
     )
     last_format_id = fields.Integer(
-        string='Last Format ID'
+        string='Last Format ID',
+        help='Last Agora Format ID reserved for the formats created in Odoo'
+    )
+    id_block_size = fields.Integer(
+        string='IDs by Block',
+        default=20,
+        help='Agora IDs reserved at once for the new products and formats. '
+             'The IDs of a block not used in 5 minutes are reused by the next block if no other block '
+             'was reserved after it, otherwise they are skipped'
+    )
+    post_batch_size = fields.Integer(
+        string='Products by Post',
+        default=50,
+        help='Number of products sent to Agora in each /import call. With 1 the products are sent one by one'
+    )
+    sync_chunk_size = fields.Integer(
+        string='Records by Chunk',
+        default=500,
+        help='Records of each master imported and committed at once during the first sync. '
+             'If the sync is interrupted, the next run resumes after the last committed chunk'
+    )
+    queue_retention_days = fields.Integer(
+        string='Queue Retention Days',
+        default=90,
+        help='Days the tickets of the processed queue lines are kept in the queue. After them the tickets are '
+             'moved, compressed, to the archive and can be restored from the line. With 0 they are never archived'
+    )
+    sync_state_ids = fields.One2many(
+        string='Masters Sync',
+        comodel_name='agora.sync.state',
+        inverse_name='connection_id'
+    )
+    ticket_watermark_ids = fields.One2many(
+        string='Tickets Watermarks',
+        comodel_name='agora.ticket.watermark',
+        inverse_name='connection_id'
+    )
+    # ---------------------
+    #     HTTP fields
+    # ---------------------
+    http_pool_size = fields.Integer(
+        string='Pool Size',
+        default=http_session.DEFAULT_POOL_SIZE,
+        help='Max number of keep-alive connections opened with the Agora server'
+    )
+    http_connect_timeout = fields.Float(
+        string='Connect Timeout (s)',
+        default=http_session.DEFAULT_CONNECT_TIMEOUT
+    )
+    http_read_timeout = fields.Float(
+        string='Read Timeout (s)',
+        default=http_session.DEFAULT_READ_TIMEOUT
+    )
+    http_max_retries = fields.Integer(
+        string='Max Retries',
+        default=http_session.DEFAULT_MAX_RETRIES,
+        help='Retries for connection errors and 5xx responses'
+    )
+    http_retry_backoff = fields.Float(
+        string='Retry Backoff',
+        default=http_session.DEFAULT_RETRY_BACKOFF,
+        help='Backoff factor in seconds between retries, grows exponentially'
+    )
+    rate_limit = fields.Float(
+        string='Rate Limit (req/s)',
+        default=0.0,
+        help='Max requests by second sent to the Agora server. 0 means no limit'
+    )
+    rate_burst = fields.Integer(
+        string='Rate Burst',
+        default=1,
+        help='Requests that can be sent at once before the rate limit applies'
+    )
+    circuit_failure_threshold = fields.Integer(
+        string='Failures to Open Circuit',
+        default=rate_guard.DEFAULT_FAILURE_THRESHOLD,
+        help='Consecutive failed requests after which the server is not called anymore until the recovery time'
+             ' is over. 0 disables the circuit breaker'
+    )
+    circuit_recovery_time = fields.Integer(
+        string='Circuit Recovery Time (s)',
+        default=rate_guard.DEFAULT_RECOVERY_TIME,
+        help='Seconds the circuit stays open before a probe request is allowed'
+    )
+    circuit_state = fields.Selection(
+        string='Circuit State',
+        selection=[(rate_guard.CLOSED, 'Closed'), (rate_guard.OPEN, 'Open'), (rate_guard.HALF_OPEN, 'Half Open')],
+        default=rate_guard.CLOSED,
+        readonly=True,
+        copy=False,
+        help='State of the circuit breaker, shared by all the workers. '
+             'Open means the server is failing and is not called until the next probe'
+    )
+    circuit_failures = fields.Integer(
+        string='Consecutive Failures',
+        readonly=True,
+        copy=False
+    )
+    circuit_retry_at = fields.Datetime(
+        string='Next Probe',
+        readonly=True,
+        copy=False
+    )
+    circuit_last_error = fields.Char(
+        string='Last Error',
+        readonly=True,
+        copy=False
     )
 
     _sql_constraints = [('unique_name', 'unique(name)',
@@ -103,27 +294,79 @@ class APIConnection(models.Model):
 # -----------------------------------------------------------------------------------------------------
 # ----------------------------------------- MAIN REQUESTS ---------------------------------------------
 # -----------------------------------------------------------------------------------------------------
-    @staticmethod
-    def get_request(url, end_point, token, params):
+    def _get_endpoint(self, url=None, token=None):
+        """"
+        Function to get the HTTP config of the connection
+        Params:
+            url: Host, by default the one in the connection
+            token: Token for authentication, by default the one in the connection
+        Return: AgoraEndpoint used by the pooled session
+        """
+        connection = self[:1]
+        return http_session.AgoraEndpoint(
+            key=(self.env.cr.dbname, connection.id),
+            url=url or connection.url_server,
+            token=token or connection.server_api_key,
+            pool_size=connection.http_pool_size or http_session.DEFAULT_POOL_SIZE,
+            connect_timeout=connection.http_connect_timeout or http_session.DEFAULT_CONNECT_TIMEOUT,
+            read_timeout=connection.http_read_timeout or http_session.DEFAULT_READ_TIMEOUT,
+            max_retries=connection.http_max_retries if connection else http_session.DEFAULT_MAX_RETRIES,
+            retry_backoff=connection.http_retry_backoff or http_session.DEFAULT_RETRY_BACKOFF,
+            rate_limit=connection.rate_limit,
+            rate_burst=connection.rate_burst or 1,
+            failure_threshold=connection.circuit_failure_threshold if connection
+            else rate_guard.DEFAULT_FAILURE_THRESHOLD,
+            recovery_time=connection.circuit_recovery_time or rate_guard.DEFAULT_RECOVERY_TIME
+        )
+
+    def _get_reachable_connections(self):
+        """"
+        Function to get the connected instances, skipping the ones with the circuit open.
+        The crons use it to not wait for the timeouts of a server that is known to be down
+        Return: api.connection recordset
+        """
+        conections = self.search([('state', '=', 'connect')])
+        now = fields.Datetime.now()
+        open_circuit = conections.filtered(
+            lambda c: c.circuit_state == rate_guard.OPEN and c.circuit_retry_at and c.circuit_retry_at > now)
+        for connec in open_circuit:
+            _logger.warning("Agora connection %s skipped, circuit open until %s: %s",
+                            connec.name, connec.circuit_retry_at, connec.circuit_last_error)
+        for connec in (conections - open_circuit).filtered(lambda c: c.circuit_state != rate_guard.CLOSED):
+            # The circuit was opened by other worker, this one should probe the server before sending more requests
+            guard = rate_guard.find_guard((self.env.cr.dbname, connec.id))
+            if guard:
+                guard.load()
+        return conections - open_circuit
+
+    def action_reset_circuit(self):
+        """"
+        Function to close the circuit by hand, when the Agora server is known to be available again
+        """
+        self.write({'circuit_state': rate_guard.CLOSED, 'circuit_failures': 0, 'circuit_retry_at': False,
+                    'circuit_last_error': False})
+        for rec in self:
+            # The other workers load the new state when their circuit refuses a request
+            guard = rate_guard.find_guard((self.env.cr.dbname, rec.id))
+            if guard:
+                guard.reset()
+
+    def get_request(self, url, end_point, token, params, stream=False):
         """"
         Function to make GET request
+        The request use the pooled keep-alive session of the connection
         Params:
             url: Host
             endpoint: Endpoint to complement the Host
             token: Token for authentication. Always Required
             Params: Aditional Filters
+            stream: If True the body is not downloaded until its read
             Example: (http://localhost:8984/api, '/export-master', 'U22RgEi*o6g!', {'filter': 'Series'})
         Return: Request Response if went OK(200), False if went sommething wrong(!200), Exception if there was an error
         """
-        headers = {
-            'Accept': 'application/json',
-            'Accept-Encoding': 'gzip',
-            'Content-Type': 'application/json; charset=utf-8',
-            'Api-Token': token
-        }
-        url = '{}{}'.format(url, end_point)
+        endpoint = self._get_endpoint(url, token)
         try:
-            connect = requests.get(url=url, headers=headers, params=params, verify=False)
+            connect = http_session.send(endpoint, 'GET', end_point, params=params, stream=stream)
             if connect:
                 if connect.status_code == 200:
                     return connect
@@ -136,10 +379,28 @@ class APIConnection(models.Model):
             _logger.error(e)
             raise UserError(_('{}'.format(e)))
 
-    @staticmethod
-    def post_request(url, end_point, token, json):
+    def iter_export_records(self, end_point, params, key):
+        """"
+        Function to get one by one the records of an export, decoding the body while its downloaded
+        The whole list is never loaded in memory
+        Params:
+            end_point: '/export-master' or '/export/?business-day=...'
+            params: Aditional Filters. Ex. {'filter': 'Products'}
+            key: Key of the list in the response. Ex. 'Products'
+        Return: Generator of records (dicts)
+        """
+        response = self.get_request(self.url_server, end_point, self.server_api_key, params, stream=True)
+        try:
+            chunks = response.iter_content(chunk_size=json_stream.CHUNK_SIZE)
+            for record in json_stream.iter_json_array(chunks, key):
+                yield record
+        finally:
+            response.close()
+
+    def post_request(self, url, end_point, token, json):
         """"
         Function to make POST request
+        The request use the pooled keep-alive session of the connection
         Params:
             url: Host
             endpoint: Endpoint to complement the Host
@@ -148,23 +409,115 @@ class APIConnection(models.Model):
             Example: (http://localhost:8984/api, '/import', 'U22RgEi*o6g!', {'filter': 'Series'})
         Return: Request Response if went OK(200), False if went sommething wrong(!200), Exception if there was an error
         """
-        headers = {
-            'Accept': 'application/json',
-            'Accept-Encoding': 'gzip',
-            'Content-Type': 'application/json; charset=utf-8',
-            'Api-Token': token
-        }
-        url = '{}{}'.format(url, end_point)
+        endpoint = self._get_endpoint(url, token)
         try:
-            connect = requests.post(url=url, headers=headers, json=json, verify=False)
-            if connect is not None:
-                if connect.status_code == 200:
-                    return connect, connect.content
-                else:
-                    return False, connect.content
+            connect = http_session.send(endpoint, 'POST', end_point, json=json)
+            if connect.status_code == 200:
+                return connect, connect.content
+            else:
+                return False, connect.content
         except Exception as e:
             _logger.error(e)
-            return False, connect.content
+            return False, str(e).encode()
+
+# -----------------------------------------------------------------------------------------------------
+# ------------------------------------ CONCURRENT FETCH -----------------------------------------------
+# -----------------------------------------------------------------------------------------------------
+    def _get_fetch_workers(self):
+        """"
+        Return: Max number of Agora servers downloaded at the same time by the crons
+        """
+        workers = self.env['ir.config_parameter'].sudo().get_param('rap_connector_agora.fetch_workers')
+        return int(workers or fetch_pool.DEFAULT_WORKERS)
+
+    def _get_fetch_job(self, key, end_point, params=None, method='GET', json=None, headers=None):
+        """"
+        Function to prepare a request to be made in the concurrent fetch stage
+        Params:
+            key: Identifier of the request inside of the connection. Ex. 'Products'
+            end_point, params, method, json: Same values used in get_request/post_request
+            headers: Extra HTTP headers
+        Return: FetchJob with plain data, can be used outside of the ORM
+        """
+        self.ensure_one()
+        return fetch_pool.make_job(self.id, key, self._get_endpoint(), end_point, params=params,
+                                   method=method, json=json, headers=headers)
+
+    def _get_master_fetch_job(self, master_filter, conditional=False):
+        """"
+        Params:
+            conditional: Send the HTTP validators of the last import, Agora can answer 304 if nothing changed
+        """
+        headers = None
+        if conditional:
+            headers = self.sync_state_ids.filtered(lambda s: s.master_filter == master_filter).get_conditional_headers()
+        return self._get_fetch_job(master_filter, '/export-master', {'filter': master_filter}, headers=headers)
+
+    def _get_invoices_fetch_job(self, date):
+        return self._get_fetch_job('Invoices', self.get_invoices_end_point(date), {'filter': 'Invoices'})
+
+    def _fetch_and_process(self, jobs, process):
+        """"
+        Function to download concurrently the jobs of all the connections
+        As soon as all the jobs of a connection are downloaded, the data is processed in its own cursor,
+        so an error or a slow server in one company doesn't affect the others.
+        Params:
+            jobs: List of FetchJob (see _get_fetch_job)
+            process: function(connection, results) where results is a dict {key: FetchResult}
+        """
+        for connection_id, results in fetch_pool.fetch_by_group(jobs, self._get_fetch_workers()):
+            connection = self.browse(connection_id)
+            try:
+                errors = [result.error for result in results.values() if result.error]
+                if errors:
+                    _logger.error("Agora connection %s not processed: %s", connection.name, ', '.join(errors))
+                    continue
+                with self.pool.cursor() as cr:
+                    process(connection.with_env(connection.env(cr=cr)), results)
+            except Exception as e:
+                _logger.error("Agora connection %s failed: %s", connection.name, e)
+            finally:
+                for result in results.values():
+                    result.close()
+
+    def sync_masters(self, master_filters, skip_unchanged=False, checkpoint=False):
+        """"
+        Function to download and import the masters of all the connections in self as a pipeline
+        All the downloads start at once and each master is imported in its own cursor as soon as
+        its download and the masters it depends on (MASTER_DEPENDENCIES) are done.
+        Params:
+            master_filters: Masters to be imported
+            skip_unchanged, checkpoint: See import_masters
+        Return: Dict {(connection id, master): error} of the masters not imported
+        """
+        registry, uid, context = self.pool, self.env.uid, dict(self.env.context)
+        jobs = {(connection.id, master): connection._get_master_fetch_job(master, conditional=skip_unchanged)
+                for connection in self for master in master_filters}
+        graph = {(connection_id, master): [(connection_id, dep) for dep in MASTER_DEPENDENCIES.get(master, [])]
+                 for connection_id, master in jobs}
+        workers = self._get_fetch_workers()
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs) or 1))) as fetch_executor:
+            downloads = {stage: fetch_executor.submit(fetch_pool.fetch, job) for stage, job in jobs.items()}
+
+            def import_stage(stage):
+                connection_id, master = stage
+                result = downloads[stage].result()
+                try:
+                    if result.error:
+                        raise UserError(result.error)
+                    with registry.cursor() as cr:
+                        env = api.Environment(cr, uid, context)
+                        env['api.connection'].browse(connection_id).import_masters(
+                            {master: result}, [master], skip_unchanged=skip_unchanged, checkpoint=checkpoint)
+                    # Invalidated again once committed, a sibling stage could have loaded the masters
+                    # of the connection before this cursor was committed
+                    master_resolver.invalidate((registry.db_name, connection_id))
+                finally:
+                    result.close()
+            errors = master_dag.run(graph, import_stage, workers)
+        for (connection_id, master), error in errors.items():
+            _logger.error("Agora master %s of connection %s not imported: %s", master, connection_id, error)
+        return errors
 
 # -----------------------------------------------------------------------------------------------------
 # ------------------------------ ACTIVATE/DEACTIVATE CONNECTIONS --------------------------------------
@@ -200,89 +553,313 @@ class APIConnection(models.Model):
 # -------------------- GET REQUEST TO GENERATE MASTERS DATA IN ODOO -----------------------------------
 # -----------------------------------------------------------------------------------------------------
 
+    def get_master_records(self, master_filter):
+        """"
+        Function to get the records of an Agora master
+        Params:
+            master_filter: Agora filter, also the key of the list in the response. Ex. 'Products'
+        Return: Generator of records (dicts)
+        """
+        params = {
+            'filter': master_filter
+        }
+        return self.iter_export_records('/export-master', params, master_filter)
+
+    def import_masters(self, results, master_filters, skip_unchanged=False, checkpoint=False):
+        """"
+        Function to import several masters already downloaded
+        The fingerprint of each payload is saved to know in the next sync if the master changed
+        Params:
+            results: Dict {filter: FetchResult} coming from the fetch stage
+            master_filters: Filters to be imported, in the right order
+            skip_unchanged: Dont import the masters with the same payload of the last import
+            checkpoint: Import and commit by chunks, resuming an unfinished import of the same payload.
+                        The masters already imported with the same payload are skipped
+        """
+        for master_filter in master_filters:
+            result = results[master_filter]
+            sync_state = self._get_sync_state(master_filter)
+            if (skip_unchanged or checkpoint) and sync_state.is_unchanged(result):
+                _logger.info("Agora master %s not changed in %s, import skipped", master_filter, self.name)
+                sync_state.save_result(result, imported=False)
+                continue
+            if checkpoint:
+                self._import_master_by_chunks(master_filter, result, sync_state)
+            else:
+                getattr(self, MASTER_IMPORTS[master_filter])(result.iter_records(master_filter))
+            sync_state.save_result(result)
+            master_resolver.invalidate((self.env.cr.dbname, self.id))
+
+    def _import_master_by_chunks(self, master_filter, result, sync_state):
+        """"
+        Function to import a master in chunks of 'sync_chunk_size' records, with a commit after each chunk
+        The position is saved in the sync state, so an interrupted import continues from the last chunk
+        """
+        self_chunks = self.with_context(agora_master_chunks=True)
+        import_function = getattr(self_chunks, MASTER_IMPORTS[master_filter])
+        position = sync_state.get_resume_cursor(result)
+        if position:
+            _logger.info("Agora master %s of %s resumed after %s records", master_filter, self.name, position)
+        records = islice(result.iter_records(master_filter), position, None)
+        for chunk in split_every(max(self.sync_chunk_size, 1), records):
+            import_function(chunk)
+            position += len(chunk)
+            sync_state.save_cursor(result, position)
+            self.env.cr.commit()
+            _logger.info("Agora master %s of %s: %s records imported", master_filter, self.name, position)
+        if master_filter in MASTER_FINALIZERS:
+            getattr(self, MASTER_FINALIZERS[master_filter])(result.iter_records(master_filter))
+
+    def _get_sync_state(self, master_filter):
+        """"
+        Return: agora.sync.state of the master for this connection, created if not exist
+        """
+        self.ensure_one()
+        sync_state = self.sync_state_ids.filtered(lambda s: s.master_filter == master_filter)
+        if not sync_state:
+            sync_state = self.env['agora.sync.state'].create({'connection_id': self.id,
+                                                               'master_filter': master_filter})
+        return sync_state
+
     def get_master_products(self):
         """"
         Function to get Products from Agora
         Generate Product.template record for each Agora Product that not exist in Odoo
         """
-        endpoint = '/export-master'
+        self.import_master_products(self.get_master_records('Products'))
+
+    def import_master_products(self, records):
+        """"
+        Function to import the Agora Products
+        The products of the company are indexed once, so the existence checks dont make queries
+        Params:
+            records: Iterable of Agora Products
+        """
         self_prod_creation = self.with_context({'first_charge': True})
         products_env = self_prod_creation.env['product.template']
-        params = {
-            'filter': 'Products'
-        }
-        products = self.get_request(self.url_server, endpoint, self.server_api_key, params)
+        index = self._load_product_index()
+        self._get_master_resolver(refresh=True)
         addings = []
-        if products and products.json().get('Products'):
-            json_products = products.json().get('Products')
-            for record in json_products:
-                existing_prod = products_env.search([('agora_id', '=', record.get('Id')),
-                                                     ('active', 'in', [True, False]),
-                                                     ('company_id', '=', self.company_id.id)], limit=1)
-                if record.get('DeletionDate') and existing_prod.active:
-                    # If the product have being deleted in Agora Should be Archive in Odoo
-                    existing_prod.active = False
-                    continue
-                if not existing_prod:
-                    # If product dont exist, Should be created
-                    values_dict = {}
-                    product = self.create_product(record, values_dict, False)
-                    addings.append(product.get('addings'))
-                    if record.get('AdditionalSaleFormats'):
-                        # If product have formats, should be created as products
-                        formats = self.generate_sale_formats(product.get('product'), record)
-                        for form in formats:
-                            addings.append(form)
-                else:
-                    product = existing_prod
-                if record.get('DeletionDate'):
-                    product.update({'active': False})
-                else:
-                    product.update({'active': True})
-            self.create_addings(addings)
+        new_records = []
+        for record in records:
+            record_hash = self.get_record_hash(record)
+            existing_ref = index.get_product(record.get('Id'))
+            if existing_ref and existing_ref.hash == record_hash:
+                # Nothing changed in Agora since the last import
+                continue
+            if record.get('DeletionDate') and existing_ref and existing_ref.active:
+                # If the product have being deleted in Agora Should be Archive in Odoo
+                products_env.browse(existing_ref.id).write({'active': False, 'agora_hash': record_hash})
+                existing_ref.active = False
+                existing_ref.hash = record_hash
+                continue
+            if not existing_ref:
+                # If product dont exist, Should be created. The new products are created by chunks
+                new_records.append(record)
+                if len(new_records) >= PRODUCT_CHUNK_SIZE:
+                    addings.extend(self._bulk_create_products(new_records, index))
+                    new_records = []
+                continue
+            values = {'agora_hash': record_hash}
+            active = not record.get('DeletionDate')
+            if existing_ref.active != active:
+                values['active'] = active
+            products_env.browse(existing_ref.id).write(values)
+            existing_ref.active = active
+            existing_ref.hash = record_hash
+        if new_records:
+            addings.extend(self._bulk_create_products(new_records, index))
+        if not self.env.context.get('agora_master_chunks'):
+            # Importing by chunks, the addins could be in a next chunk. They are linked by link_missing_addins
+            self.create_addings(addings, index)
+
+    @staticmethod
+    def get_record_hash(record):
+        """"
+        Return: Hash of an Agora record, used to know if the record changed since the last import
+        """
+        return hashlib.sha1(json.dumps(record, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+    @classmethod
+    def get_payload_hash(cls, payload):
+        """"
+        Return: Hash of the data of a product sent to Agora, used to know if it changed since the last push.
+        The deletion dates come from the write date, so only if the product is deleted or not is considered
+        """
+        def canonical(data):
+            return dict(data, DeletionDate=bool(data.get('DeletionDate')))
+        formats = [canonical(product_format) for product_format in payload.get('AdditionalSaleFormats') or []]
+        return cls.get_record_hash(dict(canonical(payload), AdditionalSaleFormats=formats))
+
+    @staticmethod
+    def _get_changed_values(record, values):
+        """"
+        Function to compare the values of an Agora record with the ones of the Odoo record
+        The empty values (None, '', 0, False) are considered the same
+        Params:
+            record: Odoo record (singleton)
+            values: Dict {field: value from Agora}, the many2one values as ids
+        Return: Dict with only the changed values
+        """
+        changed = {}
+        for field, value in values.items():
+            current = record[field]
+            if record._fields[field].type == 'many2one':
+                current = current.id
+            if (current or False) != (value or False):
+                changed[field] = value
+        return changed
+
+    def _get_records_by_agora_id(self, model):
+        """"
+        Function to load at once the records of a master of the company
+        Params:
+            model: Model name with agora_id field. Ex. 'product.category'
+        Return: Dict {agora_id: recordset}
+        """
+        records = defaultdict(lambda: self.env[model])
+        for record in self.env[model].search([('company_id', '=', self.company_id.id), ('agora_id', '!=', False)]):
+            records[record.agora_id] |= record
+        return records
+
+    def _load_product_index(self):
+        """"
+        Function to load in memory the Agora identifiers of all the products of the company
+        Return: ProductIndex, with one query
+        """
+        rows = self.env['product.template'].with_context(active_test=False).search_read(
+            [('company_id', '=', self.company_id.id)], product_index.INDEX_FIELDS, order='id')
+        return product_index.ProductIndex(rows)
+
+    def _get_master_resolver(self, refresh=False):
+        """"
+        Function to get the lookups of the small masters of the connection, loaded once by run
+        Params:
+            refresh: Reload the masters, used at the beginning of each run
+        Return: MasterResolver
+        """
+        self.ensure_one()
+        key = (self.env.cr.dbname, self.id)
+        resolver = not refresh and master_resolver.get_resolver(key)
+        if not resolver:
+            resolver = master_resolver.set_resolver(key, master_resolver.MasterResolver(self._load_master_lookups()))
+        return resolver
+
+    def _load_master_lookups(self):
+        """"
+        Return: Dict {master: {agora_id: value}} with one query by master. The first record found wins
+        """
+        domain = [('company_id', '=', self.company_id.id), ('agora_id', '!=', False)]
+        lookups = {}
+        for master, model in (('category', 'product.category'), ('preparation_type', 'preparation.type'),
+                              ('preparation_order', 'preparation.order'), ('work_place', 'work.place'),
+                              ('sale_center', 'sale.center')):
+            lookups[master] = {}
+            for row in self.env[model].search_read(domain, ['agora_id']):
+                lookups[master].setdefault(row['agora_id'], row['id'])
+        # All the Odoo taxes related with each Agora tax
+        lookups['taxes'] = defaultdict(list)
+        for row in self.env['agora.tax'].search_read(domain, ['agora_id', 'account_tax_id']):
+            if row['account_tax_id']:
+                lookups['taxes'][row['agora_id']].append(row['account_tax_id'][0])
+        lookups['taxes'] = dict(lookups['taxes'])
+        return lookups
+
+    @staticmethod
+    def _add_to_product_index(index, products):
+        for row in products.with_context(active_test=False).read(product_index.INDEX_FIELDS):
+            index.add(row)
+
+    def link_missing_addins(self, records):
+        """"
+        Function to link the addins of the Agora Products that still dont have addins in Odoo
+        Used after a chunked import, when all the products already exist
+        Params:
+            records: Iterable of Agora Products
+        """
+        self.env['product.template'].flush(['product_addins_ids'])
+        self.env.cr.execute("""
+            SELECT DISTINCT rel.product_id
+              FROM product_template_add_addings_rel rel
+              JOIN product_template pt ON pt.id = rel.product_id
+             WHERE pt.company_id = %s""", (self.company_id.id,))
+        linked_ids = {row[0] for row in self.env.cr.fetchall()}
+        addings = []
+        for record in records:
+            addings.append({'is_format': False, 'prod': record.get('BaseSaleFormatId'), 'addins': record.get('Addins')})
+            for format in record.get('AdditionalSaleFormats') or []:
+                addings.append({'is_format': True, 'prod': format.get('Id'), 'addins': format.get('Addins')})
+        self.create_addings(addings, skip_product_ids=linked_ids)
 
-    def create_addings(self, addings):
+    def create_addings(self, addings, index=None, skip_product_ids=()):
         """"
         Function to create the relation of the product with the correspondent addins
+        The products and addins are resolved with the index and the relation table is written in bulk,
+        so the number of queries doesnt depend on the catalogue size
+        Params:
+            addings: List of dicts {'is_format', 'prod', 'addins'} generated by _bulk_create_products
+            index: ProductIndex of the company, loaded if not provided
+            skip_product_ids: Products to be ignored
         """
-        self_prod_creation = self.with_context({'first_charge': True})
-        product_env = self_prod_creation.env['product.template']
+        if index is None:
+            index = self._load_product_index()
+        relations = {}
         for record in addings:
             if record.get('addins'):
+                product_ref = index.get_format(record.get('prod'), is_format=bool(record.get('is_format')))
+                if product_ref and product_ref.id in skip_product_ids:
+                    continue
                 add = []
-                if record.get('is_format'):
-                    product = product_env.search([('sale_format', '=', record.get('prod')),
-                                                  ('company_id', '=', self.company_id.id)])
-                else:
-                    product = product_env.search([('base_format_id', '=', record.get('prod')),
-                                                  ('company_id', '=', self.company_id.id)])
                 for addin in record.get('addins'):
-                    prod_addins = product_env.search(['|', ('sale_format', '=', addin.get('AddinSaleFormatId')),
-                                                      ('base_format_id', '=',  addin.get('AddinSaleFormatId')),
-                                                      ('company_id', '=', self.company_id.id)], limit=1)
-                    add.append(prod_addins.id)
-                if product and prod_addins:
-                    product.product_addins_ids = [(6, 0, add)]
-
-    def create_product(self, record, values_dict, is_format):
+                    addin_ref = index.get_format(addin.get('AddinSaleFormatId'))
+                    if addin_ref and addin_ref.id not in add:
+                        add.append(addin_ref.id)
+                if product_ref and add:
+                    relations[product_ref.id] = add
+        if relations:
+            self._write_addins_relation(relations)
+
+    def _write_addins_relation(self, relations):
         """"
-        Function to create a product from a provided json record
+        Function to replace the addins of several products at once, same as [(6, 0, ids)] for each product
+        Params:
+            relations: Dict {product.template id: [addin product.template ids]}
         """
         self_prod_creation = self.with_context({'first_charge': True})
-        products_env = self_prod_creation.env['product.template']
-        category_id = self.env['product.category'].search([('agora_id', '=', record.get('FamilyId')),
-                                                           ('company_id', '=', self.company_id.id)], limit=1).id
+        products = self_prod_creation.env['product.template'].browse(list(relations))
+        products.flush(['product_addins_ids'])
+        self.env.cr.execute("DELETE FROM product_template_add_addings_rel WHERE product_id IN %s",
+                            (tuple(products.ids),))
+        rows = [(product_id, addin_id) for product_id, addin_ids in relations.items() for addin_id in addin_ids]
+        for chunk in split_every(1000, rows):
+            self.env.cr.execute(
+                "INSERT INTO product_template_add_addings_rel (product_id, addins_id) VALUES {}".format(
+                    ', '.join(['(%s, %s)'] * len(chunk))),
+                [value for row in chunk for value in row])
+        products.invalidate_cache(['product_addins_ids'])
+        # Same as the write() of the products when the addins are set
+        products.write({'ask_for_addings': True})
+
+    def _prepare_product_values(self, record, values_dict):
+        """"
+        Function to get the values to create a product from a provided json record
+        Params:
+            record: Agora Product or Sale Format
+            values_dict: Values already known, they have priority. If 'sale_format' is in the dict,
+                         the record is created as a format
+        Return: values_dict completed
+        """
+        values_dict.setdefault('agora_hash', self.get_record_hash(record))
+        resolver = self._get_master_resolver()
+        category_id = resolver.get('category', record.get('FamilyId'))
         if values_dict.get('categ_id'):
             category_id = values_dict.get('categ_id')
 
-        taxes_id = self.env['agora.tax'].search([('agora_id', '=', record.get('VatId')),
-                                                 ('company_id', '=', self.company_id.id)], limit=1).account_tax_id.ids
+        taxes_id = resolver.get('taxes', record.get('VatId'), [])[:1]
         if values_dict.get('taxes_id'):
             taxes_id = values_dict.get('taxes_id')
-        prep_type_id = self.env['preparation.type'].search([('agora_id', '=', record.get('PreparationTypeId')),
-                                                            ('company_id', '=', self.company_id.id)], limit=1)
-        prep_order_id = self.env['preparation.order'].search([('agora_id', '=', record.get('PreparationOrderId')),
-                                                              ('company_id', '=', self.company_id.id)], limit=1)
+        prep_type_id = resolver.get('preparation_type', record.get('PreparationTypeId'))
+        prep_order_id = resolver.get('preparation_order', record.get('PreparationOrderId'))
         values_dict.update({
             'name': record.get('Name'),
             'agora_id':  record.get('Id') if not ('sale_format' in values_dict) else '',
@@ -295,9 +872,9 @@ class APIConnection(models.Model):
             'ratio': record.get('Ratio'),
             'button_text': record.get('ButtonText'),
             'detailed_type': values_dict.get('detailed_type') if 'detailed_type' in values_dict else 'product',
-            'preparation_id': values_dict.get('preparation_id') if 'preparation_id' in values_dict else prep_type_id.id,
+            'preparation_id': values_dict.get('preparation_id') if 'preparation_id' in values_dict else prep_type_id,
             'preparation_order_id': values_dict.get('preparation_order_id')
-                                    if 'preparation_order_id' in values_dict else prep_order_id.id,
+                                    if 'preparation_order_id' in values_dict else prep_order_id,
             'taxes_id': [(6, 0, taxes_id)],
             'is_saleable_as_main': record.get('SaleableAsMain'),
             'is_saleable_as_adding': record.get('SaleableAsAddin'),
@@ -310,206 +887,307 @@ class APIConnection(models.Model):
         })
         if category_id:
             values_dict.update({'categ_id': category_id})
-        product = products_env.create(values_dict)
-        _logger.info("Product created ==> {}".format(product.name))
-        prices = record.get('Prices')
-        addings = {'is_format': is_format, 'prod': product.base_format_id, 'addins': record.get('Addins')}
-        if product.parent_id:
-            addings = {'is_format': is_format, 'prod': product.sale_format, 'addins': record.get('Addins')}
-        self.generate_product_prices(product, prices)
-        return {'product': product, 'addings': addings}
-
-    def generate_sale_formats(self, product, record):
-        mrp_bom_env = self.env['mrp.bom']
-        mrp_bom_line_env = self.env['mrp.bom.line']
+        return values_dict
+
+    @staticmethod
+    def _get_format_values(product, format):
+        """"
+        Return: Values inherited from the main product to create one of its Sale Formats
+        """
+        values = {
+            'parent_id': product.id,
+            'detailed_type': 'consu',
+            'sale_format': True,
+            'purchase_ok': False,
+            'preparation_id': product.preparation_id.id,
+            'categ_id': product.categ_id.id,
+            'taxes_id': product.taxes_id.ids,
+            'preparation_order_id': product.preparation_order_id.id
+        }
+        if format.get('DeletionDate') or not product.active:
+            values.update({'active': False})
+        return values
+
+    def _bulk_create_products(self, records, index):
+        """"
+        Function to create a chunk of new Agora Products with their formats, materials lists and prices
+        Each model is created with only one create() call for the whole chunk
+        Params:
+            records: List of Agora Products not existing in Odoo
+            index: ProductIndex of the company, the new products are added to it
+        Return: List of addings to be linked by create_addings
+        """
+        self_prod_creation = self.with_context({'first_charge': True})
+        products_env = self_prod_creation.env['product.template']
+        products = products_env.create([self._prepare_product_values(record, {'active': not record.get('DeletionDate')})
+                                        for record in records])
         addings = []
-        for format in record.get('AdditionalSaleFormats'):
-            values = {
-                'parent_id': product.id,
-                'detailed_type': 'consu',
-                'sale_format': True,
-                'purchase_ok': False,
-                'preparation_id': product.preparation_id.id,
-                'categ_id': product.categ_id.id,
-                'taxes_id': product.taxes_id.ids,
-                'preparation_order_id': product.preparation_order_id.id
-            }
-            if format.get('DeletionDate'):
-                values.update({'active': False})
-            product_create = self.create_product(format, values, True)
-            sub_product = product_create.get('product')
-            material_list = mrp_bom_env.create({
-                'product_tmpl_id': sub_product.id,
-                'type': 'phantom',
-                'company_id': self.company_id.id
-            })
-            product_product = self.env['product.product'].search(
-                [('product_tmpl_id', '=', sub_product.parent_id.id)], limit=1)
-            mrp_bom_line_env.create({
-                'bom_id': material_list.id,
-                'product_id': product_product.id,
-                'product_qty': format.get('Ratio'),
-                'company_id': self.company_id.id
-            })
-            addings.append(product_create.get('addings'))
-            _logger.info("Format ==> {} ---- Parent : {}".format(sub_product.name, product.name))
+        products_prices = []
+        format_values = []
+        format_records = []
+        for product, record in zip(products, records):
+            addings.append({'is_format': False, 'prod': product.base_format_id, 'addins': record.get('Addins')})
+            products_prices.append((product, record.get('Prices')))
+            for format in record.get('AdditionalSaleFormats') or []:
+                format_values.append(self._prepare_product_values(format, self._get_format_values(product, format)))
+                format_records.append(format)
+        formats = products_env.create(format_values)
+        for format, record in zip(formats, format_records):
+            addings.append({'is_format': True, 'prod': format.sale_format, 'addins': record.get('Addins')})
+            products_prices.append((format, record.get('Prices')))
+        # Each format is a kit of its main product
+        variants = self.env['product.product'].with_context(active_test=False).search(
+            [('product_tmpl_id', 'in', products.ids)], order='id')
+        variant_by_template = {}
+        for variant in variants:
+            variant_by_template.setdefault(variant.product_tmpl_id.id, variant.id)
+        material_lists = self.env['mrp.bom'].create([{
+            'product_tmpl_id': format.id,
+            'type': 'phantom',
+            'company_id': self.company_id.id
+        } for format in formats])
+        self.env['mrp.bom.line'].create([{
+            'bom_id': material_list.id,
+            'product_id': variant_by_template.get(format.parent_id.id),
+            'product_qty': record.get('Ratio'),
+            'company_id': self.company_id.id
+        } for material_list, format, record in zip(material_lists, formats, format_records)])
+        self.sync_product_prices(products_prices)
+        self._add_to_product_index(index, products | formats)
+        _logger.info("Products created ==> {} products and {} formats".format(len(products), len(formats)))
         return addings
 
-    def generate_product_prices(self, product, prices):
+    def sync_product_prices(self, products_prices):
         """"
-        Function to generate or update the product prices
+        Function to generate or update the prices of several products at once
+        The Agora pricelists and the open items of the products are loaded with one query each,
+        then the new items are created with one create() and the changed ones are written grouped by values
         Params:
-            product: Product to be updated
-            Prices: Dict of prices related with the current product
+            products_prices: List of (product, Agora Prices)
         """
         self_price_creation = self.with_context({'first_charge': True})
         pricelist_item_env = self_price_creation.env['product.pricelist.item']
-        price_list_env = self.env['product.pricelist']
-        if prices:
+        products_prices = [(product, prices) for product, prices in products_prices if product and prices]
+        if not products_prices:
+            return
+        agora_ids = list({price.get('PriceListId') for product, prices in products_prices for price in prices})
+        pricelists = self.env['product.pricelist'].search([('agora_id', 'in', agora_ids),
+                                                           ('company_id', '=', self.company_id.id)])
+        pricelist_by_agora_id = {}
+        for pricelist in pricelists:
+            pricelist_by_agora_id.setdefault(pricelist.agora_id, pricelist.id)
+        product_ids = list({product.id for product, prices in products_prices})
+        open_items = pricelist_item_env.search([('product_tmpl_id', 'in', product_ids),
+                                                ('date_end', '=', False),
+                                                ('pricelist_id.agora_id', 'in', agora_ids)])
+        existing = {}
+        for item in open_items:
+            existing.setdefault((item.product_tmpl_id.id, item.pricelist_id.agora_id), item)
+        digits = self.env['decimal.precision'].precision_get('Product Price')
+        to_create = {}
+        to_write = defaultdict(lambda: pricelist_item_env)
+        for product, prices in products_prices:
             for price in prices:
-                price_list = price_list_env.search([('agora_id', '=', price.get('PriceListId')),
-                                                    ('company_id', '=', self.company_id.id)])
-                if product:
-                    exist = pricelist_item_env.search([('product_tmpl_id', '=', product.id),
-                                                       ('date_end', '=', False),
-                                                       ('pricelist_id.agora_id', '=', price.get('PriceListId'))],
-                                                      limit=1)
-                    if not exist:
-                        # create new pricelist
-                        data = {
-                            'pricelist_id': price_list.id,
-                            'product_tmpl_id': product.id,
-                            'fixed_price': price.get('MainPrice'),
-                            'addin_price': price.get('AddinPrice'),
-                            'menuitem_price': price.get('MenuItemPrice'),
-                        }
-                        pricelist_item_env.create(data)
-                    else:
-                        # create values in the existing pricelist
-                        upt_data = {
-                            'fixed_price': price.get('MainPrice'),
-                            'addin_price': price.get('AddinPrice'),
-                            'menuitem_price': price.get('MenuItemPrice'),
-                        }
-                        exist.update(upt_data)
+                key = (product.id, price.get('PriceListId'))
+                values = {
+                    'fixed_price': price.get('MainPrice'),
+                    'addin_price': price.get('AddinPrice'),
+                    'menuitem_price': price.get('MenuItemPrice'),
+                }
+                item = existing.get(key)
+                if item:
+                    # update values in the existing pricelist item, only if changed
+                    if any(float_compare(item[field] or 0.0, value or 0.0, precision_digits=digits)
+                           for field, value in values.items()):
+                        to_write[tuple(sorted(values.items()))] |= item
+                elif key in to_create:
+                    # Same pricelist twice, the last one wins
+                    to_create[key].update(values)
+                elif key[1] in pricelist_by_agora_id:
+                    # create new pricelist item
+                    values.update({'pricelist_id': pricelist_by_agora_id[key[1]], 'product_tmpl_id': product.id})
+                    to_create[key] = values
+                else:
+                    _logger.warning("Agora PriceList %s not found, price of %s skipped", key[1], product.name)
+        if to_create:
+            pricelist_item_env.create(list(to_create.values()))
+        for values, items in to_write.items():
+            items.write(dict(values))
 
     def get_master_categories(self):
         """"
         Function to get Categories from Agora
         Generate a Product.category record for each Agora Family that not exist in Odoo
         """
-        endpoint = '/export-master'
+        self.import_master_categories(self.get_master_records('Families'))
+
+    def import_master_categories(self, records):
+        """"
+        Function to import the Agora Families
+        Only the families with a different hash of the last import are processed
+        Params:
+            records: Iterable of Agora Families
+        """
         prod_cat_env = self.env['product.category']
-        params = {
-            'filter': 'Families'
-        }
-        categories = self.get_request(self.url_server, endpoint, self.server_api_key, params)
-        if categories and categories.json().get('Families'):
-            json_categories = categories.json().get('Families')
-            for record in json_categories:
-                existing_cat = prod_cat_env.search([('agora_id', '=', record.get('Id')),
-                                                    ('company_id', '=', self.company_id.id)])
-                values_dict = self.get_categories_dict()
-                if record.get('DeletionDate') and existing_cat:
-                    existing_cat.unlink()
-                    continue
-                if not existing_cat and not record.get('DeletionDate'):
-                    values_dict.update({
-                        'name': record.get('Name'),
-                        'complete_name': record.get('Name'),
-                        'agora_id': record.get('Id'),
-                        'color': record.get('Color')
-                    })
-                    prod_cat_env.create(values_dict)
+        categories = self._get_records_by_agora_id('product.category')
+        for record in records:
+            record_hash = self.get_record_hash(record)
+            existing_cat = categories[record.get('Id')]
+            if existing_cat and all(cat.agora_hash == record_hash for cat in existing_cat):
+                continue
+            values_dict = self.get_categories_dict()
+            if record.get('DeletionDate') and existing_cat:
+                existing_cat.unlink()
+                continue
+            if not existing_cat and not record.get('DeletionDate'):
+                values_dict.update({
+                    'name': record.get('Name'),
+                    'complete_name': record.get('Name'),
+                    'agora_id': record.get('Id'),
+                    'color': record.get('Color'),
+                    'agora_hash': record_hash
+                })
+                categories[record.get('Id')] = prod_cat_env.create(values_dict)
+            elif existing_cat:
+                for cat in existing_cat:
+                    values = self._get_changed_values(cat, {'name': record.get('Name'), 'color': record.get('Color')})
+                    cat.write(dict(values, agora_hash=record_hash))
 
     def get_master_sale_center(self):
         """"
         Function to get de Sales centers
         This function needs the previous creation of the Default Price List
         """
-        endpoint = '/export-master'
+        self.import_master_sale_center(self.get_master_records('SaleCenters'))
+
+    def import_master_sale_center(self, records):
+        """"
+        Function to import the Agora Sale Centers and their Locations
+        Only the sale centers with a different hash of the last import are processed.
+        The existing centers, pricelists and locations are loaded at once, the missing centers and locations
+        are created with one create() each and the existing centers are written only with the changed fields
+        Params:
+            records: Iterable of Agora Sale Centers
+        """
         sale_center_env = self.env['sale.center']
-        pricelist_env = self.env['product.pricelist']
         location_env = self.env['sale.location']
-        params = {
-            'filter': 'SaleCenters'
-        }
-        centers = self.get_request(self.url_server, endpoint, self.server_api_key, params)
-        if centers and centers.json().get('SaleCenters'):
-            json_centers = centers.json().get('SaleCenters')
-            for record in json_centers:
-                existing_cent = sale_center_env.search([('agora_id', '=', record.get('Id')),
-                                                        ('company_id', '=', self.company_id.id)])
-                if not existing_cent:
-                    values_dict = self.get_sale_center_dict()
-                    pric_list = pricelist_env.search([('agora_id', '=', int(record.get('PriceListId'))),
-                                                      ('company_id', '=', self.company_id.id)], limit=1)
-                    values_dict.update({
-                        'name': record.get('Name'),
-                        'button_text': record.get('ButtonText'),
-                        'agora_id': int(record.get('Id')),
-                        'pricelist_id': pric_list.id,
-                        'color': record.get('Color')
+        sale_centers = self._get_records_by_agora_id('sale.center')
+        pricelists = self._get_records_by_agora_id('product.pricelist')
+        changed = {}
+        for record in records:
+            record_hash = self.get_record_hash(record)
+            existing_cent = sale_centers[int(record.get('Id'))]
+            if existing_cent and all(center.agora_hash == record_hash for center in existing_cent):
+                # Same sale center and locations of the last import
+                continue
+            values_dict = self.get_sale_center_dict()
+            values_dict.update({
+                'name': record.get('Name'),
+                'button_text': record.get('ButtonText'),
+                'agora_id': int(record.get('Id')),
+                'pricelist_id': pricelists[int(record.get('PriceListId'))][:1].id,
+                'color': record.get('Color'),
+                'agora_hash': record_hash
+            })
+            # If Agora send the same center twice the last one wins
+            changed[int(record.get('Id'))] = (values_dict, record.get('SaleLocations') or [])
+        if not changed:
+            return
+        new_ids = [agora_id for agora_id in changed if not sale_centers[agora_id]]
+        new_centers = sale_center_env.create([changed[agora_id][0] for agora_id in new_ids])
+        for agora_id, center in zip(new_ids, new_centers):
+            sale_centers[agora_id] = center
+        to_write = defaultdict(lambda: sale_center_env)
+        for agora_id, (values_dict, locations) in changed.items():
+            if agora_id in new_ids:
+                continue
+            for center in sale_centers[agora_id]:
+                # Odoo returns False for the empty fields, Agora None or ''
+                changed_values = self._get_changed_values(center, values_dict)
+                if changed_values:
+                    to_write[tuple(sorted(changed_values.items()))] |= center
+        for values, centers in to_write.items():
+            centers.write(dict(values))
+        # Locations, identified by center and name
+        centers = sale_center_env.browse([sale_centers[agora_id][:1].id for agora_id in changed])
+        existing_locations = {(location.center_id.id, location.name)
+                              for location in location_env.search([('center_id', 'in', centers.ids),
+                                                                   ('company_id', '=', self.company_id.id)])}
+        new_locations = []
+        for agora_id, (values_dict, locations) in changed.items():
+            center_id = sale_centers[agora_id][:1].id
+            for location in locations:
+                key = (center_id, location.get('Name'))
+                if key not in existing_locations:
+                    existing_locations.add(key)
+                    new_locations.append({
+                        'name': location.get('Name'),
+                        'center_id': center_id,
+                        'company_id': self.company_id.id
                     })
-                    existing_cent = sale_center_env.create(values_dict)
-                for location in record.get('SaleLocations'):
-                    exist_loc = location_env.search([('name', '=', location.get('Name')),
-                                                     ('center_id', '=', existing_cent.id),
-                                                     ('company_id', '=', self.company_id.id)])
-                    if not exist_loc:
-                        location_env.create({
-                            'name': location.get('Name'),
-                            'center_id': existing_cent.id,
-                            'company_id': self.company_id.id
-                        })
+        location_env.create(new_locations)
 
     def get_master_pricelist(self):
         """"
         Function to get de PriceList
         """
+        self.import_master_pricelist(self.get_master_records('PriceLists'))
+
+    def import_master_pricelist(self, records):
+        """"
+        Function to import the Agora PriceLists
+        Params:
+            records: Iterable of Agora PriceLists
+        """
         pricelist_env = self.env['product.pricelist']
-        endpoint = '/export-master'
-        params = {
-            'filter': 'PriceLists'
-        }
-        prices = self.get_request(self.url_server, endpoint, self.server_api_key, params)
-        if prices and prices.json().get('PriceLists'):
-            json_centers = prices.json().get('PriceLists')
-            for record in json_centers:
-                existing_cent = pricelist_env.search([('agora_id', '=', int(record.get('Id'))),
-                                                      ('company_id', '=', self.company_id.id)])
-                if not existing_cent:
-                    values_dict = {}
-                    values_dict.update({
-                        'name': record.get('Name'),
-                        'agora_id': int(record.get('Id')),
-                        'company_id': self.company_id.id
-                    })
-                    pricelist_env.create(values_dict)
+        existing_records = self._get_records_by_agora_id('product.pricelist')
+        for record in records:
+            record_hash = self.get_record_hash(record)
+            existing_cent = existing_records[int(record.get('Id'))]
+            if existing_cent:
+                for pricelist in existing_cent.filtered(lambda r: r.agora_hash != record_hash):
+                    values = self._get_changed_values(pricelist, {'name': record.get('Name')})
+                    pricelist.write(dict(values, agora_hash=record_hash))
+            else:
+                values_dict = {}
+                values_dict.update({
+                    'name': record.get('Name'),
+                    'agora_id': int(record.get('Id')),
+                    'company_id': self.company_id.id,
+                    'agora_hash': record_hash
+                })
+                existing_records[int(record.get('Id'))] = pricelist_env.create(values_dict)
 
     def get_master_work_places(self):
         """"
         Function to get Work Places
         """
-        endpoint = '/export-master'
+        self.import_master_work_places(self.get_master_records('WorkplacesSummary'))
+
+    def import_master_work_places(self, records):
+        """"
+        Function to import the Agora Work Places
+        Params:
+            records: Iterable of Agora Work Places
+        """
         work_place_env = self.env['work.place']
-        params = {
-            'filter': 'WorkplacesSummary'
-        }
-        prices = self.get_request(self.url_server, endpoint, self.server_api_key, params)
-        if prices and prices.json().get('WorkplacesSummary'):
-            json_centers = prices.json().get('WorkplacesSummary')
-            for record in json_centers:
-                existing_cent = work_place_env.search([('agora_id', '=', int(record.get('Id'))),
-                                                      ('company_id', '=', self.company_id.id)])
-                if not existing_cent:
-                    values_dict = {}
-                    values_dict.update({
-                        'name': record.get('Name'),
-                        'agora_id': int(record.get('Id')),
-                        'company_id': self.company_id.id
-                    })
-                    work_place_env.create(values_dict)
+        existing_records = self._get_records_by_agora_id('work.place')
+        for record in records:
+            record_hash = self.get_record_hash(record)
+            existing_cent = existing_records[int(record.get('Id'))]
+            if existing_cent:
+                for work_place in existing_cent.filtered(lambda r: r.agora_hash != record_hash):
+                    values = self._get_changed_values(work_place, {'name': record.get('Name')})
+                    work_place.write(dict(values, agora_hash=record_hash))
+            else:
+                values_dict = {}
+                values_dict.update({
+                    'name': record.get('Name'),
+                    'agora_id': int(record.get('Id')),
+                    'company_id': self.company_id.id,
+                    'agora_hash': record_hash
+                })
+                existing_records[int(record.get('Id'))] = work_place_env.create(values_dict)
 
     def get_product_dict(self):
         """"
@@ -572,43 +1250,124 @@ class APIConnection(models.Model):
 
     def _get_last_ids(self):
         """"
-        Function to update the last Format_id and Product_id at the api_connection
-        This IDs will be used to assign new agora_id when a product or format is created
+        Function to get the last Format_id and Product_id used in Agora
+        Return: Dict {'last_product_id': int, 'last_format_id': int}, empty if the query is not configured
         """
-        conections = self.search([('state', '=', 'connect')])
-        for connec in conections:
-            report_config = self.env['agora.reports.config'].search([('company_id', '=', connec.company_id.id),
-                                                                     ('report_type', '=', 'last_ids')], limit=1)
-            if report_config:
-                params = {
-                    'QueryGuid': '{%s}' % report_config.guid,
-                    'Params': {}
-                    }
-                agora_ids, message = self.post_request(connec.url_server, '/custom-query', connec.server_api_key, params)
-                if agora_ids:
-                    ids = agora_ids.json()[0]
-                    connec.update({'last_format_id': ids.get('last_format_id'),
-                                   'last_product_id': ids.get('last_product_id')})
+        self.ensure_one()
+        report_config = self.env['agora.reports.config'].search([('company_id', '=', self.company_id.id),
+                                                                 ('report_type', '=', 'last_ids')], limit=1)
+        if report_config:
+            params = {
+                'QueryGuid': '{%s}' % report_config.guid,
+                'Params': {}
+                }
+            agora_ids, message = self.post_request(self.url_server, '/custom-query', self.server_api_key, params)
+            if agora_ids:
+                return agora_ids.json()[0]
+        return {}
 
-    def get_additional_formats(self, parent_product, connection):
+    def _next_agora_id(self, kind):
+        """"
+        Function to get a new Agora ID for a product or format created in Odoo
+        The IDs are taken from a block reserved by _reserve_agora_ids
+        Params:
+            kind: 'product' or 'format'
+        Return: Integer
+        """
+        self.ensure_one()
+        return id_allocator.next_id((self.env.cr.dbname, self.id), kind, self._reserve_agora_ids)
+
+    def _reserve_agora_ids(self, kind, unused=None):
+        """"
+        Function to reserve a block of 'id_block_size' Agora IDs after the last ID used in Agora and in Odoo
+        The connection row is locked and updated in its own cursor, so the concurrent pushes wait
+        for the reservation and the reserved IDs are kept even if the push is rolled back.
+        The lock is waited ID_LOCK_TIMEOUT seconds at most, so a transaction holding the row
+        can't block the reservation forever
+        Params:
+            kind: 'product' or 'format'
+            unused: (first, last) IDs not used of the expired block, or None
+        Return: (first, last) IDs of the block
+        """
+        column = 'last_%s_id' % kind
+        agora_last = self._get_last_ids().get(column) or 0
+        try:
+            with self.pool.cursor() as cr:
+                cr.execute("SET LOCAL lock_timeout = %s", (ID_LOCK_TIMEOUT * 1000,))
+                cr.execute("SELECT {}, id_block_size FROM api_connection WHERE id = %s FOR NO KEY UPDATE"
+                           .format(column), (self.id,))
+                odoo_last, block_size = cr.fetchone()
+                odoo_last = odoo_last or 0
+                if unused and unused[1] == odoo_last:
+                    # No block was reserved after the expired one, its IDs are used again
+                    odoo_last = unused[0] - 1
+                first = max(odoo_last, agora_last) + 1
+                last = first + max(block_size or 0, 1) - 1
+                cr.execute("UPDATE api_connection SET {} = %s WHERE id = %s".format(column), (last, self.id))
+        except OperationalError as e:
+            if e.pgcode != errorcodes.LOCK_NOT_AVAILABLE:
+                raise
+            _logger.warning("Agora %s IDs not reserved for %s, the connection is locked", kind, self.name)
+            raise UserError(_('The Agora IDs are being reserved by other process, please try again later'))
+        self.invalidate_cache([column], self.ids)
+        _logger.info("Agora %s IDs %s-%s reserved for %s", kind, first, last, self.name)
+        return first, last
+
+    def _prefetch_products_data(self, products, connection):
+        """"
+        Function to read at once the related data needed to send the products to Agora
+        The taxes, formats, prices and addins of all the products are read with a few queries,
+        so the data of each product is built in memory
+        Params:
+            products: Main products (product.template) to be sent with the connection
+            connection: Api connection to be used, should be taked considering the product company_id
+        Return:
+            Dict with the related data by product id, to be used in product_data.
+            product_data adds 'format_by_id', the formats by the Agora Id placed in the data
+        """
+        company_id = connection.company_id.id
+        formats = self.env['product.template'].search([('parent_id', 'in', products.ids),
+                                                       ('company_id', '=', company_id),
+                                                       ('active', 'in', [True, False])])
+        formats_by_parent = defaultdict(list)
+        for product in formats:
+            formats_by_parent[product.parent_id.id].append(product)
+        templates = products | formats
+        taxes = {}
+        for tax in self.env['agora.tax'].search([('account_tax_id', 'in', products.taxes_id.ids),
+                                                 ('company_id', '=', company_id)]):
+            taxes.setdefault(tax.account_tax_id.id, tax.agora_id)
+        prices = defaultdict(list)
+        for price in self.env['product.pricelist.item'].search([('product_tmpl_id', 'in', templates.ids),
+                                                                ('date_end', '=', False)]):
+            prices[price.product_tmpl_id.id].append({
+                "PriceListId": price.pricelist_id.agora_id,
+                "MainPrice": price.fixed_price,
+                "AddinPrice": price.addin_price,
+                "MenuItemPrice": price.menuitem_price
+            })
+        addin_formats = {add.id: add.sale_format if add.parent_id else add.base_format_id
+                         for add in templates.product_addins_ids}
+        addins = {product.id: [{"SaleFormatId": addin_formats[add.id]} for add in product.product_addins_ids]
+                  for product in templates}
+        return {'formats': formats_by_parent, 'taxes': taxes, 'prices': prices, 'addins': addins}
+
+    def get_additional_formats(self, parent_product, connection, prefetched):
         """"
         Function to get the correspondent formats to the provided product
         Params:
             parent_product: Product Main in Odoo, this product could have formats(children products)
             connection: Api connection to be used, should be taked considering the product company_id
+            prefetched: Related data of the products, returned by _prefetch_products_data
         Return:
             List of dictionaries, considering the rigth estructure to be send it to Agora
         """
         formats = []
-        all_formats = self.env['product.template'].search([('parent_id', '=', parent_product.id),
-                                                           ('company_id', '=', parent_product.company_id.id),
-                                                           ('active', 'in', [True, False])])
-        for product in all_formats:
+        for product in prefetched['formats'].get(parent_product.id, []):
             format_id = product.sale_format
             if product.sale_format == 0:
-                format_id = connection.last_format_id + 1
-                connection.last_format_id = format_id
-            prices = self.get_post_prices(product)
+                format_id = connection._next_agora_id('format')
+            prefetched.setdefault('format_by_id', {})[format_id] = product
             product_data = {
                 "Id": format_id,
                 "Name": product.name,
@@ -619,53 +1378,28 @@ class APIConnection(models.Model):
                 "SaleableAsAddin": product.is_saleable_as_adding,
                 "AskForAddins": product.ask_for_addings,
                 "DeletionDate": None if product.active else product.write_date.isoformat(),
-                "Prices": prices
+                "Prices": prefetched['prices'].get(product.id, [])
             }
             formats.append(product_data)
-            if product.product_addins_ids:
-                addins = []
-                for add in product.product_addins_ids:
-                    base_format = add.sale_format if add.parent_id else add.base_format_id
-                    addins.append({"SaleFormatId": base_format})
+            if prefetched['addins'].get(product.id):
                 product_data.update({'MinAddins': product.min_addings,
                                      'MaxAddins': product.max_addings,
-                                     'Addins': addins})
+                                     'Addins': prefetched['addins'][product.id]})
         return formats
 
-    @staticmethod
-    def get_post_prices(product):
-        """
-        Function to get the prices related with the provided product
-        Return:
-            Prices List considering only the active pricelist by date
-        """
-        prices = []
-        for price in product.product_pricelist_ids:
-            if not price.date_end:
-                price_rec = {
-                    "PriceListId": price.pricelist_id.agora_id,
-                    "MainPrice": price.fixed_price,
-                    "AddinPrice": price.addin_price,
-                    "MenuItemPrice": price.menuitem_price
-                }
-                prices.append(price_rec)
-        return prices
-
-    def product_data(self, product, is_new, connection):
+    def product_data(self, product, is_new, connection, prefetched):
         """
         Function to get the FULL data to create a product POST
+        Params:
+            prefetched: Related data of the products, returned by _prefetch_products_data
         Return:
             Dictionary with product data and Sale Formats associated
         """
-        tax = self.env['agora.tax'].search([('account_tax_id', '=', product.taxes_id[0].id),
-                                            ('company_id', '=', connection.company_id.id)])
         product_id = product.agora_id
         base_format_id = product.base_format_id
         if is_new:
-            product_id = connection.last_product_id + 1
-            connection.last_product_id = product_id
-            base_format_id = connection.last_format_id + 1
-            connection.last_format_id = base_format_id
+            product_id = connection._next_agora_id('product')
+            base_format_id = connection._next_agora_id('format')
         data = {
             "Products": [
                 {
@@ -676,7 +1410,7 @@ class APIConnection(models.Model):
                     "Color": product.color or "#BACDE2",
                     "PLU": product.product_sku if product.product_sku != 0 else "",
                     "FamilyId": product.categ_id.agora_id if product.categ_id.name != 'All' else None,
-                    "VatId": tax.agora_id,
+                    "VatId": prefetched['taxes'].get(product.taxes_id[0].id, False),
                     "UseAsDirectSale": False,
                     "SaleableAsMain": product.is_saleable_as_main,
                     "SaleableAsAddin": product.is_saleable_as_adding,
@@ -689,63 +1423,139 @@ class APIConnection(models.Model):
                     "CostPrice": product.standard_price,
                     "Barcodes": product.barcode,
                     "DeletionDate": None if product.active else product.write_date.isoformat(),
-                    "Prices": self.get_post_prices(product),
-                    "AdditionalSaleFormats": self.get_additional_formats(product, connection)
+                    "Prices": prefetched['prices'].get(product.id, []),
+                    "AdditionalSaleFormats": self.get_additional_formats(product, connection, prefetched)
                 }
             ]
         }
-        if product.product_addins_ids:
-            addins = []
-            for add in product.product_addins_ids:
-                base_format = add.sale_format if add.parent_id else add.base_format_id
-                addins.append({"SaleFormatId": base_format})
+        if prefetched['addins'].get(product.id):
             data['Products'][0].update({'MinAddins': product.min_addings,
                                         'MaxAddins': product.max_addings,
-                                        'Addins': addins})
+                                        'Addins': prefetched['addins'][product.id]})
         # # Discomment the following lines to get de json data
         # import json
         # json = json.dumps(data, indent=4)
         return data
 
-    def post_products(self, products):
+    def post_products(self, products, raise_errors=True, force=False):
         """"
         Function to send to Agora all products provided in the params
+        The products are sent in batches of 'post_batch_size' products by /import call.
+        If Agora reject a batch, its products are sent one by one to identify the wrong one
+        The products with the same data of the last push are taken as sent without sending them
+        Params:
+            raise_errors: If False, the products with errors are skipped and the others are sent
+            force: Send the products even if their data didn't change
+        Return: (products sent, dict {product id: error message} of the products not sent)
         """
-        product_env = self.env['product.template']
-        self._get_last_ids()
-        for product in products:
-            connection = self.get_related_connection(product)
-            if connection:
-                is_new = False
-                if product.sync_status == 'new':
-                    is_new = True
-                data = self.product_data(product, is_new, connection)
-                try:
-                    post, message = self.post_request(connection.url_server, '/import', connection.server_api_key, data)
+        posted = self.env['product.template']
+        errors = {}
+        unchanged = 0
+        for connection, connection_products in self._group_products_by_connection(products):
+            batch_size = max(connection.post_batch_size, 1)
+            for batch in split_every(batch_size, connection_products):
+                entries = []
+                prefetched = self._prefetch_products_data(self.env['product.template'].concat(*batch), connection)
+                for product in batch:
+                    is_new = product.sync_status == 'new'
+                    try:
+                        data = self.product_data(product, is_new, connection, prefetched)
+                    except Exception as e:
+                        if raise_errors:
+                            raise
+                        _logger.error("Agora data of product %s not generated: %s", product.name, e)
+                        errors[product.id] = str(e)
+                        continue
+                    payload = data.get('Products')[0]
+                    if not is_new and not force and product.agora_payload_hash == self.get_payload_hash(payload):
+                        # Nothing Agora uses changed since the last push
+                        posted |= product
+                        unchanged += 1
+                        continue
+                    entries.append((product, is_new, payload))
+                if len(entries) > 1:
+                    data = {'Products': [payload for product, is_new, payload in entries]}
+                    post, message = connection.post_request(connection.url_server, '/import', connection.server_api_key, data)
                     if post and post.status_code and post.status_code == 200:
-                        # If the execution went OK
-                        # Instantly should be updated the product status, because even if there is block in the function
-                        # because another error this changes are already updated in Agora
-                        # self.update_sync_status(product)
-                        product.sync_status = 'done'
-                        product.product_formats_ids.sync_status = 'done'
-                        # Execute commit() to be sure the product status its updated
+                        for product, is_new, payload in entries:
+                            self.update_posted_product(product, is_new, payload, prefetched)
+                            posted |= product
+                        # Execute commit() to be sure the products status its updated
                         # even if the script fail in other products sync
                         self._cr.commit()
-                        if is_new:
-                            agora_id = data.get('Products')[0].get('Id')
-                            base_format_id = data.get('Products')[0].get('BaseSaleFormatId')
-                            product.update({'agora_id': agora_id, 'base_format_id': base_format_id})
-                        for rec in data.get('Products')[0].get('AdditionalSaleFormats'):
-                            current_format = product_env.search([('name', '=', rec.get('Name')),
-                                                                 ('parent_id', '=', product.id)])
-                            if current_format.sale_format == 0:
-                                current_format.sale_format = rec.get('Id')
-                    else:
-                        raise ValidationError(_(" Agora system detected the following exception:\n%s") % message.decode())
-                except Exception as e:
-                    _logger.error(e)
-                    raise ValidationError(_("ERROR RESPONSE:\n %s") % e)
+                        continue
+                    _logger.warning("Agora rejected a batch of %s products, sending them one by one: %s",
+                                    len(entries), message)
+                for product, is_new, payload in entries:
+                    try:
+                        self.post_product(connection, product, is_new, payload, prefetched)
+                        posted |= product
+                    except Exception as e:
+                        if raise_errors:
+                            raise
+                        errors[product.id] = str(e)
+        if unchanged:
+            _logger.info("%s products not sent to Agora, their data didn't change", unchanged)
+        return posted, errors
+
+    def _group_products_by_connection(self, products):
+        """"
+        Return: List of (connection, products) keeping the products order. Products without connection are skipped
+        """
+        connections = {}
+        groups = {}
+        for product in products:
+            if product.company_id not in connections:
+                connections[product.company_id] = self.get_related_connection(product)
+            connection = connections[product.company_id]
+            if connection:
+                groups.setdefault(connection, []).append(product)
+        return list(groups.items())
+
+    def post_product(self, connection, product, is_new, payload, prefetched):
+        """"
+        Function to send only one product to Agora
+        Params:
+            payload: Product data already prepared by product_data
+            prefetched: Related data used to prepare the payload, see _prefetch_products_data
+        """
+        data = {'Products': [payload]}
+        try:
+            post, message = connection.post_request(connection.url_server, '/import', connection.server_api_key, data)
+            if post and post.status_code and post.status_code == 200:
+                # If the execution went OK
+                # Instantly should be updated the product status, because even if there is block in the function
+                # because another error this changes are already updated in Agora
+                self.update_posted_product(product, is_new, payload, prefetched)
+                # Execute commit() to be sure the product status its updated
+                # even if the script fail in other products sync
+                self._cr.commit()
+            else:
+                raise ValidationError(_(" Agora system detected the following exception:\n%s") % message.decode())
+        except Exception as e:
+            _logger.error(e)
+            raise ValidationError(_("ERROR RESPONSE:\n %s") % e)
+
+    def update_posted_product(self, product, is_new, payload, prefetched):
+        """"
+        Function to update a product already sent to Agora
+        Set the status as done and save the new Agora IDs of the product and its formats
+        Params:
+            prefetched: Related data used to prepare the payload, the formats are taken from it by their Agora Id
+        """
+        format_by_id = prefetched.get('format_by_id', {})
+        product.write({
+            'sync_status': 'done',
+            'agora_payload': json.dumps(payload, sort_keys=True, indent=4),
+            'agora_payload_hash': self.get_payload_hash(payload)
+        })
+        product.product_formats_ids.sync_status = 'done'
+        if is_new:
+            product.update({'agora_id': payload.get('Id'), 'base_format_id': payload.get('BaseSaleFormatId')})
+        for rec in payload.get('AdditionalSaleFormats'):
+            current_format = format_by_id.get(rec.get('Id'))
+            if current_format and current_format.sale_format == 0:
+                current_format.sale_format = rec.get('Id')
 
 # -----------------------------------------------------------------------------------------------------
 # -------------------- GET REQUEST TO GENERATE SALES DATA IN ODOO -------------------------------------
@@ -756,6 +1566,7 @@ class APIConnection(models.Model):
         Process data for specific invoices
         @params: Lines-> A list of sale.api.lines to be process geting the data saved in the record
         """
+        self._get_master_resolver(refresh=True)
         # Divide Invoices and Refunds
         basic_invoices = lines.filtered(
             lambda l: l.state != 'done' and l.try_counter <= 50 and l.document_type in ['BasicInvoice', 'StandardInvoice'])
@@ -765,7 +1576,8 @@ class APIConnection(models.Model):
         # Only 100 Invoices will be process to avoid time out in server
         for log in basic_invoices[0:100]:
             sos = False
-            log_data = json.loads(log.order_data)
+            # The ticket of the cache, only read (see Jsonb)
+            log_data = log.order_json
             try:
                 sos = self._create_sale_order(log)
                 if sos:
@@ -791,6 +1603,7 @@ class APIConnection(models.Model):
         invoices_lines = log_line_obj.search([
             ('state', '!=', 'done'), ('try_counter', '<', 50), ('company_id', '=', self.company_id.id),
             ('document_type', 'in', ['BasicInvoice', 'StandardInvoice'])], order='id desc', limit=30)
+        self._get_master_resolver(refresh=True)
 
         for invoice in invoices_lines:
             sos = []
@@ -828,41 +1641,88 @@ class APIConnection(models.Model):
         Generate the invoices queque to be process after by other cron.
         endpoint example => /export/?business-day=2022-06-05&filter=Invoices
         """
-        endpoint = '/export/?business-day={}'.format(date)
-        params = {
-            'filter': 'Invoices',
-        }
-        invoices = self.get_request(self.url_server, endpoint, self.server_api_key, params)
+        invoices = self.iter_export_records(self.get_invoices_end_point(date), {'filter': 'Invoices'}, 'Invoices')
+        return self.write_sale_api_logs(date, invoices)
+
+    @staticmethod
+    def get_invoices_end_point(date):
+        return '/export/?business-day={}'.format(date)
+
+    def write_sale_api_logs(self, date, invoices, incremental=False):
+        """"
+        Function to write in the queue the tickets of a business day
+        Params:
+            date: Business day
+            invoices: Iterable of Agora Invoices
+            incremental: Skip the tickets under the watermark of each serie, without looking for the tickets
+                         already in the queue. Used by the intraday downloads. Agora numbers the tickets of a
+                         serie in increasing order; a ticket with a lower number but dated after the watermark,
+                         and the tickets without serie, are queued again and deduplicated by the unique ticket key
+        Return: sale.api record, False if there was no tickets
+        """
+        log_obj = self.env['sale.api']
+        log_line_obj = self.env['sale.api.line']
         log = False
-        if invoices and invoices.json().get('Invoices'):
-            json_invoices = invoices.json().get('Invoices')
-            log_obj = self.env['sale.api']
-            log_line_obj = self.env['sale.api.line']
-            if json_invoices:
-                api_line_ids = []
+        existing_tickets = set()
+        watermark_env = self.env['agora.ticket.watermark']
+        marks = {serie: (number, watermark_env.parse_ticket_date(last_date))
+                 for serie, (number, last_date) in watermark_env.get_marks(self, date).items()} if incremental else {}
+        new_marks = {}
+        # The tickets are written in small batches while the body is decoded, to keep the memory flat
+        for json_invoices in split_every(QUEUE_BATCH_SIZE, invoices):
+            if not log:
                 log = log_obj.search([('data_date', '=', date), ('company_id', '=', self.company_id.id)])
                 if not log:
                     log = log_obj.create({'data_date': date, 'executed_by': self._uid,
                                           'company_id': self.company_id.id})
-                for record in json_invoices:
-                    existing_line = log_line_obj.search([('ticket_number', '=', record.get('Number')),
-                                                         ('ticket_serial', '=', record.get('Serie')),
-                                                         ('sale_api_id.company_id', '=', self.company_id.id)])
-                    if not existing_line:
-                        json_record = json.dumps(record)
-                        line = log_line_obj.create({
-                            'order_data': json_record,
-                            'data_date': date,
-                            'order_customer': record.get('Customer').get('FiscalName') if record.get('Customer') else 'Generic',
-                            'ticket_number': record.get('Number'),
-                            'ticket_serial': record.get('Serie'),
-                            'document_type': record.get('DocumentType')
-                        })
-                        api_line_ids.append(line)
-                log.api_line_ids = [(4, x.id) for x in api_line_ids]
-                self._cr.commit()
+                if not incremental:
+                    existing_tickets = self._get_existing_tickets(date)
+            lines_values = []
+            for record in json_invoices:
+                ticket = (record.get('Serie') or False, record.get('Number') or 0)
+                if incremental:
+                    # The tickets without serie can't be followed, the unique ticket key skips them when queued
+                    if ticket[0]:
+                        ticket_date = watermark_env.parse_ticket_date(record.get('Date'))
+                        last_number, last_date = marks.get(ticket[0], (0, datetime.min))
+                        if ticket[1] <= last_number and ticket_date <= last_date:
+                            # Already queued by a previous run of the day
+                            continue
+                        number, mark_date, mark_text = new_marks.get(ticket[0], (0, datetime.min, False))
+                        if ticket_date > mark_date:
+                            # The date is kept as sent by Agora
+                            mark_date, mark_text = ticket_date, record.get('Date')
+                        new_marks[ticket[0]] = (max(number, ticket[1]), mark_date, mark_text)
+                if ticket in existing_tickets:
+                    continue
+                existing_tickets.add(ticket)
+                lines_values.append({
+                    'sale_api_id': log.id,
+                    'order_json': record,
+                    'order_customer': record.get('Customer').get('FiscalName') if record.get('Customer') else 'Generic',
+                    'ticket_number': record.get('Number'),
+                    'ticket_serial': record.get('Serie'),
+                    'document_type': record.get('DocumentType')
+                })
+            # The unique ticket constraint skips the tickets queued by other run meanwhile
+            log_line_obj.create_skip_existing(lines_values)
+        if new_marks:
+            watermark_env.save_marks(self, date, {serie: (number, ticket_date)
+                                                  for serie, (number, mark_date, ticket_date) in new_marks.items()})
+        if log:
+            self._cr.commit()
         return log
 
+    def _get_existing_tickets(self, date):
+        """"
+        Function to get at once the tickets of a business day already in the queue
+        Return: Set of (serie, number)
+        """
+        lines = self.env['sale.api.line'].search_read([('data_date', '=', date),
+                                                       ('sale_api_id.company_id', '=', self.company_id.id)],
+                                                      ['ticket_serial', 'ticket_number'])
+        return {(line['ticket_serial'], line['ticket_number']) for line in lines}
+
     @staticmethod
     def complete_sequence(number):
         length = 6
@@ -1056,7 +1916,7 @@ class APIConnection(models.Model):
         """This function will generate a credit note in Odoo when a refund come from Agora.
             :param refund: Record of refund coming from Agora.
         """
-        refund = json.loads(log_refund.order_data)
+        refund = log_refund.order_json
         if self.sale_flow in ['payment', 'invoice']:
             order = self.env['sale.order'].search([('number', '=', refund['RelatedInvoice'].get('Number')),
                                                    ('company_id', '=', self.company_id.id),
@@ -1130,11 +1990,13 @@ class APIConnection(models.Model):
         Function to create Sale Order from Agora Data
         Return a List of dictionary with the following structure
         """
-        record = json.loads(log_line.order_data)
+        # The ticket of the cache, only read (see Jsonb)
+        record = log_line.order_json
         work_place_env = self.env['work.place']
         so_line_env = self.env['sale.order.line']
         so_env = self.env['sale.order']
         sale_center_env = self.env['sale.center']
+        resolver = self._get_master_resolver()
         partner = self.get_partner(record)
         card_tips = self.get_card_tips(record)
         generated_sos = []
@@ -1170,15 +2032,13 @@ class APIConnection(models.Model):
                         'business_date': datetime.strptime(record.get('BusinessDay'), '%Y-%m-%d').date()
                     }
                     if record.get('Workplace'):
-                        wp = work_place_env.search([('agora_id', '=', record['Workplace'].get('Id')),
-                                                    ('company_id', '=', self.company_id.id)], limit=1)
+                        wp = work_place_env.browse(resolver.get('work_place', record['Workplace'].get('Id')))
                         if not wp:
                             log_line.update({'message': 'There is no Work place configured. ', 'state': 'draft'})
                             return
                         so_data.update({'work_place_id': wp.id, 'warehouse_id': wp.analytic_group_id.warehouse_id.id})
                     if item.get('SaleCenter'):
-                        sc = sale_center_env.search([('agora_id', '=', item['SaleCenter'].get('Id')),
-                                                    ('company_id', '=', self.company_id.id)], limit=1)
+                        sc = sale_center_env.browse(resolver.get('sale_center', item['SaleCenter'].get('Id')))
                         if not sc:
                             log_line.update({'message': 'There is no Sale center configured. ', 'state': 'draft'})
                             return
@@ -1244,16 +2104,15 @@ class APIConnection(models.Model):
         return 0
 
     def get_so_lines(self, line, so, global_discount, is_addin):
-        tax_env = self.env['agora.tax']
         product = self.get_product_for_line(line)
-        tax = tax_env.search([('agora_id', '=', line.get('VatId')), ('company_id', '=', self.company_id.id)])
+        tax_ids = self._get_master_resolver().get('taxes', line.get('VatId'), [])
         if product:
             line_data = {
                 'index': line.get('Index'),
                 'name': line.get('ProductName'),
                 'product_id': product.id,
                 'order_id': so.id,
-                'tax_id': [(6, 0, tax.account_tax_id.ids)],
+                'tax_id': [(6, 0, tax_ids)],
                 'price_unit': line.get('TotalAmount') / line.get('Quantity') if not is_addin else 0.0,
                 'product_uom': product.product_tmpl_id.uom_id.id,
                 'company_id': self.company_id.id,
@@ -1324,34 +2183,46 @@ class APIConnection(models.Model):
         Function to update the Loss Products.
         With this Loss should be generated a new Validated SO
         """
-        order_line_env = self.env['sale.order.line']
         loss_dict = []
+        params = self.get_loss_query_params(start_date, end_date)
+        if params:
+            loss_products = self.post_request(self.url_server, '/custom-query', self.server_api_key, params)
+            if loss_products and loss_products[0].status_code and loss_products[0].status_code == 200:
+                loss_dict = self.get_new_loss_products(loss_products[0].json())
+        return loss_dict
+
+    def get_loss_query_params(self, start_date, end_date):
+        """"
+        Return: Params of the Loss custom query, False if the report is not configured
+        """
         report_config = self.env['agora.reports.config'].search([('company_id', '=', self.company_id.id),
                                                                 ('report_type', '=', 'loss')], limit=1)
-        start_date.isoformat()
-        if report_config:
-            params = {
-                'QueryGuid': '{%s}' % report_config.guid,
-                'Params': {
-                    'from': start_date.isoformat(),
-                    'to': end_date.isoformat()
-                }
+        if not report_config:
+            return False
+        return {
+            'QueryGuid': '{%s}' % report_config.guid,
+            'Params': {
+                'from': start_date.isoformat(),
+                'to': end_date.isoformat()
             }
+        }
 
-            loss_products = self.post_request(self.url_server, '/custom-query', self.server_api_key, params)
-            if loss_products and loss_products[0].status_code and loss_products[0].status_code == 200:
-                products = loss_products[0].json()
-                if products:
-                    for product in products:
-                        exist = order_line_env.search([('agora_loss_id', '=', product.get('StockChangeId')),
-                                                       ('product_id.product_tmpl_id.agora_id', '=', product.get('ProductId'))])
-                        if not exist:
-                            prod_data = {
-                                'agora_loss_id': product.get('StockChangeId'),
-                                'quantity': product.get('Quantity'),
-                                'product_agora_id': product.get('ProductId')
-                            }
-                            loss_dict.append(prod_data)
+    def get_new_loss_products(self, products):
+        """"
+        Return: Loss products coming from Agora that are not yet in Odoo
+        """
+        order_line_env = self.env['sale.order.line']
+        loss_dict = []
+        for product in products or []:
+            exist = order_line_env.search([('agora_loss_id', '=', product.get('StockChangeId')),
+                                           ('product_id.product_tmpl_id.agora_id', '=', product.get('ProductId'))])
+            if not exist:
+                prod_data = {
+                    'agora_loss_id': product.get('StockChangeId'),
+                    'quantity': product.get('Quantity'),
+                    'product_agora_id': product.get('ProductId')
+                }
+                loss_dict.append(prod_data)
         return loss_dict
 
     def _create_so_for_loss_products(self, loss_products, date):
@@ -1406,14 +2277,10 @@ class APIConnection(models.Model):
         """"
         Main Function to make the call to all the functions need it to complete the sync
         """
-        conections = self.search([('state', '=', 'connect')])
-        for record in conections:
-            record.get_master_pricelist()
-            record.get_master_work_places()
-            record.get_master_sale_center()
-            record.get_master_categories()
-            record.get_master_products()
-            _logger.info("***Finish a company connection**")
+        conections = self._get_reachable_connections()
+        # Each chunk is committed, if the cron is interrupted the next run continues from the last chunk
+        conections.sync_masters(FIRST_SYNC_MASTERS, checkpoint=True)
+        _logger.info("***Finish the first sync of %s connections**", len(conections))
 
     def _delete_invoice_formentera(self):
         """"
@@ -1428,37 +2295,37 @@ class APIConnection(models.Model):
         """"
         Action to keep updated the Masters in Odoo
         """
-        conections = self.search([('state', '=', 'connect')])
-        for record in conections:
-            export_endpoint = '/export-master'
-            record.get_master_pricelist(export_endpoint)
-            record.get_master_work_places(export_endpoint)
-            record.get_master_sale_center(export_endpoint)
-            record.get_master_categories(export_endpoint)
+        conections = self._get_reachable_connections()
+        # Most of the days the masters dont change, in that case nothing is imported
+        conections.sync_masters(UPDATE_MASTERS, skip_unchanged=True)
 
     def _update_products_from_odoo(self):
         """"
         Action to post products in Odoo
+        Send the products of the pending events of the outbox, the repeated changes of a product
+        are already coalesced in only one event
         """
-        conections = self.search([('state', '=', 'connect')])
-        product_env = self.env['product.template']
-        for connec in conections:
-            product_to_send = product_env.search([('company_id', '=', connec.company_id.id),
-                                                  ('sync_status', 'in', ['new', 'modified']),
-                                                  ('active', 'in', [True, False])])
-            if product_to_send:
-                self.post_products(product_to_send)
+        conections = self._get_reachable_connections()
+        events = self.env['agora.product.outbox'].search([('state', '=', 'pending'),
+                                                          ('company_id', 'in', conections.company_id.ids)])
+        batch_size = max(conections.mapped('post_batch_size') + [1]) * OUTBOX_BATCHES
+        for batch in split_every(batch_size, events.ids):
+            events.browse(batch).drain()
 
     def download_and_process_today_orders(self):
         """"
         Action to get invoices from Agora and then process the log
         But just Today's orders
         """
-        conections = self.search([('state', '=', 'connect')])
-        for connec in conections:
-            log = connec.generate_sale_api_logs(fields.Date.today())
+        conections = self._get_reachable_connections()
+        today = fields.Date.today()
+
+        def process(connection, results):
+            log = connection.write_sale_api_logs(today, results['Invoices'].iter_records('Invoices'), incremental=True)
             if log:
-                connec.process_specific_queue(log.api_line_ids)
+                connection.process_specific_queue(connection.env['sale.api.line'].search(
+                    [('sale_api_id', '=', log.id), ('state', '!=', 'done')]))
+        self._fetch_and_process([connec._get_invoices_fetch_job(today) for connec in conections], process)
 
     def _process_sales_logs_queue(self):
         """"
@@ -1478,24 +2345,51 @@ class APIConnection(models.Model):
         for connec in conections:
             connec.process_refunds()
 
+    def _archive_sales_logs_queue(self):
+        """"
+            Function to move to the archive the tickets of the queue lines done, older than the retention days.
+            Each batch is committed, so a long archive can be stopped and continued by the next run
+        """
+        conections = self.search([('queue_retention_days', '>', 0)])
+        archive_env = self.env['sale.api.line.archive']
+        for connec in conections:
+            before_date = fields.Date.today() - timedelta(days=connec.queue_retention_days)
+            total = 0
+            while True:
+                archived = archive_env.archive_lines(connec.company_id, before_date)
+                self._cr.commit()
+                total += archived
+                if archived < ARCHIVE_BATCH_SIZE:
+                    break
+            if total:
+                _logger.info("%s tickets of %s moved to the archive", total, connec.name)
+
     def _download_previous_day_orders(self, date=False):
         """"
         Action to generate log lines in Queue from yesterday tickets
         """
-        conections = self.search([('state', '=', 'connect')])
+        conections = self._get_reachable_connections()
         if not date:
-            yesterday = fields.Date.today() - timedelta(days=1)
-        for connec in conections:
-            connec.generate_sale_api_logs(yesterday)
+            date = fields.Date.today() - timedelta(days=1)
+        self._download_orders(conections, date)
+
+    def _download_orders(self, conections, date, incremental=False):
+        """"
+        Function to generate the queue lines of the provided connections, downloading them concurrently
+        Params:
+            incremental: Only queue the tickets after the watermarks of the day, see write_sale_api_logs
+        """
+        def process(connection, results):
+            connection.write_sale_api_logs(date, results['Invoices'].iter_records('Invoices'), incremental)
+        self._fetch_and_process([connec._get_invoices_fetch_job(date) for connec in conections], process)
 
     def _download_today_orders(self):
         """"
         Action to today orders from Agora
         Only generate log lines in Queue from yesterday tickets. There is other cron to process the lines
         """
-        conections = self.search([('state', '=', 'connect')])
-        for connec in conections:
-            connec.generate_sale_api_logs(fields.Date.today())
+        conections = self._get_reachable_connections()
+        self._download_orders(conections, fields.Date.today(), incremental=True)
 
     def download_by_date(self, date, company):
         """"
@@ -1512,14 +2406,21 @@ class APIConnection(models.Model):
         """"
         Action to get invoices from Agora
         """
-        conections = self.search([('state', '=', 'connect')])
+        conections = self._get_reachable_connections()
         start_datetime = fields.Datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         end_datetime = fields.Datetime.now()
+        jobs = []
         for connec in conections:
-            loss_products = connec._get_loss_products_from_agora(start_datetime, end_datetime)
+            params = connec.get_loss_query_params(start_datetime, end_datetime)
+            if params:
+                jobs.append(connec._get_fetch_job('loss', '/custom-query', method='POST', json=params))
+
+        def process(connection, results):
+            loss_products = connection.get_new_loss_products(results['loss'].json())
             if loss_products:
                 # Generate a SO
-                connec._create_so_for_loss_products(loss_products, end_datetime)
+                connection._create_so_for_loss_products(loss_products, end_datetime)
+        self._fetch_and_process(jobs, process)
 
     def action_to_validate_pickings(self):
         """"
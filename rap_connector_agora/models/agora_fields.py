@@ -0,0 +1,31 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+import json
+
+from psycopg2.extras import Json
+
+from odoo import fields
+
+
+class Jsonb(fields.Serialized):
+    """
+    Serialized field stored in a PostgreSQL jsonb column.
+    The value is decoded once when it's read from the database (by psycopg2)
+    and the cache keeps the decoded dict, so each access doesn't parse the JSON again.
+    The dict returned is the one of the cache, it's read only: changing it would change the record
+    cache without writing it. To change the value, write a new dict (Ex. record.field = dict(value, key=x))
+    """
+    column_type = ('jsonb', 'jsonb')
+
+    def convert_to_column(self, value, record, values=None, validate=True):
+        value = self.convert_to_cache(value, record, validate=validate)
+        return None if value is None else Json(value)
+
+    def convert_to_cache(self, value, record, validate=True):
+        if isinstance(value, (str, bytes)):
+            value = json.loads(value)
+        return value or None
+
+    def convert_to_record(self, value, record):
+        return value or {}
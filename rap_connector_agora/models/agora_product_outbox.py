@@ -0,0 +1,135 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+import logging
+
+from odoo import models, fields, api, _
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+# Max tries to push a product before the event is set as error
+MAX_TRIES = 5
+
+
+class AgoraProductOutbox(models.Model):
+    _name = 'agora.product.outbox'
+    _description = 'Products changed in Odoo waiting to be sent to Agora'
+    _order = 'id'
+
+    product_tmpl_id = fields.Many2one(
+        string='Product',
+        comodel_name='product.template',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    company_id = fields.Many2one(
+        string='Company',
+        comodel_name='res.company',
+        index=True
+    )
+    state = fields.Selection(
+        selection=[('pending', 'Pending'),
+                   ('done', 'Sent'),
+                   ('error', 'Error'),
+                   ('cancel', 'Retried')],
+        string='State',
+        default='pending',
+        required=True,
+        index=True
+    )
+    change_count = fields.Integer(
+        string='Changes',
+        default=1,
+        help='Changes of the product coalesced in this event'
+    )
+    last_change = fields.Datetime(
+        string='Last Change',
+        default=fields.Datetime.now
+    )
+    sent_date = fields.Datetime(
+        string='Sent Date'
+    )
+    try_counter = fields.Integer(
+        string='Tries'
+    )
+    message = fields.Text(
+        string='Message'
+    )
+
+    def init(self):
+        # Only one pending event by product, the next changes are coalesced in it
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS agora_product_outbox_pending_uniq
+                ON agora_product_outbox (product_tmpl_id) WHERE state = 'pending'
+        """)
+
+    @api.model
+    def enqueue(self, products):
+        """"
+        Function to register that the products changed and should be sent to Agora
+        The formats are registered as their main product. If the product already has a pending event,
+        the change is added to it
+        Params:
+            products: product.template recordset
+        """
+        products = products.mapped(lambda p: p.parent_id or p)
+        rows = [(product.id, product.company_id.id or None) for product in products if product.id]
+        if not rows:
+            return
+        self.flush(['state', 'change_count'])
+        for chunk in split_every(1000, rows):
+            self.env.cr.execute("""
+                INSERT INTO agora_product_outbox
+                       (product_tmpl_id, company_id, state, change_count, last_change, try_counter,
+                        create_uid, create_date, write_uid, write_date)
+                VALUES {}
+                ON CONFLICT (product_tmpl_id) WHERE state = 'pending'
+                DO UPDATE SET change_count = agora_product_outbox.change_count + 1,
+                              last_change = EXCLUDED.last_change,
+                              write_uid = EXCLUDED.write_uid,
+                              write_date = EXCLUDED.write_date
+            """.format(', '.join(["(%s, %s, 'pending', 1, now() at time zone 'UTC', 0,"
+                                  " %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')"] * len(chunk))),
+                [value for product_id, company_id in chunk for value in (product_id, company_id, self.env.uid, self.env.uid)])
+        self.invalidate_cache(['change_count', 'last_change'])
+
+    def drain(self, force=False):
+        """"
+        Function to send the products of the pending events to Agora
+        The events of the products sent are closed, unless the product changed again during the push
+        Params:
+            force: Send the products even if their data didn't change
+        Return: dict {product id: error message} of the products not sent
+        """
+        events = self.filtered(lambda e: e.state == 'pending')
+        if not events:
+            return {}
+        # Snapshot of the changes, a change done while sending the product keeps the event pending
+        snapshot = {event.id: event.change_count for event in events}
+        products = events.product_tmpl_id.with_context(active_test=False)
+        posted, errors = self.env['api.connection'].post_products(products, raise_errors=False, force=force)
+        for event in events:
+            if event.product_tmpl_id in posted:
+                self.env.cr.execute("""
+                    UPDATE agora_product_outbox SET state = 'done', sent_date = now() at time zone 'UTC'
+                     WHERE id = %s AND change_count = %s
+                """, (event.id, snapshot[event.id]))
+            else:
+                errors.setdefault(event.product_tmpl_id.id, _('There is no Agora connection for the product'))
+                event.write({
+                    'try_counter': event.try_counter + 1,
+                    'message': errors[event.product_tmpl_id.id],
+                    'state': 'error' if event.try_counter + 1 >= MAX_TRIES else 'pending'
+                })
+        self.invalidate_cache(['state', 'sent_date'], events.ids)
+        return errors
+
+    def action_retry(self):
+        """"
+        Action to send again the products of the events with error
+        """
+        errors = self.filtered(lambda e: e.state == 'error')
+        errors.write({'state': 'cancel'})
+        self.enqueue(errors.product_tmpl_id)
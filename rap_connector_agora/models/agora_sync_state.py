@@ -0,0 +1,107 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+from odoo import models, fields, api, _
+
+
+class AgoraSyncState(models.Model):
+    _name = 'agora.sync.state'
+    _description = 'Last synchronization of each Agora master by connection'
+    _order = 'connection_id, master_filter'
+
+    connection_id = fields.Many2one(
+        string='API Connection',
+        comodel_name='api.connection',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    company_id = fields.Many2one(
+        string='Company',
+        related='connection_id.company_id',
+        store=True
+    )
+    master_filter = fields.Char(
+        string='Master',
+        required=True,
+        help='Agora filter used in /export-master. Ex. PriceLists'
+    )
+    fingerprint = fields.Char(
+        string='Fingerprint',
+        copy=False,
+        help='Hash of the last payload imported. If the new payload is the same the import is skipped'
+    )
+    etag = fields.Char(
+        string='ETag',
+        copy=False
+    )
+    last_modified = fields.Char(
+        string='Last Modified',
+        copy=False
+    )
+    last_sync = fields.Datetime(
+        string='Last Sync'
+    )
+    last_check = fields.Datetime(
+        string='Last Check'
+    )
+    cursor = fields.Integer(
+        string='Records Imported',
+        copy=False,
+        help='Records of the payload already imported in an unfinished chunked sync. The next run resumes from here'
+    )
+    cursor_fingerprint = fields.Char(
+        string='Cursor Payload',
+        copy=False,
+        help='Fingerprint of the payload the cursor refers to. If Agora returns a different payload the sync restarts'
+    )
+
+    _sql_constraints = [('unique_connection_master', 'unique(connection_id, master_filter)',
+                         "Only one sync state by connection and master is allowed")]
+
+    def get_conditional_headers(self):
+        """"
+        Return: HTTP validators to ask Agora for the master only if it changed
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def is_unchanged(self, result):
+        """"
+        Return: True if the downloaded result is the same already imported
+        """
+        return bool(result.not_modified or (self.fingerprint and self.fingerprint == result.fingerprint))
+
+    def save_result(self, result, imported=True):
+        """"
+        Function to save the fingerprint and HTTP validators of a downloaded result
+        """
+        values = {'last_check': fields.Datetime.now()}
+        if imported:
+            values.update({
+                'fingerprint': result.fingerprint,
+                'etag': result.headers.get('ETag') or False,
+                'last_modified': result.headers.get('Last-Modified') or False,
+                'last_sync': fields.Datetime.now(),
+                'cursor': 0,
+                'cursor_fingerprint': False
+            })
+        self.write(values)
+
+    def get_resume_cursor(self, result):
+        """"
+        Return: Number of records of the result already imported by a previous run, 0 to start from the beginning
+        """
+        if self.cursor and self.cursor_fingerprint == result.fingerprint:
+            return self.cursor
+        return 0
+
+    def save_cursor(self, result, cursor):
+        """"
+        Function to save the progress of a chunked sync
+        """
+        self.write({'cursor': cursor, 'cursor_fingerprint': result.fingerprint, 'last_check': fields.Datetime.now()})
@@ -0,0 +1,97 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+from datetime import datetime, timezone
+
+from dateutil import parser
+
+from odoo import models, fields, api, _
+
+
+class AgoraTicketWatermark(models.Model):
+    _name = 'agora.ticket.watermark'
+    _description = 'Last Agora ticket queued of each serie by connection'
+    _order = 'connection_id, serie'
+
+    connection_id = fields.Many2one(
+        string='API Connection',
+        comodel_name='api.connection',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    company_id = fields.Many2one(
+        string='Company',
+        related='connection_id.company_id',
+        store=True
+    )
+    serie = fields.Char(
+        string='Serie',
+        required=True
+    )
+    business_day = fields.Date(
+        string='Business Day',
+        help='Business day of the last ticket queued. The watermark only applies to the same day'
+    )
+    last_number = fields.Integer(
+        string='Last Number',
+        help='Highest ticket number of the serie already queued. Agora numbers the tickets of a serie in '
+             'increasing order, the tickets up to this number are not queued again'
+    )
+    last_ticket_date = fields.Char(
+        string='Last Ticket Date',
+        help='Latest date of the tickets queued, as sent by Agora. A ticket with a lower number but a later '
+             'date, like the ones sent late by an offline TPV, is queued again and deduplicated by the queue'
+    )
+
+    _sql_constraints = [('unique_connection_serie', 'unique(connection_id, serie)',
+                         "Only one watermark by connection and serie is allowed")]
+
+    @api.model
+    def get_marks(self, connection, date):
+        """"
+        Function to get the last ticket queued of each serie in the business day
+        Return: Dict {serie: (last number, last ticket date)}
+        """
+        watermarks = self.search([('connection_id', '=', connection.id), ('business_day', '=', date)])
+        return {watermark.serie: (watermark.last_number, watermark.last_ticket_date or False)
+                for watermark in watermarks}
+
+    @api.model
+    def save_marks(self, connection, date, marks):
+        """"
+        Function to move forward the watermarks of the business day
+        Params:
+            marks: Dict {serie: (highest number, latest ticket date)} of the tickets queued
+        """
+        watermarks = {watermark.serie: watermark for watermark in self.search([('connection_id', '=', connection.id),
+                                                                                ('serie', 'in', list(marks))])}
+        for serie, (number, ticket_date) in marks.items():
+            values = {'business_day': date, 'last_number': number, 'last_ticket_date': ticket_date}
+            watermark = watermarks.get(serie)
+            if not watermark:
+                self.create(dict(values, connection_id=connection.id, serie=serie))
+            elif watermark.business_day != date:
+                watermark.write(values)
+            else:
+                is_later = self.parse_ticket_date(ticket_date) > self.parse_ticket_date(watermark.last_ticket_date)
+                if watermark.last_number < number or is_later:
+                    watermark.write({'last_number': max(number, watermark.last_number),
+                                     'last_ticket_date': ticket_date if is_later else watermark.last_ticket_date})
+
+    @staticmethod
+    def parse_ticket_date(value):
+        """"
+        Function to parse the date of an Agora ticket, the dates are compared as dates and not as text,
+        so the same date sent with other format (Ex. with milliseconds) is the same date
+        Return: Naive datetime in UTC, datetime.min if there is no date or it's not valid
+        """
+        if not value:
+            return datetime.min
+        try:
+            ticket_date = parser.isoparse(value)
+        except (ValueError, OverflowError):
+            return datetime.min
+        if ticket_date.tzinfo:
+            ticket_date = ticket_date.astimezone(timezone.utc).replace(tzinfo=None)
+        return ticket_date
@@ -17,6 +17,10 @@ class ProductCategory(models.Model):
         string='Agora ID',
         copy=False
     )
+    agora_hash = fields.Char(
+        string='Agora Hash',
+        copy=False
+    )
     color = fields.Char(
         string='Color'
     )
@@ -33,6 +37,10 @@ class ProductPricelist(models.Model):
         string='Agora ID',
         copy=False
     )
+    agora_hash = fields.Char(
+        string='Agora Hash',
+        copy=False
+    )
     sync_status = fields.Selection(
         selection=[('done', 'Completed'),
                    ('new', 'New'),
@@ -21,25 +21,22 @@ class ProductPricelistItem(models.Model):
         digits='Product Price'
     )
 
-    @api.model
-    def create(self, values):
-        res = super(ProductPricelistItem, self).create(values)
+    @api.model_create_multi
+    def create(self, vals_list):
+        res = super(ProductPricelistItem, self).create(vals_list)
         is_first_charge = self.env.context.get('first_charge')
-        if not is_first_charge and res.product_tmpl_id and res.product_tmpl_id.sync_status != 'new':
+        if not is_first_charge:
             # When a new pricelist is created the Product related should be mark as modified
-            res.product_tmpl_id.sync_status = 'modified'
-            res.product_tmpl_id.parent_id.sync_status = 'modified'
+            res.product_tmpl_id._agora_mark_modified()
         return res
 
     def write(self, vals):
         res = super(ProductPricelistItem, self).write(vals)
         is_first_charge = self.env.context.get('first_charge')
-        for rec in self:
-            if not is_first_charge and rec.product_tmpl_id.sync_status != 'new' and \
-                    (vals.get('pricelist_id') or vals.get('fixed_price') or vals.get('addin_price') or vals.get('menuitem_price')):
-                # When some values change the Product related should be mark as modified
-                rec.product_tmpl_id.sync_status = 'modified'
-                rec.product_tmpl_id.parent_id.sync_status = 'modified'
+        if not is_first_charge and \
+                (vals.get('pricelist_id') or vals.get('fixed_price') or vals.get('addin_price') or vals.get('menuitem_price')):
+            # When some values change the Product related should be mark as modified
+            self.product_tmpl_id._agora_mark_modified()
         return res
 
     @api.constrains('pricelist_id')
@@ -12,6 +12,21 @@ class ProductTemplate(models.Model):
         string='Agora ID',
         copy=False
     )
+    agora_hash = fields.Char(
+        string='Agora Hash',
+        copy=False,
+        help='Hash of the Agora Product (or Sale Format) last imported. The import skips it while it is the same'
+    )
+    agora_payload = fields.Text(
+        string='Last Data Sent',
+        copy=False,
+        help='Data of the product in the last successful push to Agora'
+    )
+    agora_payload_hash = fields.Char(
+        string='Last Data Sent Hash',
+        copy=False,
+        help='Hash of the data of the last push, the product is only sent again if it changes'
+    )
     base_format_id = fields.Integer(
         string='Base Sale Format',
         copy=False
@@ -34,11 +49,10 @@ class ProductTemplate(models.Model):
     )
     sync_status = fields.Selection(
         selection=[('done', 'Completed'),
-                   ('new', 'New'),
-                   ('modified', 'Modified'),
-                   ('error', 'Error')],
+                   ('new', 'New')],
         default='new',
-        copy=False
+        copy=False,
+        help='New until the product is created in Agora. The changes waiting to be sent are in the outbox'
     )
     preparation_id = fields.Many2one(
         string='Preparation Type',
@@ -120,6 +134,17 @@ class ProductTemplate(models.Model):
     is_product_menu = fields.Boolean(
         string='Is Menu Product'
     )
+    agora_outbox_ids = fields.One2many(
+        string='Agora Outbox',
+        comodel_name='agora.product.outbox',
+        inverse_name='product_tmpl_id'
+    )
+    agora_pending = fields.Boolean(
+        string='Pending to Send',
+        compute='_compute_agora_pending',
+        search='_search_agora_pending',
+        help='The product has changes waiting in the outbox to be sent to Agora'
+    )
     is_wrong_categ = fields.Boolean(
         string='Wrong Family',
         compute='_computed_family_validation'
@@ -141,30 +166,32 @@ class ProductTemplate(models.Model):
         default='product'
     )
 
-    @api.model
-    def create(self, vals):
-        res = super().create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        res = super().create(vals_list)
         mrp_bom_env = self.env['mrp.bom']
         mrp_bom_line_env = self.env['mrp.bom.line']
         product_env = self.env['product.product']
         is_first_charge = self.env.context.get('first_charge')
         if not is_first_charge:
-            if res.parent_id:
-                # When a format is created automatically a List of materials should be created
-                # Should be created a list of material line too, as required in odoo
-                material_list = mrp_bom_env.create({
-                    'product_tmpl_id': res.id,
-                    'type': 'phantom',
-                    'company_id': res.company_id.id
-                })
-                product_product = product_env.search([('product_tmpl_id', '=', res.parent_id.id)], limit=1)
-                mrp_bom_line_env.create({
-                    'bom_id': material_list.id,
-                    'product_id': product_product.id,
-                    'product_qty': res.ratio,
-                    'company_id': res.company_id.id
-                })
-            res.fields_validation()
+            for rec in res:
+                if rec.parent_id:
+                    # When a format is created automatically a List of materials should be created
+                    # Should be created a list of material line too, as required in odoo
+                    material_list = mrp_bom_env.create({
+                        'product_tmpl_id': rec.id,
+                        'type': 'phantom',
+                        'company_id': rec.company_id.id
+                    })
+                    product_product = product_env.search([('product_tmpl_id', '=', rec.parent_id.id)], limit=1)
+                    mrp_bom_line_env.create({
+                        'bom_id': material_list.id,
+                        'product_id': product_product.id,
+                        'product_qty': rec.ratio,
+                        'company_id': rec.company_id.id
+                    })
+                rec.fields_validation()
+            self.env['agora.product.outbox'].sudo().enqueue(res)
         return res
 
     def write(self, vals):
@@ -223,6 +250,16 @@ class ProductTemplate(models.Model):
             recs_taxes = recs.mapped('account_tax_id')
             rec.tax_agora_ids = recs_taxes.ids
 
+    @api.depends('agora_outbox_ids.state')
+    def _compute_agora_pending(self):
+        for rec in self:
+            rec.agora_pending = any(event.state == 'pending' for event in rec.agora_outbox_ids)
+
+    def _search_agora_pending(self, operator, value):
+        events = self.env['agora.product.outbox'].sudo().search([('state', '=', 'pending')])
+        pending = (operator == '=') == bool(value)
+        return [('id', 'in' if pending else 'not in', events.product_tmpl_id.ids)]
+
     @api.depends('categ_id')
     def _computed_family_validation(self):
         for rec in self:
@@ -276,14 +313,10 @@ class ProductTemplate(models.Model):
     @api.constrains(lambda self: self.get_onchange_fields())
     def verify_changed_values(self):
         is_first_charge = self.env.context.get('first_charge')
-        for rec in self:
-            if not is_first_charge and rec.sync_status != 'new':
-                # During the first charge is never set as 'modified'
-                # Not even when is new
-                if rec.parent_id:
-                    rec.parent_id.sync_status = 'modified'
-                else:
-                    rec.sync_status = 'modified'
+        if not is_first_charge:
+            # During the first charge the changes are never sent to Agora
+            # Not even when is new
+            self._agora_mark_modified()
 
     @api.constrains('taxes_id')
     def validate_one_tax(self):
@@ -302,9 +335,15 @@ class ProductTemplate(models.Model):
 
     @api.constrains('product_formats_ids')
     def update_state(self):
-        for rec in self:
-            if rec.sync_status != 'new':
-                rec.sync_status = 'modified'
+        self._agora_mark_modified()
+
+    def _agora_mark_modified(self):
+        """"
+            Function to register a change of the products to be sent to Agora.
+            An event of the main products is added to the outbox, the formats are sent with their main product.
+            The outbox is the only record of the changes waiting to be sent.
+        """
+        self.env['agora.product.outbox'].sudo().enqueue(self)
 
     @staticmethod
     def get_onchange_fields():
@@ -319,7 +358,8 @@ class ProductTemplate(models.Model):
 
     def action_sent_agora(self):
         """"
-         Action to send 'New' and 'Modified' products to Agora
+         Action to send the selected products to Agora, even if their data didn't change
+         Their pending events of the outbox are closed by the push
         """
         active_ids = self._context.get('active_ids')
         products = self.env['product.template'].search([('id', 'in', active_ids), ('active', 'in', [True, False])])
@@ -328,8 +368,16 @@ class ProductTemplate(models.Model):
         if products.mapped('parent_id'):
             raise ValidationError(_('Sorry this action should be executed from the Parent '
                                     'product and not from the format'))
-        # Post products calling the main function in Api connection
-        self.env['api.connection'].post_products(products)
+        # Post products through the outbox, so their pending changes are closed
+        outbox = self.env['agora.product.outbox'].sudo()
+        outbox.enqueue(products)
+        events = outbox.search([('product_tmpl_id', 'in', products.ids), ('state', '=', 'pending')])
+        errors = events.drain(force=True)
+        if errors:
+            # Execute commit() to keep the events of the products sent before showing the errors
+            self._cr.commit()
+            raise ValidationError(_("Some products were not sent to Agora:\n%s") % '\n'.join(
+                '%s: %s' % (product.name, errors[product.id]) for product in products if product.id in errors))
 
     def action_add_format(self):
         """"
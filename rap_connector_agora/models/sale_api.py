@@ -2,9 +2,16 @@
 # License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
 
 from odoo import api, fields, models, _
+from odoo.tools import split_every
+from psycopg2.extras import Json
+import json
 import logging
+from .agora_fields import Jsonb
 _logger = logging.getLogger(__name__)
 
+# Columns of the unique index of the tickets in the queue, the insert of the download skips its conflicts
+TICKET_KEY = "company_id, COALESCE(ticket_serial, ''), COALESCE(ticket_number, 0), COALESCE(document_type, '')"
+
 
 class SaleApis(models.Model):
     _description = "Sale Api"
@@ -121,8 +128,44 @@ class SaleApiLine(models.Model):
                    ("done", "Done")],
         default="draft"
     )
+    order_json = Jsonb(
+        string='Order Data (JSON)',
+        prefetch=True,
+        help='Agora ticket. Read only dict, see Jsonb'
+    )
     order_data = fields.Text(
-        string='Order Data'
+        string='Order Data',
+        compute='_compute_order_data',
+        inverse='_inverse_order_data'
+    )
+    is_archived = fields.Boolean(
+        string='Archived Ticket',
+        copy=False,
+        help='The ticket was moved to the archive after the retention days. It can be restored on demand'
+    )
+    business_day = fields.Date(
+        string='Business Day',
+        compute='_compute_ticket_keys',
+        store=True,
+        index=True
+    )
+    gross_amount = fields.Float(
+        string='Total',
+        compute='_compute_ticket_keys',
+        store=True,
+        index=True
+    )
+    work_place_agora_id = fields.Integer(
+        string='Agora Work Place',
+        compute='_compute_ticket_keys',
+        store=True,
+        index=True
+    )
+    sale_center_agora_id = fields.Integer(
+        string='Agora Sale Center',
+        compute='_compute_ticket_keys',
+        store=True,
+        index=True
     )
     sale_api_id = fields.Many2one(
         comodel_name='sale.api',
@@ -139,7 +182,9 @@ class SaleApiLine(models.Model):
         store=True
     )
     company_id = fields.Many2one(
-        related='sale_api_id.company_id'
+        related='sale_api_id.company_id',
+        store=True,
+        index=True
     )
     order_customer = fields.Char(
         string='Customer'
@@ -164,11 +209,107 @@ class SaleApiLine(models.Model):
         default=0
     )
 
+    def init(self):
+        # The queue is polled by the lines not done, a small part of the table once they are processed
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS sale_api_line_pending_idx
+                ON sale_api_line (company_id, document_type, id) WHERE state != 'done'
+        """)
+        # Only one line by ticket and company. The empty values are coalesced because PostgreSQL
+        # considers the NULLs distinct, the tickets without serie would never conflict
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS sale_api_line_ticket_key_uniq
+                ON sale_api_line ({}) WHERE company_id IS NOT NULL
+        """.format(TICKET_KEY))
+
     @api.depends('ticket_serial', 'ticket_number')
     def _compute_name(self):
         for rec in self:
             rec.name = f"{rec.ticket_serial}-{rec.ticket_number}"
 
+    def _compute_order_data(self):
+        for rec in self:
+            rec.order_data = json.dumps(rec.order_json, indent=4) if rec.order_json else False
+
+    def _inverse_order_data(self):
+        for rec in self:
+            rec.order_json = rec.order_data or False
+
+    @api.depends('order_json')
+    def _compute_ticket_keys(self):
+        for rec in self:
+            rec.update(self.get_ticket_keys(rec.order_json))
+
+    @staticmethod
+    def get_ticket_keys(record):
+        """
+        Function to get the values of the Agora ticket kept as columns, to search the tickets without reading the JSON
+        Return: Dict {field: value}
+        """
+        items = record.get('InvoiceItems') or [{}]
+        return {
+            'business_day': record.get('BusinessDay') or False,
+            'gross_amount': (record.get('Totals') or {}).get('GrossAmount') or 0.0,
+            'work_place_agora_id': (record.get('Workplace') or {}).get('Id') or 0,
+            'sale_center_agora_id': (items[0].get('SaleCenter') or {}).get('Id') or 0
+        }
+
+    @api.model
+    def create_skip_existing(self, vals_list):
+        """
+        Function to queue tickets skipping the ones already in the queue of the company,
+        even if they are being queued by other run at the same time (unique ticket constraint)
+        Params:
+            vals_list: List of dicts with sale_api_id, order_json, order_customer, ticket_number,
+                       ticket_serial and document_type
+        Return: sale.api.line recordset created
+        """
+        if not vals_list:
+            return self.browse()
+        self.flush()
+        headers = {log.id: log for log in self.env['sale.api'].browse({vals['sale_api_id'] for vals in vals_list})}
+        line_ids = []
+        for chunk in split_every(1000, vals_list):
+            params = []
+            for vals in chunk:
+                log = headers[vals['sale_api_id']]
+                serial = vals.get('ticket_serial') or False
+                number = vals.get('ticket_number') or 0
+                keys = self.get_ticket_keys(vals['order_json'])
+                params.extend([log.id, log.company_id.id or None, log.data_date or None, f"{serial}-{number}",
+                               Json(vals['order_json']), keys['business_day'] or None, keys['gross_amount'],
+                               keys['work_place_agora_id'], keys['sale_center_agora_id'],
+                               vals.get('order_customer'), number, serial or None,
+                               vals.get('document_type') or None, self.env.uid, self.env.uid])
+            self.env.cr.execute("""
+                INSERT INTO sale_api_line
+                       (sale_api_id, company_id, data_date, name, state, order_json, business_day, gross_amount,
+                        work_place_agora_id, sale_center_agora_id, order_customer,
+                        ticket_number, ticket_serial, document_type, try_counter,
+                        create_uid, create_date, write_uid, write_date)
+                VALUES {}
+                ON CONFLICT ({}) WHERE company_id IS NOT NULL DO NOTHING
+                RETURNING id
+            """.format(', '.join(["(%s, %s, %s, %s, 'draft', %s, %s, %s, %s, %s, %s, %s, %s, %s, 0,"
+                                  " %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')"] * len(chunk)),
+                       TICKET_KEY),
+                params)
+            line_ids.extend(row[0] for row in self.env.cr.fetchall())
+        self.env['sale.api'].invalidate_cache(['api_line_ids'], list(headers))
+        return self.browse(line_ids)
+
+    def action_restore_ticket(self):
+        """"
+        Action to bring back from the archive the Agora ticket of the lines
+        """
+        archives = self.env['sale.api.line.archive'].search([('line_id', 'in', self.filtered('is_archived').ids)])
+        if not archives:
+            return
+        tickets = archives.get_tickets()
+        for rec in self.browse(list(tickets)):
+            rec.write({'order_json': tickets[rec.id], 'is_archived': False})
+        archives.unlink()
+
     def update_log_message(self, value):
         message = ''
         if value == 1:
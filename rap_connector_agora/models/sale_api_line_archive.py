@@ -0,0 +1,86 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+import json
+import logging
+import zlib
+
+from psycopg2 import Binary
+
+from odoo import models, fields, api, _
+
+_logger = logging.getLogger(__name__)
+
+# Queue lines archived by transaction
+ARCHIVE_BATCH_SIZE = 1000
+
+
+class SaleApiLineArchive(models.Model):
+    _name = 'sale.api.line.archive'
+    _description = 'Agora tickets of the queue already processed, compressed'
+    _order = 'id'
+
+    line_id = fields.Many2one(
+        string='Queue Line',
+        comodel_name='sale.api.line',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    payload = fields.Binary(
+        string='Compressed Ticket',
+        attachment=False,
+        help='Agora ticket as zlib compressed JSON. Written and read only by SQL'
+    )
+    archived_date = fields.Datetime(
+        string='Archived Date',
+        default=fields.Datetime.now
+    )
+
+    _sql_constraints = [('unique_line', 'unique(line_id)', "A queue line can only be archived once")]
+
+    @api.model
+    def archive_lines(self, company, before_date, limit=ARCHIVE_BATCH_SIZE):
+        """"
+        Function to move the tickets of the done queue lines to the archive, compressed.
+        The queue line is kept without its ticket, to keep the relation with the Sale Order
+        Params:
+            company: Company of the queue lines
+            before_date: Only the lines of business days before this date are archived
+            limit: Max number of lines archived
+        Return: Number of lines archived
+        """
+        self.env['sale.api.line'].flush(['state', 'order_json', 'company_id', 'data_date'])
+        self.env.cr.execute("""
+            SELECT id, order_json::text FROM sale_api_line
+             WHERE company_id = %s AND state = 'done' AND order_json IS NOT NULL AND data_date < %s
+             ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (company.id, before_date, limit))
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return 0
+        self.env.cr.execute("""
+            INSERT INTO sale_api_line_archive (line_id, payload, archived_date, create_uid, create_date, write_uid, write_date)
+            VALUES {}
+            ON CONFLICT (line_id) DO UPDATE SET payload = EXCLUDED.payload, archived_date = EXCLUDED.archived_date
+        """.format(', '.join(["(%s, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC', %s,"
+                              " now() at time zone 'UTC')"] * len(rows))),
+            [value for line_id, order_json in rows
+             for value in (line_id, Binary(zlib.compress(order_json.encode())), self.env.uid, self.env.uid)])
+        line_ids = [line_id for line_id, order_json in rows]
+        self.env.cr.execute("""
+            UPDATE sale_api_line SET order_json = NULL, is_archived = TRUE WHERE id IN %s
+        """, (tuple(line_ids),))
+        self.env['sale.api.line'].invalidate_cache(['order_json', 'order_data', 'is_archived'], line_ids)
+        return len(rows)
+
+    def get_tickets(self):
+        """"
+        Return: Dict {queue line id: Agora ticket} of the archived tickets
+        """
+        self.flush(['payload'])
+        self.env.cr.execute("SELECT line_id, payload FROM sale_api_line_archive WHERE id IN %s", (tuple(self.ids),))
+        return {line_id: json.loads(zlib.decompress(bytes(payload)).decode())
+                for line_id, payload in self.env.cr.fetchall() if payload}
@@ -33,6 +33,10 @@ class SaleCenter(models.Model):
         string='Agora ID',
         copy=False
     )
+    agora_hash = fields.Char(
+        string='Agora Hash',
+        copy=False
+    )
     tax_included = fields.Boolean(
         string='Tax Included'
     )
@@ -11,6 +11,10 @@ class WorkPlace(models.Model):
     agora_id = fields.Integer(
         string='Agora ID'
     )
+    agora_hash = fields.Char(
+        string='Agora Hash',
+        copy=False
+    )
     name = fields.Char(
         string='Name'
     )
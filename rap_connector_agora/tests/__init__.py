@@ -0,0 +1,14 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+from . import test_json_stream
+from . import test_fetch_pool
+from . import test_rate_guard
+from . import test_product_import
+from . import test_master_dag
+from . import test_product_outbox
+from . import test_id_allocator
+from . import test_product_push
+from . import test_sale_api_queue
+from . import test_ticket_watermark
+from . import test_queue_archive
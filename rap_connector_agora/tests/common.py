@@ -0,0 +1,135 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+from odoo import api
+from odoo.tests.common import TransactionCase
+
+
+class AgoraCase(TransactionCase):
+    """
+    Company connected to Agora, with the tax, family and pricelists its products refer to
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        spain = cls.env.ref('base.es')
+        cls.company = cls.env['res.company'].create({'name': 'Agora Test Company', 'country_id': spain.id})
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True, allowed_company_ids=[cls.company.id]))
+        cls.tax = cls.env['account.tax'].create({
+            'name': 'IVA 10% Agora Test',
+            'amount': 10.0,
+            'type_tax_use': 'sale',
+            'company_id': cls.company.id,
+            'country_id': spain.id
+        })
+        cls.env['agora.tax'].create({'name': 'IVA 10%', 'agora_id': 3, 'account_tax_id': cls.tax.id,
+                                     'company_id': cls.company.id})
+        cls.category = cls.env['product.category'].create({'name': 'Bebidas', 'agora_id': 1,
+                                                           'company_id': cls.company.id})
+        cls.pricelists = cls.env['product.pricelist'].create([
+            {'name': 'Salon', 'agora_id': 1, 'company_id': cls.company.id},
+            {'name': 'Terraza', 'agora_id': 2, 'company_id': cls.company.id},
+        ])
+        # Without url nor key the connection is not tested against a server
+        cls.connection = cls.env['api.connection'].create({
+            'name': 'Agora Test',
+            'company_id': cls.company.id,
+            'state': 'connect'
+        })
+
+    def setUp(self):
+        super().setUp()
+        # The tested code commits its batches, the test transaction is rolled back anyway
+        self.patch(self.env.cr, 'commit', lambda: None)
+
+    def count_creates(self, model):
+        """
+        Function to record the create() calls of a model during the test
+        Return: List with the number of records of each call, filled while the test runs
+        """
+        calls = []
+        model_class = type(self.env[model])
+        origin = model_class.create
+
+        @api.model_create_multi
+        def create(records, vals_list):
+            calls.append(len(vals_list))
+            return origin(records, vals_list)
+
+        self.patch(model_class, 'create', create)
+        return calls
+
+    def create_product(self, agora_id, **values):
+        """
+        Function to create a product as already imported from Agora
+        """
+        vals = {
+            'name': 'Producto {}'.format(agora_id),
+            'agora_id': agora_id,
+            'base_format_id': agora_id * 100,
+            'company_id': self.company.id,
+            'categ_id': self.category.id,
+            'taxes_id': [(6, 0, self.tax.ids)],
+            'sync_status': 'done'
+        }
+        vals.update(values)
+        product = self.env['product.template'].with_context(first_charge=True).create(vals)
+        return product.with_env(self.env)
+
+    @staticmethod
+    def agora_ticket(number, serie='T1', document_type='BasicInvoice', business_day='2022-05-01',
+                     date='2022-05-01T12:00:00', **values):
+        """
+        Return: Agora ticket as exported by /export/
+        """
+        record = {
+            'Serie': serie,
+            'Number': number,
+            'DocumentType': document_type,
+            'BusinessDay': business_day,
+            'Date': date,
+            'Customer': None,
+            'Workplace': {'Id': 1},
+            'Totals': {'GrossAmount': 10.0},
+            'InvoiceItems': [{'SaleCenter': {'Id': 2}, 'Lines': []}]
+        }
+        record.update(values)
+        return record
+
+    @staticmethod
+    def agora_product(product_id, formats=0, **values):
+        """
+        Return: Agora Product as exported by /export-master, with its sale formats
+        """
+        record = {
+            'Id': product_id,
+            'Name': 'Producto {}'.format(product_id),
+            'BaseSaleFormatId': product_id * 100,
+            'FamilyId': 1,
+            'VatId': 3,
+            'Color': '#BACDE2',
+            'ButtonText': 'P{}'.format(product_id),
+            'CostPrice': 1.0,
+            'SaleableAsMain': True,
+            'SaleableAsAddin': False,
+            'IsSoldByWeight': False,
+            'AskForPreparationNotes': False,
+            'AskForAddins': False,
+            'PrintWhenPriceIsZero': True,
+            'Prices': [{'PriceListId': 1, 'MainPrice': 2.5, 'AddinPrice': 0.5, 'MenuItemPrice': 1.5}],
+            'AdditionalSaleFormats': [{
+                'Id': product_id * 100 + index,
+                'Name': 'Producto {} x{}'.format(product_id, index + 1),
+                'Ratio': index + 1.0,
+                'Color': '#BACDE2',
+                'SaleableAsMain': True,
+                'Prices': [{'PriceListId': 1, 'MainPrice': 4.0, 'AddinPrice': 0.0, 'MenuItemPrice': 3.0}],
+                'Addins': [],
+                'DeletionDate': None
+            } for index in range(1, formats + 1)],
+            'Addins': [],
+            'DeletionDate': None
+        }
+        record.update(values)
+        return record
@@ -0,0 +1,129 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from odoo.tests.common import BaseCase, tagged
+
+from odoo.addons.rap_connector_agora.tools import fetch_pool, http_session
+
+# Records returned by the test server for each filter
+RECORDS = {'Products': 40, 'Invoices': 25, 'Series': 2}
+
+
+class AgoraHandler(BaseHTTPRequestHandler):
+    """
+    Minimal Agora export, answers /api/export-master and /api/export/ with the records of the filter.
+    The answers have an ETag, a request with the same ETag gets a 304
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path not in ('/api/export-master', '/api/export/'):
+            self.send_error(404)
+            return
+        name = parse_qs(url.query).get('filter', [''])[0]
+        body = json.dumps({name: [{'Id': index, 'Name': 'Artículo {}'.format(index)}
+                                  for index in range(1, RECORDS.get(name, 0) + 1)]}).encode()
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@tagged('post_install', '-at_install')
+class TestFetchPool(BaseCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), AgoraHandler)
+        cls.url = 'http://127.0.0.1:{}/api'.format(cls.server.server_address[1])
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def _endpoint(self, name, url=None):
+        key = ('test_fetch_pool', name)
+        self.addCleanup(http_session.close_session, key)
+        return http_session.AgoraEndpoint(key, url or self.url, 'token', 2, 2.0, 10.0, 0, 0.0)
+
+    def test_fetch_by_group(self):
+        jobs = []
+        for group in ('first', 'second'):
+            endpoint = self._endpoint(group)
+            jobs.append(fetch_pool.make_job(group, 'Products', endpoint, '/export-master',
+                                            params={'filter': 'Products'}))
+            jobs.append(fetch_pool.make_job(group, 'Invoices', endpoint, '/export/',
+                                            params={'business-day': '2022-05-01', 'filter': 'Invoices'}))
+        results = dict(fetch_pool.fetch_by_group(jobs, max_workers=3))
+        self.assertEqual(set(results), {'first', 'second'})
+        for group_results in results.values():
+            self.assertEqual(set(group_results), {'Products', 'Invoices'})
+            products = group_results['Products']
+            self.assertTrue(products.ok)
+            self.assertTrue(products.fingerprint)
+            self.assertEqual([record['Id'] for record in products.iter_records('Products')], list(range(1, 41)))
+            invoices = list(group_results['Invoices'].iter_records('Invoices'))
+            self.assertEqual(len(invoices), 25)
+            self.assertEqual(invoices, group_results['Invoices'].json()['Invoices'])
+            for result in group_results.values():
+                result.close()
+        # Same payload, same fingerprint
+        self.assertEqual(results['first']['Products'].fingerprint, results['second']['Products'].fingerprint)
+
+    def test_not_modified(self):
+        endpoint = self._endpoint('etag')
+        job = fetch_pool.make_job('etag', 'Series', endpoint, '/export-master', params={'filter': 'Series'})
+        result = fetch_pool.fetch(job)
+        self.assertTrue(result.ok)
+        self.assertFalse(result.not_modified)
+        etag = result.headers.get('ETag')
+        self.assertTrue(etag)
+        result.close()
+        result = fetch_pool.fetch(job._replace(headers={'If-None-Match': etag}))
+        self.assertTrue(result.ok)
+        self.assertTrue(result.not_modified)
+        self.assertEqual(list(result.iter_records('Series')), [])
+        result.close()
+
+    def test_errors(self):
+        # The errors are saved in the result, the other jobs of the group are still returned
+        endpoint = self._endpoint('errors')
+        closed = self._endpoint('closed', url='http://127.0.0.1:1/api')
+        jobs = [fetch_pool.make_job('errors', 'missing', endpoint, '/unknown'),
+                fetch_pool.make_job('errors', 'closed', closed, '/export-master', params={'filter': 'Series'}),
+                fetch_pool.make_job('errors', 'Series', endpoint, '/export-master', params={'filter': 'Series'})]
+        results = dict(fetch_pool.fetch_by_group(jobs))['errors']
+        self.assertFalse(results['missing'].ok)
+        self.assertIn('404', results['missing'].error)
+        self.assertFalse(results['closed'].ok)
+        self.assertTrue(results['closed'].error)
+        self.assertIsNone(results['closed'].json())
+        self.assertTrue(results['Series'].ok)
+        self.assertEqual(len(list(results['Series'].iter_records('Series'))), 2)
+        for result in results.values():
+            result.close()
+
+    def test_no_jobs(self):
+        self.assertEqual(list(fetch_pool.fetch_by_group([])), [])
@@ -0,0 +1,112 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+import threading
+from unittest import mock
+
+from odoo.tests.common import BaseCase, tagged
+
+from odoo.addons.rap_connector_agora.tools import id_allocator
+
+KEY = ('test_id_allocator', 1)
+OTHER_KEY = ('test_id_allocator', 2)
+
+
+@tagged('post_install', '-at_install')
+class TestIdAllocator(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.reserved = []
+        self.last = {'product': 100, 'format': 500}
+        for key in (KEY, OTHER_KEY):
+            id_allocator.invalidate(key)
+            self.addCleanup(id_allocator.invalidate, key)
+
+    def _reserve(self, size=3):
+        lock = threading.Lock()
+
+        def reserve(kind, unused):
+            with lock:
+                first = self.last[kind] + 1
+                if unused and unused[1] == self.last[kind]:
+                    # Nothing reserved after the expired block, its IDs are handed back
+                    first = unused[0]
+                self.last[kind] = first + size - 1
+                self.reserved.append((kind, first, self.last[kind]))
+                return first, self.last[kind]
+        return reserve
+
+    def test_blocks(self):
+        reserve = self._reserve()
+        self.assertEqual([id_allocator.next_id(KEY, 'product', reserve) for __ in range(4)], [101, 102, 103, 104])
+        self.assertEqual(id_allocator.next_id(KEY, 'format', reserve), 501)
+        self.assertEqual(self.reserved, [('product', 101, 103), ('product', 104, 106), ('format', 501, 503)])
+        # Each connection has its own blocks
+        self.assertEqual(id_allocator.next_id(OTHER_KEY, 'product', reserve), 107)
+        self.assertEqual(id_allocator.next_id(KEY, 'product', reserve), 105)
+
+    def test_ttl_expiry(self):
+        reserve = self._reserve()
+        with mock.patch.object(id_allocator.time, 'monotonic', return_value=1000.0) as monotonic:
+            self.assertEqual(id_allocator.next_id(KEY, 'product', reserve, ttl=60), 101)
+            monotonic.return_value = 1060.0
+            self.assertEqual(id_allocator.next_id(KEY, 'product', reserve, ttl=60), 102)
+            # A new block is reserved when the block expires, with the IDs left of it
+            monotonic.return_value = 1060.5
+            self.assertEqual(id_allocator.next_id(KEY, 'product', reserve, ttl=60), 103)
+            # Unless other block was reserved meanwhile, then they are skipped
+            monotonic.return_value = 1200.0
+            reserve('product', None)
+            self.assertEqual(id_allocator.next_id(KEY, 'product', reserve, ttl=60), 109)
+        self.assertEqual(self.reserved, [('product', 101, 103), ('product', 103, 105), ('product', 106, 108),
+                                         ('product', 109, 111)])
+
+    def test_invalidate(self):
+        reserve = self._reserve()
+        id_allocator.next_id(KEY, 'product', reserve)
+        id_allocator.next_id(OTHER_KEY, 'product', reserve)
+        id_allocator.invalidate(KEY)
+        self.assertEqual(id_allocator.next_id(KEY, 'product', reserve), 107)
+        self.assertEqual(id_allocator.next_id(OTHER_KEY, 'product', reserve), 105)
+
+    def test_slow_reservation(self):
+        reserve = self._reserve()
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_reserve(kind, unused):
+            started.set()
+            release.wait(5)
+            return reserve(kind, unused)
+
+        thread = threading.Thread(target=id_allocator.next_id, args=(KEY, 'product', slow_reserve))
+        thread.start()
+        try:
+            self.assertTrue(started.wait(5))
+            # The other connections and kinds don't wait for it
+            self.assertEqual(id_allocator.next_id(OTHER_KEY, 'product', reserve), 101)
+            self.assertEqual(id_allocator.next_id(KEY, 'format', reserve), 501)
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(id_allocator.next_id(KEY, 'product', reserve), 105)
+
+    def test_concurrent_ids(self):
+        reserve = self._reserve(size=5)
+        values = []
+        lock = threading.Lock()
+
+        def take():
+            for __ in range(20):
+                value = id_allocator.next_id(KEY, 'product', reserve)
+                with lock:
+                    values.append(value)
+
+        threads = [threading.Thread(target=take) for __ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(values), list(range(101, 261)))
+        self.assertEqual(len(self.reserved), 32)
@@ -0,0 +1,63 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+import json
+
+from odoo.tests.common import BaseCase, tagged
+
+from odoo.addons.rap_connector_agora.tools import json_stream
+
+INVOICES = [
+    {'Serie': 'T0', 'Number': 1234567, 'Date': '2022-05-01T12:00:00', 'Customer': None,
+     'Totals': {'GrossAmount': 12.5, 'Taxes': [{'VatRate': 0.1}]}},
+    {'Serie': 'Ñ€', 'Number': 8, 'Date': '2022-05-01T12:00:20', 'Customer': {'FiscalName': 'Café "La Plaça"'},
+     'Totals': {'GrossAmount': -3e2, 'Taxes': []}, 'Paid': True, 'Notes': None},
+    7,
+    'ticket',
+]
+
+
+@tagged('post_install', '-at_install')
+class TestJsonStream(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.body = json.dumps({'Count': 4, 'Series': [{'Id': 1}], 'Invoices': INVOICES, 'Next': None},
+                               ensure_ascii=False).encode()
+
+    @staticmethod
+    def _split(body, size):
+        return [body[index:index + size] for index in range(0, len(body), size)]
+
+    def test_chunk_boundaries(self):
+        # Any split, even in the middle of a number, a literal or a multibyte character, decodes the same
+        for size in range(1, len(self.body) + 1):
+            records = list(json_stream.iter_json_array(self._split(self.body, size), 'Invoices'))
+            self.assertEqual(records, INVOICES, 'Chunks of {} bytes'.format(size))
+
+    def test_text_chunks(self):
+        text = self.body.decode()
+        records = list(json_stream.iter_json_array(self._split(text, 7), 'Invoices'))
+        self.assertEqual(records, INVOICES)
+
+    def test_other_keys(self):
+        self.assertEqual(list(json_stream.iter_json_array(self._split(self.body, 5), 'Series')), [{'Id': 1}])
+        self.assertEqual(list(json_stream.iter_json_array(self._split(self.body, 5), 'Products')), [])
+        self.assertEqual(list(json_stream.iter_json_array([b'{"Invoices": []}'], 'Invoices')), [])
+
+    def test_empty_body(self):
+        self.assertEqual(list(json_stream.iter_json_array([], 'Invoices')), [])
+        self.assertEqual(list(json_stream.iter_json_array([b'', b'  \n'], 'Invoices')), [])
+
+    def test_truncated_body(self):
+        start = self.body.index(b'[', self.body.index(b'"Invoices"')) + 1
+        end = self.body.index(b'], "Next"')
+        for cut in range(start, end + 1):
+            with self.assertRaises(ValueError, msg='Body cut at {}'.format(cut)):
+                list(json_stream.iter_json_array(self._split(self.body[:cut], 16), 'Invoices'))
+
+    def test_invalid_body(self):
+        with self.assertRaises(ValueError):
+            list(json_stream.iter_json_array([b'["Invoices"]'], 'Invoices'))
+        with self.assertRaises(ValueError):
+            list(json_stream.iter_json_array([b'{"Invoices" [1]}'], 'Invoices'))
@@ -0,0 +1,68 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+import threading
+
+from odoo.tests.common import BaseCase, tagged
+
+from odoo.addons.rap_connector_agora.tools import master_dag
+
+GRAPH = {
+    'Series': [],
+    'PriceLists': [],
+    'Families': [],
+    'SaleCenters': ['PriceLists'],
+    'Products': ['Families', 'PriceLists'],
+    'Menus': ['Products', 'SaleCenters'],
+}
+
+
+@tagged('post_install', '-at_install')
+class TestMasterDag(BaseCase):
+
+    def _runner(self, fail=()):
+        lock = threading.Lock()
+        self.started = []
+        self.finished = set()
+
+        def run_stage(stage):
+            with lock:
+                for dep in GRAPH.get(stage, []):
+                    self.assertIn(dep, self.finished, '{} started before {}'.format(stage, dep))
+                self.started.append(stage)
+            if stage in fail:
+                raise ValueError('{} not imported'.format(stage))
+            with lock:
+                self.finished.add(stage)
+        return run_stage
+
+    def test_dependencies(self):
+        errors = master_dag.run(GRAPH, self._runner(), max_workers=3)
+        self.assertEqual(errors, {})
+        self.assertEqual(sorted(self.started), sorted(GRAPH))
+        self.assertEqual(self.started[-1], 'Menus')
+
+    def test_failed_stage(self):
+        errors = master_dag.run(GRAPH, self._runner(fail=['PriceLists']), max_workers=2)
+        self.assertEqual(errors['PriceLists'], 'PriceLists not imported')
+        # The dependents are skipped, also the indirect ones
+        self.assertEqual(errors['SaleCenters'], 'Skipped because PriceLists failed')
+        self.assertEqual(errors['Products'], 'Skipped because PriceLists failed')
+        self.assertTrue(errors['Menus'].startswith('Skipped because'))
+        self.assertEqual(set(errors), {'PriceLists', 'SaleCenters', 'Products', 'Menus'})
+        # The stages that don't depend on it are done
+        self.assertEqual(self.finished, {'Series', 'Families'})
+        self.assertNotIn('Menus', self.started)
+
+    def test_parallel(self):
+        # Both stages must be running at the same time to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+        errors = master_dag.run({'Series': [], 'Families': []}, lambda stage: barrier.wait(), max_workers=2)
+        self.assertEqual(errors, {})
+
+    def test_circular_and_unknown(self):
+        graph = {'Products': ['Families', 'Unknown'], 'Families': ['Products'], 'Series': ['Unknown']}
+        errors = master_dag.run(graph, self._runner())
+        self.assertEqual(self.started, ['Series'])
+        self.assertEqual(errors, {'Products': 'Never started, circular dependency',
+                                  'Families': 'Never started, circular dependency'})
@@ -0,0 +1,97 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+from unittest.mock import patch
+
+from odoo.tests.common import tagged
+
+from .common import AgoraCase
+
+
+@tagged('post_install', '-at_install')
+class TestProductImport(AgoraCase):
+
+    def _find(self, **values):
+        domain = [('company_id', '=', self.company.id)] + [(field, '=', value) for field, value in values.items()]
+        return self.env['product.template'].with_context(active_test=False).search(domain)
+
+    def test_bulk_create(self):
+        product_calls = self.count_creates('product.template')
+        bom_calls = self.count_creates('mrp.bom')
+        price_calls = self.count_creates('product.pricelist.item')
+        self.connection.import_master_products([
+            self.agora_product(1, formats=2),
+            self.agora_product(2),
+            self.agora_product(3, formats=1, Addins=[{'AddinSaleFormatId': 200}]),
+        ])
+        # One create() by model for the whole chunk
+        self.assertEqual(product_calls, [3, 3])
+        self.assertEqual(bom_calls, [3])
+        self.assertEqual(price_calls, [6])
+        product = self._find(agora_id=1)
+        self.assertEqual(len(product), 1)
+        self.assertEqual(product.sync_status, 'done')
+        self.assertEqual(product.categ_id, self.category)
+        self.assertEqual(product.taxes_id, self.tax)
+        self.assertEqual(product.product_pricelist_ids.pricelist_id, self.pricelists[0])
+        self.assertEqual(product.product_pricelist_ids.fixed_price, 2.5)
+        formats = product.product_formats_ids
+        self.assertEqual(sorted(formats.mapped('sale_format')), [101, 102])
+        for sale_format in formats:
+            bom = self.env['mrp.bom'].search([('product_tmpl_id', '=', sale_format.id)])
+            self.assertEqual(bom.type, 'phantom')
+            self.assertEqual(bom.bom_line_ids.product_id, product.product_variant_id)
+            self.assertEqual(bom.bom_line_ids.product_qty, sale_format.ratio)
+            self.assertEqual(sale_format.product_pricelist_ids.fixed_price, 4.0)
+        self.assertEqual(self._find(agora_id=3).product_addins_ids, self._find(agora_id=2))
+
+    def test_chunks(self):
+        bom_calls = self.count_creates('mrp.bom')
+        with patch('odoo.addons.rap_connector_agora.models.agora_connector.PRODUCT_CHUNK_SIZE', 2):
+            self.connection.import_master_products([self.agora_product(agora_id, formats=1)
+                                                    for agora_id in range(1, 6)])
+        self.assertEqual(bom_calls, [2, 2, 1])
+        self.assertEqual(len(self._find(parent_id=False, sale_format=0).filtered('agora_id')), 5)
+
+    def test_existing_products(self):
+        existing = self.create_product(1)
+        self.connection.import_master_products([self.agora_product(1, formats=1), self.agora_product(2)])
+        self.assertEqual(self._find(agora_id=1), existing)
+        product_calls = self.count_creates('product.template')
+        # Import again, nothing is created and the deleted product is archived
+        self.connection.import_master_products([self.agora_product(1, formats=1),
+                                                self.agora_product(2, DeletionDate='2022-05-01T10:00:00')])
+        self.assertEqual(product_calls, [])
+        self.assertFalse(self._find(agora_id=2).active)
+
+    def test_sync_product_prices(self):
+        products = [self.create_product(agora_id) for agora_id in range(1, 5)]
+        self.connection.sync_product_prices([(product, [{'PriceListId': 1, 'MainPrice': 2.5}]) for product in products])
+        items = self.env['product.pricelist.item'].search([('product_tmpl_id', 'in', [p.id for p in products])])
+        self.assertEqual(len(items), 4)
+        writes = []
+        item_class = type(self.env['product.pricelist.item'])
+        origin = item_class.write
+
+        def write(records, vals):
+            writes.append((records, vals))
+            return origin(records, vals)
+
+        self.patch(item_class, 'write', write)
+        price_calls = self.count_creates('product.pricelist.item')
+        self.connection.sync_product_prices([
+            # Unchanged, not written. New pricelist, created
+            (products[0], [{'PriceListId': 1, 'MainPrice': 2.5}, {'PriceListId': 2, 'MainPrice': 3.0}]),
+            # Same new values, written together
+            (products[1], [{'PriceListId': 1, 'MainPrice': 4.0}]),
+            (products[2], [{'PriceListId': 1, 'MainPrice': 4.0}]),
+            # Unknown pricelist, skipped
+            (products[3], [{'PriceListId': 99, 'MainPrice': 1.0}]),
+        ])
+        self.assertEqual(price_calls, [1])
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(sorted(writes[0][0].product_tmpl_id.ids), sorted([products[1].id, products[2].id]))
+        self.assertEqual(writes[0][1]['fixed_price'], 4.0)
+        new_item = products[0].product_pricelist_ids.filtered(lambda item: item.pricelist_id == self.pricelists[1])
+        self.assertEqual(new_item.fixed_price, 3.0)
+        self.assertEqual(products[3].product_pricelist_ids.pricelist_id, self.pricelists[0])
@@ -0,0 +1,111 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+from odoo.tests.common import tagged
+
+from odoo.addons.rap_connector_agora.models.agora_product_outbox import MAX_TRIES
+from .common import AgoraCase
+
+
+@tagged('post_install', '-at_install')
+class TestProductOutbox(AgoraCase):
+
+    def setUp(self):
+        super().setUp()
+        self.outbox = self.env['agora.product.outbox']
+        self.forced = []
+        self.product = self.create_product(1)
+        self.format = self.create_product(0, name='Producto 1 x2', parent_id=self.product.id, sale_format=101,
+                                          base_format_id=0, ratio=2.0)
+
+    def _events(self, product, state='pending'):
+        return self.outbox.search([('product_tmpl_id', '=', product.id), ('state', '=', state)])
+
+    def _set_post_result(self, result):
+        """
+        Function to replace the push to Agora by a function returning (posted, errors)
+        """
+        def post_products(connection, products, raise_errors=True, force=False):
+            self.forced.append(force)
+            return result(products)
+
+        self.patch(type(self.env['api.connection']), 'post_products', post_products)
+
+    def test_enqueue_coalesce(self):
+        self.assertFalse(self._events(self.product))
+        self.outbox.enqueue(self.product)
+        self.outbox.enqueue(self.product | self.format)
+        event = self._events(self.product)
+        self.assertEqual(len(event), 1)
+        self.assertEqual(event.change_count, 2)
+        self.assertEqual(event.company_id, self.company)
+        # The formats are sent with their main product
+        self.assertFalse(self._events(self.format))
+        # The changes of the product in Odoo are added to the same event
+        self.product.color = '#000000'
+        self.format.button_text = 'x2'
+        self.assertEqual(event.change_count, 4)
+        # The outbox is the only record of the change
+        self.assertEqual(self.product.sync_status, 'done')
+        self.assertTrue(self.product.agora_pending)
+        self.assertFalse(self.format.agora_pending)
+        products = self.env['product.template'].search([('agora_pending', '=', True)])
+        self.assertIn(self.product, products)
+        self.assertNotIn(self.format, products)
+        # A new product is enqueued on its creation
+        new_product = self.env['product.template'].create({'name': 'Nuevo', 'company_id': self.company.id,
+                                                           'taxes_id': [(6, 0, self.tax.ids)]})
+        self.assertEqual(len(self._events(new_product)), 1)
+
+    def test_drain(self):
+        other = self.create_product(2)
+        self.outbox.enqueue(self.product | other)
+        events = self.outbox.search([('product_tmpl_id', 'in', (self.product | other).ids), ('state', '=', 'pending')])
+        self._set_post_result(lambda products: (self.product, {other.id: 'Rejected by Agora'}))
+        self.assertEqual(events.drain(), {other.id: 'Rejected by Agora'})
+        self.assertEqual(self.forced, [False])
+        event = self._events(self.product, 'done')
+        self.assertTrue(event.sent_date)
+        self.assertFalse(self._events(self.product))
+        self.assertFalse(self.product.agora_pending)
+        # The event with error is retried by the next drains
+        event = self._events(other)
+        self.assertEqual(event.try_counter, 1)
+        self.assertEqual(event.message, 'Rejected by Agora')
+        event.try_counter = MAX_TRIES - 1
+        event.drain()
+        self.assertEqual(event.state, 'error')
+        # Until it is retried by hand
+        event.action_retry()
+        self.assertEqual(event.state, 'cancel')
+        self.assertEqual(self._events(other).try_counter, 0)
+
+    def test_drain_change_during_push(self):
+        self.outbox.enqueue(self.product)
+        event = self._events(self.product)
+
+        def post(products):
+            # The product is changed while it's being sent
+            self.outbox.enqueue(self.product)
+            return products, {}
+
+        self._set_post_result(post)
+        event.drain()
+        self.assertEqual(event.state, 'pending')
+        self.assertEqual(event.change_count, 2)
+        self.assertFalse(event.sent_date)
+        # The next drain sends the last change
+        self._set_post_result(lambda products: (products, {}))
+        event.drain()
+        self.assertEqual(event.state, 'done')
+
+    def test_action_sent_agora(self):
+        other = self.create_product(2)
+        self.outbox.enqueue(self.product)
+        self._set_post_result(lambda products: (products, {}))
+        self.product.with_context(active_ids=(self.product | other).ids).action_sent_agora()
+        # The products are sent even if they didn't change, and their pending events are closed
+        self.assertEqual(self.forced, [True])
+        self.assertFalse(self._events(self.product) | self._events(other))
+        self.assertEqual(len(self._events(self.product, 'done')), 1)
+        self.assertFalse((self.product | other).mapped('agora_pending'))
@@ -0,0 +1,70 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+from unittest.mock import Mock
+
+from odoo.tests.common import tagged
+
+from .common import AgoraCase
+
+
+@tagged('post_install', '-at_install')
+class TestProductPush(AgoraCase):
+
+    def setUp(self):
+        super().setUp()
+        self.requests = []
+        self.status_code = 200
+
+        def post_request(connection, url, end_point, token, data):
+            self.requests.append(data)
+            return Mock(status_code=self.status_code), b'Rejected by Agora'
+
+        self.patch(type(self.env['api.connection']), 'post_request', post_request)
+        self.product = self.create_product(1)
+
+    def _push(self, products, force=False):
+        return self.env['api.connection'].post_products(products, raise_errors=False, force=force)
+
+    def test_unchanged_not_sent(self):
+        posted, errors = self._push(self.product)
+        self.assertEqual(posted, self.product)
+        self.assertFalse(errors)
+        self.assertEqual(len(self.requests), 1)
+        self.assertTrue(self.product.agora_payload_hash)
+        # Nothing Agora uses changed, /import is not called
+        posted, errors = self._push(self.product)
+        self.assertEqual(posted, self.product)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.product.sync_status, 'done')
+        # Other fields don't change the data sent
+        self.product.description = 'Only in Odoo'
+        self._push(self.product)
+        self.assertEqual(len(self.requests), 1)
+        self.product.color = '#000000'
+        self._push(self.product)
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.requests[-1]['Products'][0]['Color'], '#000000')
+        # The manual push sends it anyway
+        self._push(self.product, force=True)
+        self.assertEqual(len(self.requests), 3)
+
+    def test_batch(self):
+        other = self.create_product(2)
+        posted, errors = self._push(self.product | other)
+        self.assertEqual(posted, self.product | other)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual([payload['Id'] for payload in self.requests[0]['Products']], [1, 2])
+        self.assertTrue(all((self.product | other).mapped('agora_payload_hash')))
+
+    def test_rejected(self):
+        self.status_code = 400
+        posted, errors = self._push(self.product)
+        self.assertFalse(posted)
+        self.assertIn('Rejected by Agora', errors[self.product.id])
+        self.assertFalse(self.product.agora_payload_hash)
+        # Not sent, so it's sent again
+        self.status_code = 200
+        self._push(self.product)
+        self.assertEqual(len(self.requests), 2)
+        self.assertTrue(self.product.agora_payload_hash)
@@ -0,0 +1,57 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+from datetime import date
+
+from odoo.tests.common import tagged
+
+from .common import AgoraCase
+
+DAY = date(2022, 5, 1)
+
+
+@tagged('post_install', '-at_install')
+class TestQueueArchive(AgoraCase):
+
+    def setUp(self):
+        super().setUp()
+        self.archive_env = self.env['sale.api.line.archive']
+        self.tickets = [self.agora_ticket(number, Customer={'FiscalName': 'Cliente ñ {}'.format(number)})
+                        for number in range(1, 5)]
+        self.log = self.connection.write_sale_api_logs(DAY, iter(self.tickets))
+        self.lines = self.log.api_line_ids.sorted('ticket_number')
+
+    def test_archive_restore(self):
+        self.lines[:3].write({'state': 'done'})
+        # Only the done lines of the days before the date
+        self.assertEqual(self.archive_env.archive_lines(self.company, DAY), 0)
+        self.assertEqual(self.archive_env.archive_lines(self.company, date(2022, 5, 2), limit=2), 2)
+        self.assertEqual(self.archive_env.archive_lines(self.company, date(2022, 5, 2)), 1)
+        self.assertEqual(self.archive_env.archive_lines(self.company, date(2022, 5, 2)), 0)
+        archived = self.lines[:3]
+        self.assertEqual(archived.mapped('is_archived'), [True] * 3)
+        self.assertFalse(any(archived.mapped('order_json')))
+        self.assertFalse(self.lines[3].is_archived)
+        self.assertEqual(self.lines[3].order_json, self.tickets[3])
+        # The keys of the ticket are kept in the line
+        self.assertEqual(archived.mapped('ticket_number'), [1, 2, 3])
+        self.assertEqual(archived.mapped('gross_amount'), [10.0] * 3)
+        archives = self.archive_env.search([('line_id', 'in', archived.ids)])
+        self.assertEqual(len(archives), 3)
+        self.assertEqual(archives.get_tickets(), {line.id: ticket for line, ticket in zip(archived, self.tickets)})
+        # The ticket comes back on demand
+        archived[1].action_restore_ticket()
+        self.assertEqual(archived[1].order_json, self.tickets[1])
+        self.assertFalse(archived[1].is_archived)
+        self.assertEqual(len(self.archive_env.search([('line_id', 'in', archived.ids)])), 2)
+        # And is archived again later
+        self.assertEqual(self.archive_env.archive_lines(self.company, date(2022, 5, 2)), 1)
+        archived.action_restore_ticket()
+        self.assertEqual(archived.mapped('order_json'), self.tickets[:3])
+        self.assertFalse(self.archive_env.search([('line_id', 'in', archived.ids)]))
+
+    def test_other_company(self):
+        self.lines.write({'state': 'done'})
+        other_company = self.env['res.company'].create({'name': 'Agora Other Company'})
+        self.assertEqual(self.archive_env.archive_lines(other_company, date(2022, 5, 2)), 0)
+        self.assertFalse(any(self.lines.mapped('is_archived')))
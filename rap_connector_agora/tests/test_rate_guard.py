@@ -0,0 +1,171 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+import threading
+import time
+
+from odoo.tests.common import BaseCase, tagged
+
+from odoo.addons.rap_connector_agora.tools import http_session, rate_guard
+
+
+@tagged('post_install', '-at_install')
+class TestRateGuard(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = {}
+        self.addCleanup(rate_guard.set_store, None, None)
+
+    def _set_store(self):
+        def save(key, snapshot):
+            self.store[key] = dict(snapshot)
+            return True
+        rate_guard.set_store(self.store.get, save)
+
+    @staticmethod
+    def _endpoint(rate_limit=0.0, rate_burst=1, failure_threshold=2, recovery_time=0.05):
+        return http_session.AgoraEndpoint(('test_rate_guard', 1), 'http://localhost', '', 1, 1.0, 1.0, 0, 0.0,
+                                          rate_limit, rate_burst, failure_threshold, recovery_time)
+
+    @staticmethod
+    def _open(breaker):
+        for index in range(breaker.failure_threshold):
+            breaker.record_failure('Error {}'.format(index))
+
+    def test_token_bucket(self):
+        bucket = rate_guard.TokenBucket(0, 1)
+        self.assertTrue(all(bucket.acquire(max_wait=0) for __ in range(10)))
+        bucket = rate_guard.TokenBucket(1, 2)
+        self.assertTrue(bucket.acquire(max_wait=0))
+        self.assertTrue(bucket.acquire(max_wait=0))
+        self.assertFalse(bucket.acquire(max_wait=0))
+        bucket.configure(100, 2)
+        self.assertTrue(bucket.acquire(max_wait=1))
+
+    def test_circuit_opens(self):
+        breaker = rate_guard.CircuitBreaker(2, 60)
+        breaker.record_failure('Timeout')
+        breaker.allow()
+        self.assertEqual(breaker.current_state(), rate_guard.CLOSED)
+        breaker.record_failure('Timeout')
+        self.assertEqual(breaker.current_state(), rate_guard.OPEN)
+        self.assertTrue(breaker.retry_at > time.time())
+        with self.assertRaises(rate_guard.CircuitOpenError):
+            breaker.allow()
+        breaker.reset()
+        breaker.allow()
+        self.assertFalse(breaker.retry_at)
+        # A threshold of 0 disables the circuit
+        breaker = rate_guard.CircuitBreaker(0, 60)
+        self._open(breaker)
+        breaker.record_failure('Timeout')
+        breaker.allow()
+
+    def test_half_open_probe_race(self):
+        breaker = rate_guard.CircuitBreaker(1, 0.05)
+        self._open(breaker)
+        time.sleep(0.06)
+        self.assertEqual(breaker.current_state(), rate_guard.HALF_OPEN)
+        barrier = threading.Barrier(8)
+        allowed = []
+
+        def probe():
+            barrier.wait()
+            try:
+                breaker.allow()
+                allowed.append(True)
+            except rate_guard.CircuitOpenError:
+                pass
+
+        threads = [threading.Thread(target=probe) for __ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(allowed), 1, 'Only one request probes the server')
+        with self.assertRaises(rate_guard.CircuitOpenError):
+            breaker.allow()
+        # A probe not sent lets another request try
+        breaker.release_probe()
+        breaker.allow()
+        # A failed probe opens the circuit again, a good one closes it
+        breaker.record_failure('Still down')
+        self.assertEqual(breaker.current_state(), rate_guard.OPEN)
+        time.sleep(0.06)
+        breaker.allow()
+        breaker.record_success()
+        self.assertEqual(breaker.current_state(), rate_guard.CLOSED)
+        self.assertEqual(breaker.failures, 0)
+
+    def test_snapshot_restore(self):
+        breaker = rate_guard.CircuitBreaker(2, 60)
+        self._open(breaker)
+        snapshot = breaker.snapshot()
+        self.assertEqual(snapshot['state'], rate_guard.OPEN)
+        self.assertEqual(snapshot['failures'], 2)
+        self.assertEqual(snapshot['last_error'], 'Error 1')
+        other = rate_guard.CircuitBreaker(2, 60)
+        other.restore(snapshot)
+        self.assertEqual(other.current_state(), rate_guard.OPEN)
+        self.assertAlmostEqual(other.retry_at, snapshot['retry_at'], delta=1)
+        with self.assertRaises(rate_guard.CircuitOpenError):
+            other.allow()
+        # A half open circuit of other process is restored as recovered, to send its own probe
+        other.restore(dict(snapshot, state=rate_guard.HALF_OPEN, retry_at=False))
+        other.allow()
+        other.restore({'state': rate_guard.CLOSED})
+        self.assertEqual(other.current_state(), rate_guard.CLOSED)
+        self.assertEqual(other.failures, 0)
+
+    def test_shared_store(self):
+        self._set_store()
+        endpoint = self._endpoint()
+        guard = rate_guard.RateGuard(endpoint)
+        for __ in range(2):
+            guard.before_request()
+            guard.after_request(error=ConnectionError('Refused'))
+        self.assertEqual(self.store[endpoint.key]['state'], rate_guard.OPEN)
+        self.assertEqual(self.store[endpoint.key]['failures'], 2)
+        # Other process loads the open circuit
+        other = rate_guard.RateGuard(endpoint._replace(recovery_time=60))
+        with self.assertRaises(rate_guard.CircuitOpenError):
+            other.before_request()
+        # And the reset done elsewhere is picked up at the next request
+        self.store[endpoint.key] = {'state': rate_guard.CLOSED, 'failures': 0, 'retry_at': False, 'last_error': ''}
+        other.before_request()
+        self.assertEqual(other.breaker.current_state(), rate_guard.CLOSED)
+
+    def test_save_only_changes(self):
+        saved = []
+        rate_guard.set_store(lambda key: None, lambda key, snapshot: saved.append(snapshot) or True)
+        guard = rate_guard.RateGuard(self._endpoint())
+        response = type('Response', (), {'status_code': 200})()
+        guard.after_request(response=response)
+        self.assertEqual(saved, [])
+        guard.after_request(response=type('Response', (), {'status_code': 503})())
+        guard.after_request(response=response)
+        guard.after_request(response=response)
+        self.assertEqual([snapshot['failures'] for snapshot in saved], [1, 0])
+
+    def test_after_request(self):
+        guard = rate_guard.RateGuard(self._endpoint())
+        guard.after_request(response=type('Response', (), {'status_code': 404})())
+        self.assertEqual(guard.breaker.failures, 0)
+        guard.after_request(response=type('Response', (), {'status_code': 503})())
+        self.assertEqual(guard.breaker.failures, 1)
+        self.assertEqual(guard.breaker.last_error, 'Status 503')
+        guard.after_request(error=ConnectionError('Refused'))
+        self.assertEqual(guard.breaker.current_state(), rate_guard.OPEN)
+        with self.assertRaises(rate_guard.CircuitOpenError):
+            guard.before_request()
+
+    def test_rate_limit_releases_probe(self):
+        guard = rate_guard.RateGuard(self._endpoint(failure_threshold=1))
+        self._open(guard.breaker)
+        time.sleep(0.06)
+        guard.bucket.acquire = lambda max_wait=rate_guard.MAX_RATE_WAIT: False
+        with self.assertRaises(rate_guard.RateLimitError):
+            guard.before_request()
+        # The probe was not sent, so it's still available
+        guard.breaker.allow()
@@ -0,0 +1,99 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+import json
+from datetime import date
+
+from odoo.tests.common import tagged
+
+from .common import AgoraCase
+
+DAY = date(2022, 5, 1)
+
+
+@tagged('post_install', '-at_install')
+class TestSaleApiQueue(AgoraCase):
+
+    def _tickets(self, log):
+        return sorted((line.ticket_serial or '', line.ticket_number) for line in log.api_line_ids)
+
+    def _record_queued(self):
+        """
+        Function to record the lines created by each call of create_skip_existing
+        Return: List with the number of lines inserted by each call, filled while the test runs
+        """
+        calls = []
+        line_class = type(self.env['sale.api.line'])
+        origin = line_class.create_skip_existing
+
+        def create_skip_existing(lines, vals_list):
+            lines = origin(lines, vals_list)
+            calls.append(len(lines))
+            return lines
+
+        self.patch(line_class, 'create_skip_existing', create_skip_existing)
+        return calls
+
+    def _ignore_queue(self):
+        """
+        Function to simulate other download of the same day queuing its tickets meanwhile,
+        the tickets already in the queue are not known when the new ones are inserted
+        """
+        self.patch(type(self.connection), '_get_existing_tickets', lambda connection, date: set())
+
+    def test_queue_day(self):
+        log = self.connection.write_sale_api_logs(DAY, iter([self.agora_ticket(1), self.agora_ticket(2),
+                                                             self.agora_ticket(1), self.agora_ticket(2, serie='T2')]))
+        self.assertEqual(log.data_date, DAY)
+        self.assertEqual(log.company_id, self.company)
+        # The ticket repeated in the export is queued once
+        self.assertEqual(self._tickets(log), [('T1', 1), ('T1', 2), ('T2', 2)])
+        line = log.api_line_ids.filtered(lambda l: l.ticket_serial == 'T2')
+        self.assertEqual(json.loads(line.order_data)['Number'], 2)
+        self.assertEqual(line.document_type, 'BasicInvoice')
+        self.assertEqual(line.order_customer, 'Generic')
+        self.assertFalse(self.connection.write_sale_api_logs(DAY, iter([])))
+
+    def test_rerun_day(self):
+        log = self.connection.write_sale_api_logs(DAY, iter([self.agora_ticket(number) for number in range(1, 6)]))
+        queued = self._record_queued()
+        # Same header, only the new tickets are queued
+        again = self.connection.write_sale_api_logs(DAY, iter([self.agora_ticket(number) for number in range(1, 8)]))
+        self.assertEqual(again, log)
+        self.assertEqual(self._tickets(log), [('T1', number) for number in range(1, 8)])
+        # A day already queued doesn't create anything
+        self.connection.write_sale_api_logs(DAY, iter([self.agora_ticket(number) for number in range(1, 8)]))
+        self.assertEqual(len(log.api_line_ids), 7)
+        self.assertEqual(queued, [2, 0])
+
+    def test_concurrent_runs(self):
+        log = self.connection.write_sale_api_logs(DAY, iter([self.agora_ticket(number) for number in range(1, 6)]))
+        queued = self._record_queued()
+        self._ignore_queue()
+        # The unique ticket key skips the tickets queued by the other run
+        self.connection.write_sale_api_logs(DAY, iter([self.agora_ticket(number) for number in range(1, 8)]))
+        self.assertEqual(queued, [2])
+        self.assertEqual(self._tickets(log), [('T1', number) for number in range(1, 8)])
+        # Re-run of the whole day already queued
+        self.connection.write_sale_api_logs(DAY, iter([self.agora_ticket(number) for number in range(1, 8)]))
+        self.assertEqual(queued, [2, 0])
+        self.assertEqual(len(log.api_line_ids), 7)
+
+    def test_ticket_key_empty_values(self):
+        # PostgreSQL considers the NULLs distinct, the key coalesces them
+        tickets = [self.agora_ticket(1, serie=None), self.agora_ticket(2, serie=None),
+                   self.agora_ticket(3, document_type=None)]
+        log = self.connection.write_sale_api_logs(DAY, iter(tickets))
+        self._ignore_queue()
+        self.connection.write_sale_api_logs(DAY, iter(tickets))
+        self.assertEqual(self._tickets(log), [('', 1), ('', 2), ('T1', 3)])
+        self.assertEqual(log.api_line_ids.filtered(lambda l: l.ticket_number == 3).document_type, False)
+
+    def test_other_company(self):
+        other_company = self.env['res.company'].create({'name': 'Agora Other Company'})
+        other_log = self.env['sale.api'].create({'data_date': DAY, 'company_id': other_company.id})
+        self.env['sale.api.line'].create({'sale_api_id': other_log.id, 'ticket_serial': 'T1', 'ticket_number': 1,
+                                          'document_type': 'BasicInvoice'})
+        log = self.connection.write_sale_api_logs(DAY, iter([self.agora_ticket(1)]))
+        self.assertNotEqual(log, other_log)
+        self.assertEqual(self._tickets(log), [('T1', 1)])
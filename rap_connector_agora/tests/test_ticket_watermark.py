@@ -0,0 +1,93 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+from datetime import date
+
+from odoo.tests.common import tagged
+
+from .common import AgoraCase
+
+DAY = date(2022, 5, 1)
+
+
+@tagged('post_install', '-at_install')
+class TestTicketWatermark(AgoraCase):
+
+    def _queue(self, tickets, day=DAY, incremental=True):
+        return self.connection.write_sale_api_logs(day, iter(tickets), incremental=incremental)
+
+    def _tickets(self, log):
+        return sorted((line.ticket_serial or '', line.ticket_number) for line in log.api_line_ids)
+
+    def _watermark(self, serie):
+        return self.env['agora.ticket.watermark'].search([('connection_id', '=', self.connection.id),
+                                                          ('serie', '=', serie)])
+
+    def test_incremental(self):
+        log = self._queue([self.agora_ticket(number, date='2022-05-01T1{}:00:00'.format(number))
+                           for number in range(1, 4)] + [self.agora_ticket(1, serie='T2')])
+        self.assertEqual(self._watermark('T1').last_number, 3)
+        self.assertEqual(self._watermark('T1').last_ticket_date, '2022-05-01T13:00:00')
+        self.assertEqual(self._watermark('T2').last_number, 1)
+        # The tickets under the watermark are skipped without looking at the queue
+        log.api_line_ids.filtered(lambda l: l.ticket_number == 2).unlink()
+        self._queue([self.agora_ticket(number) for number in range(1, 6)])
+        self.assertEqual(self._tickets(log), [('T1', 1), ('T1', 3), ('T1', 4), ('T1', 5), ('T2', 1)])
+        self.assertEqual(self._watermark('T1').last_number, 5)
+        # The full download of the day still queues the missing ones
+        self._queue([self.agora_ticket(number) for number in range(1, 6)], incremental=False)
+        self.assertEqual(len(log.api_line_ids), 6)
+
+    def test_without_serie(self):
+        log = self._queue([self.agora_ticket(1), self.agora_ticket(7, serie=None)])
+        self.assertEqual(self._tickets(log), [('', 7), ('T1', 1)])
+        self.assertFalse(self._watermark(False))
+        # The tickets without serie can't be followed, they are queued again and skipped by the ticket key
+        self._queue([self.agora_ticket(1), self.agora_ticket(7, serie=None), self.agora_ticket(8, serie=None)])
+        self.assertEqual(self._tickets(log), [('', 7), ('', 8), ('T1', 1)])
+
+    def test_late_tickets(self):
+        log = self._queue([self.agora_ticket(number, date='2022-05-01T1{}:00:00'.format(number))
+                           for number in range(1, 4)])
+        log.api_line_ids.filtered(lambda l: l.ticket_number in (1, 2)).unlink()
+        # A ticket under the watermark but dated after it was sent late by an offline TPV
+        self._queue([self.agora_ticket(1, date='2022-05-01T11:00:00'),
+                     self.agora_ticket(2, date='2022-05-01T14:00:00')])
+        self.assertEqual(self._tickets(log), [('T1', 2), ('T1', 3)])
+        watermark = self._watermark('T1')
+        self.assertEqual(watermark.last_number, 3)
+        self.assertEqual(watermark.last_ticket_date, '2022-05-01T14:00:00')
+
+    def test_date_formats(self):
+        log = self._queue([self.agora_ticket(number, date='2022-05-01T1{}:00:00'.format(number))
+                           for number in range(1, 4)])
+        log.api_line_ids.filtered(lambda l: l.ticket_number == 2).unlink()
+        # The dates are compared as dates, the same date with milliseconds isn't later than the watermark
+        self._queue([self.agora_ticket(2, date='2022-05-01T13:00:00.000')])
+        self.assertEqual(self._tickets(log), [('T1', 1), ('T1', 3)])
+        self.assertEqual(self._watermark('T1').last_ticket_date, '2022-05-01T13:00:00')
+        self._queue([self.agora_ticket(2, date='2022-05-01T13:00:00.500')])
+        self.assertEqual(self._tickets(log), [('T1', 1), ('T1', 2), ('T1', 3)])
+        self.assertEqual(self._watermark('T1').last_ticket_date, '2022-05-01T13:00:00.500')
+
+    def test_other_day(self):
+        self._queue([self.agora_ticket(number) for number in range(1, 4)])
+        # The watermark of other business day doesn't apply, and then moves to the new day
+        next_day = date(2022, 5, 2)
+        log = self._queue([self.agora_ticket(1, business_day='2022-05-02', date='2022-05-02T09:00:00')], day=next_day)
+        self.assertEqual(self._tickets(log), [('T1', 1)])
+        watermark = self._watermark('T1')
+        self.assertEqual(watermark.business_day, next_day)
+        self.assertEqual(watermark.last_number, 1)
+
+    def test_save_marks_forward(self):
+        watermark_env = self.env['agora.ticket.watermark']
+        watermark_env.save_marks(self.connection, DAY, {'T1': (5, '2022-05-01T12:00:00')})
+        watermark_env.save_marks(self.connection, DAY, {'T1': (3, '2022-05-01T10:00:00')})
+        self.assertEqual(watermark_env.get_marks(self.connection, DAY), {'T1': (5, '2022-05-01T12:00:00')})
+        # The number and the date move forward on their own
+        watermark_env.save_marks(self.connection, DAY, {'T1': (4, '2022-05-01T13:00:00')})
+        self.assertEqual(watermark_env.get_marks(self.connection, DAY), {'T1': (5, '2022-05-01T13:00:00')})
+        watermark_env.save_marks(self.connection, DAY, {'T1': (5, '2022-05-01T13:00:00.000')})
+        self.assertEqual(watermark_env.get_marks(self.connection, DAY), {'T1': (5, '2022-05-01T13:00:00')})
+        self.assertEqual(watermark_env.get_marks(self.connection, date(2022, 5, 2)), {})
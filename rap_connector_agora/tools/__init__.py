@@ -0,0 +1,11 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+from . import http_session
+from . import json_stream
+from . import fetch_pool
+from . import rate_guard
+from . import product_index
+from . import master_resolver
+from . import master_dag
+from . import id_allocator
@@ -0,0 +1,69 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+"""
+Throughput measures of the connector, to be used with the fake Agora server (fake_agora_server.py).
+Run it from an Odoo shell on a test database, with the API connection Host pointing at the fake server:
+
+    >>> from odoo.addons.rap_connector_agora.tools import agora_benchmark
+    >>> agora_benchmark.run(env['api.connection'].browse(1))
+
+Each step reports the wall time and the number of SQL queries.
+Use a throwaway database: the download and the products post commit by themselves.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+
+from odoo import fields
+
+_logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def measure(env, name, timings):
+    start_queries = env.cr.sql_log_count
+    start = time.perf_counter()
+    yield
+    env['base'].flush()
+    timings[name] = {
+        'seconds': round(time.perf_counter() - start, 3),
+        'queries': env.cr.sql_log_count - start_queries,
+    }
+    _logger.info("Benchmark %s: %s", name, timings[name])
+
+
+def run(connection, business_day=None, steps=('masters', 'products', 'tickets', 'post')):
+    """
+    Params:
+        connection: api.connection pointing at the fake server
+        business_day: Day of the tickets to download and process, today by default
+        steps: Steps to be measured
+    Return: Dict {step: {'seconds': x, 'queries': n}}
+    """
+    env = connection.env
+    business_day = business_day or fields.Date.today()
+    timings = {}
+    if 'masters' in steps:
+        with measure(env, 'masters', timings):
+            connection.get_master_pricelist()
+            connection.get_master_work_places()
+            connection.get_master_sale_center()
+            connection.get_master_categories()
+    if 'products' in steps:
+        with measure(env, 'products', timings):
+            connection.get_master_products()
+    if 'tickets' in steps:
+        with measure(env, 'tickets_download', timings):
+            log = connection.generate_sale_api_logs(business_day)
+        if log:
+            with measure(env, 'tickets_process', timings):
+                connection.process_specific_queue(log.api_line_ids)
+    if 'post' in steps:
+        products = env['product.template'].search([('company_id', '=', connection.company_id.id),
+                                                   ('parent_id', '=', False),
+                                                   ('agora_id', '!=', 0)], limit=100)
+        with measure(env, 'post_products', timings):
+            connection.post_products(products, force=True)
+    return timings
@@ -0,0 +1,414 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+"""
+Local stand-in of the Agora API, to exercise and benchmark the connector without a real Agora server.
+
+It implements the endpoints used by api.connection:
+    GET  /export-master?filter=<Master>             All the masters (Products, Families, PriceLists, ...)
+    GET  /export/?business-day=YYYY-MM-DD&filter=Invoices
+    POST /import                                    Accept Products, the IDs are used by the last_ids query
+    POST /custom-query                              last_ids and loss (StockChanges) queries
+Any prefix before the endpoint is accepted, so the API connection Host can be set as 'http://localhost:8984/api'.
+
+The payloads are synthetic and deterministic (same seed, same data) or recorded ones:
+with --fixtures DIR the file DIR/<Master>.json (ex. Products.json) or DIR/Invoices-<day>.json / DIR/Invoices.json
+is served instead, it should contain the whole response. Ex. {"Products": [...]}
+
+Usage:
+    python3 rap_connector_agora/tools/fake_agora_server.py --port 8984 --products 3000 --invoices 2000 --latency 0.05
+It only needs the Python standard library.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+_logger = logging.getLogger('fake_agora')
+
+MASTERS = ['Series', 'PriceLists', 'WorkplacesSummary', 'SaleCenters', 'Families', 'Products']
+PAYMENT_METHODS = ['Efectivo', 'Tarjeta', 'Tarjeta Amex']
+VAT_RATES = {1: 0.0, 2: 0.04, 3: 0.1, 4: 0.21}
+
+
+class FakeAgoraData(object):
+    """
+    Synthetic Agora data, generated on demand and cached by master/day
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.fixtures = options.fixtures
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.imported_products = {}
+        self.last_product_id = options.products
+        self.last_format_id = options.products * 2
+        self.import_count = 0
+
+    # --------------------------------- helpers -----------------------------------------
+    def _rand(self, *salt):
+        return random.Random('{}-{}'.format(self.options.seed, '-'.join(str(s) for s in salt)))
+
+    def _fixture(self, name):
+        if not self.fixtures:
+            return None
+        path = os.path.join(self.fixtures, '{}.json'.format(name))
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as fixture:
+            return fixture.read()
+
+    def _cached(self, key, generate):
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = json.dumps(generate()).encode()
+            return self._cache[key]
+
+    @staticmethod
+    def _format_id(product_id, index):
+        # Base formats go from 1 to N, additional formats after all of them
+        return product_id if index is None else product_id * 10 + index
+
+    # --------------------------------- masters -----------------------------------------
+    def master(self, name):
+        content = self._fixture(name)
+        if content is not None:
+            return content
+        generate = getattr(self, '_gen_{}'.format(name.lower()), None)
+        return self._cached(name, lambda: {name: generate() if generate else []})
+
+    def _gen_series(self):
+        return [{'Id': 1, 'Name': 'T'}, {'Id': 2, 'Name': 'R'}]
+
+    def _gen_pricelists(self):
+        return [{'Id': i, 'Name': 'Tarifa {}'.format(i)} for i in range(1, self.options.pricelists + 1)]
+
+    def _gen_workplacessummary(self):
+        return [{'Id': i, 'Name': 'TPV {}'.format(i)} for i in range(1, self.options.workplaces + 1)]
+
+    def _gen_salecenters(self):
+        centers = []
+        for i in range(1, self.options.sale_centers + 1):
+            centers.append({
+                'Id': i,
+                'Name': 'Sala {}'.format(i),
+                'ButtonText': 'Sala {}'.format(i),
+                'Color': '#BACDE2',
+                'PriceListId': (i - 1) % self.options.pricelists + 1,
+                'SaleLocations': [{'Name': 'Mesa {}'.format(n)} for n in range(1, self.options.locations + 1)],
+            })
+        return centers
+
+    def _gen_families(self):
+        return [{'Id': i, 'Name': 'Familia {}'.format(i), 'Color': '#BACDE2', 'DeletionDate': None}
+                for i in range(1, self.options.families + 1)]
+
+    def _prices(self, rand):
+        return [{'PriceListId': pricelist,
+                 'MainPrice': round(rand.uniform(1, 30), 2),
+                 'AddinPrice': round(rand.uniform(0, 3), 2),
+                 'MenuItemPrice': 0.0} for pricelist in range(1, self.options.pricelists + 1)]
+
+    def _gen_products(self):
+        products = []
+        options = self.options
+        addin_ids = list(range(1, min(options.products, 20) + 1))
+        for product_id in range(1, options.products + 1):
+            rand = self._rand('product', product_id)
+            product = {
+                'Id': product_id,
+                'Name': 'Producto {}'.format(product_id),
+                'ButtonText': 'Producto {}'.format(product_id),
+                'Color': '#BACDE2',
+                'BaseSaleFormatId': self._format_id(product_id, None),
+                'FamilyId': rand.randint(1, options.families),
+                'VatId': rand.choice([3, 4]),
+                'PreparationTypeId': rand.randint(1, 9),
+                'PreparationOrderId': rand.randint(1, 4),
+                'CostPrice': round(rand.uniform(0.1, 8), 2),
+                'Ratio': 1.0,
+                'SaleableAsMain': product_id not in addin_ids,
+                'SaleableAsAddin': product_id in addin_ids,
+                'IsSoldByWeight': False,
+                'AskForPreparationNotes': False,
+                'AskForAddins': False,
+                'PrintWhenPriceIsZero': True,
+                'DeletionDate': None,
+                'Prices': self._prices(rand),
+                'Addins': [],
+                'AdditionalSaleFormats': [],
+            }
+            if product_id not in addin_ids and rand.random() < options.addin_ratio:
+                product['Addins'] = [{'AddinSaleFormatId': self._format_id(addin, None)}
+                                     for addin in rand.sample(addin_ids, min(3, len(addin_ids)))]
+            for index in range(1, rand.randint(0, options.formats) + 1):
+                product['AdditionalSaleFormats'].append({
+                    'Id': self._format_id(product_id, index),
+                    'Name': 'Producto {} F{}'.format(product_id, index),
+                    'ButtonText': 'F{}'.format(index),
+                    'Color': '#BACDE2',
+                    'Ratio': float(index + 1),
+                    'SaleableAsMain': True,
+                    'SaleableAsAddin': False,
+                    'AskForAddins': False,
+                    'DeletionDate': None,
+                    'Prices': self._prices(rand),
+                    'Addins': [],
+                })
+            products.append(product)
+        for product in self.imported_products.values():
+            products.append(product)
+        return products
+
+    def product_formats(self):
+        """
+        Return: List of (format_id, name, vat_id) that can be used in the ticket lines
+        """
+        formats = []
+        for product_id in range(1, self.options.products + 1):
+            rand = self._rand('product', product_id)
+            rand.randint(1, self.options.families)
+            formats.append((self._format_id(product_id, None), 'Producto {}'.format(product_id), rand.choice([3, 4])))
+        return formats
+
+    # --------------------------------- invoices ----------------------------------------
+    def invoices(self, business_day):
+        content = self._fixture('Invoices-{}'.format(business_day))
+        if content is None:
+            content = self._fixture('Invoices')
+        if content is not None:
+            return content
+        return self._cached(('Invoices', business_day), lambda: {'Invoices': self._gen_invoices(business_day)})
+
+    def _gen_invoices(self, business_day):
+        options = self.options
+        formats = self.product_formats()
+        day = datetime.strptime(business_day, '%Y-%m-%d')
+        # The numbers grow day by day as in a real serie
+        first_number = (day.date() - date(2020, 1, 1)).days * options.invoices + 1
+        invoices = []
+        for index in range(options.invoices):
+            rand = self._rand('invoice', business_day, index)
+            number = first_number + index
+            lines = []
+            for line_index in range(1, rand.randint(1, options.lines) + 1):
+                format_id, name, vat_id = rand.choice(formats)
+                quantity = rand.randint(1, 3)
+                lines.append({
+                    'Index': line_index,
+                    'Type': 'Standard',
+                    'ProductName': name,
+                    'SaleFormatId': format_id,
+                    'VatId': vat_id,
+                    'VatRate': VAT_RATES[vat_id],
+                    'Quantity': quantity,
+                    'TotalAmount': round(quantity * rand.uniform(1, 30), 2),
+                    'DiscountRate': 0.0,
+                    'Addins': [],
+                })
+            total = round(sum(line['TotalAmount'] for line in lines), 2)
+            invoices.append({
+                'Serie': options.serie,
+                'Number': number,
+                'DocumentType': 'BasicInvoice',
+                'BusinessDay': business_day,
+                'Date': (day + timedelta(hours=12, seconds=index * 20)).isoformat(),
+                'User': {'Id': 1, 'Name': 'Camarero {}'.format(rand.randint(1, 5))},
+                'Workplace': {'Id': rand.randint(1, options.workplaces)},
+                'Customer': None,
+                'Totals': {
+                    'GrossAmount': total,
+                    'NetAmount': round(total / 1.1, 2),
+                    'Taxes': [{'VatRate': VAT_RATES[lines[0]['VatId']]}],
+                },
+                'InvoiceItems': [{
+                    'SaleCenter': {'Id': rand.randint(1, options.sale_centers)},
+                    'Discounts': {'DiscountRate': 0.0, 'CashDiscount': 0.0},
+                    'Lines': lines,
+                }],
+                'Payments': [{'MethodName': rand.choice(PAYMENT_METHODS), 'Amount': total,
+                              'TipAmount': 0.0}],
+            })
+        return invoices
+
+    # --------------------------------- posts -------------------------------------------
+    def import_data(self, data):
+        products = (data or {}).get('Products') or []
+        with self._lock:
+            self.import_count += len(products)
+            for product in products:
+                if product.get('Id'):
+                    self.imported_products[product['Id']] = product
+                    self.last_product_id = max(self.last_product_id, product['Id'])
+                formats = [product.get('BaseSaleFormatId')] + [f.get('Id') for f in product.get('AdditionalSaleFormats') or []]
+                self.last_format_id = max([self.last_format_id] + [f for f in formats if f])
+            self._cache.pop('Products', None)
+        return {'Products': len(products)}
+
+    def custom_query(self, data):
+        data = data or {}
+        guid = (data.get('QueryGuid') or '').strip('{}')
+        params = data.get('Params') or {}
+        if guid == self.options.loss_guid or (guid != self.options.last_ids_guid and 'from' in params):
+            return self._loss(params)
+        return [{'last_product_id': self.last_product_id, 'last_format_id': self.last_format_id}]
+
+    def _loss(self, params):
+        rand = self._rand('loss', params.get('from'))
+        return [{'StockChangeId': 1000 + index,
+                 'ProductId': rand.randint(1, self.options.products),
+                 'Quantity': rand.randint(1, 4)} for index in range(self.options.losses)]
+
+
+class FakeAgoraHandler(BaseHTTPRequestHandler):
+    server_version = 'FakeAgora/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def data(self):
+        return self.server.data
+
+    @property
+    def options(self):
+        return self.server.options
+
+    def log_message(self, format, *args):
+        _logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _wait(self):
+        latency = self.options.latency
+        if self.options.jitter:
+            latency += random.uniform(0, self.options.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def _check_request(self):
+        self._wait()
+        if self.options.token and self.headers.get('Api-Token') != self.options.token:
+            self._send_json({'Message': 'Invalid Api-Token'}, status=401)
+            return False
+        if self.options.error_rate and random.random() < self.options.error_rate:
+            self._send_json({'Message': 'Injected error'}, status=503)
+            return False
+        return True
+
+    def _send_json(self, payload, status=200, cache=False):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if cache and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            body = gzip.compress(body, compresslevel=5)
+            encoding = 'gzip'
+        else:
+            encoding = None
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if cache:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        content = self.rfile.read(length) if length else b''
+        return json.loads(content) if content else None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        master_filter = (query.get('filter') or [''])[0]
+        if not self._check_request():
+            return
+        if url.path.rstrip('/').endswith('/export-master'):
+            if master_filter not in MASTERS:
+                _logger.info("Unknown master %s, empty list returned", master_filter)
+            self._send_json(self.data.master(master_filter), cache=True)
+        elif url.path.rstrip('/').endswith('/export'):
+            business_day = (query.get('business-day') or [date.today().isoformat()])[0]
+            self._send_json(self.data.invoices(business_day))
+        else:
+            self._send_json({'Message': 'Not found'}, status=404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        data = self._read_json()
+        if not self._check_request():
+            return
+        if url.path.rstrip('/').endswith('/import'):
+            self._send_json(self.data.import_data(data))
+        elif url.path.rstrip('/').endswith('/custom-query'):
+            self._send_json(self.data.custom_query(data))
+        else:
+            self._send_json({'Message': 'Not found'}, status=404)
+
+
+class FakeAgoraServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, options):
+        super().__init__((options.host, options.port), FakeAgoraHandler)
+        self.options = options
+        self.data = FakeAgoraData(options)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Local stand-in of the Agora API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8984)
+    parser.add_argument('--token', default='', help='Api-Token required, by default any token is accepted')
+    parser.add_argument('--fixtures', default='', help='Directory with recorded responses (<Master>.json)')
+    parser.add_argument('--seed', default='agora', help='Seed of the synthetic data')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to each request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random seconds added to the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Ratio of requests answered with 503')
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--formats', type=int, default=2, help='Max additional formats by product')
+    parser.add_argument('--addin-ratio', type=float, default=0.1, help='Ratio of products with addins')
+    parser.add_argument('--families', type=int, default=20)
+    parser.add_argument('--pricelists', type=int, default=2)
+    parser.add_argument('--workplaces', type=int, default=3)
+    parser.add_argument('--sale-centers', type=int, default=4)
+    parser.add_argument('--locations', type=int, default=30, help='Sale locations by sale center')
+    parser.add_argument('--invoices', type=int, default=1000, help='Tickets by business day')
+    parser.add_argument('--lines', type=int, default=6, help='Max lines by ticket')
+    parser.add_argument('--losses', type=int, default=10, help='Stock changes returned by the loss query')
+    parser.add_argument('--serie', default='T0')
+    parser.add_argument('--last-ids-guid', default='', help='QueryGuid of the last_ids report')
+    parser.add_argument('--loss-guid', default='', help='QueryGuid of the loss report')
+    return parser
+
+
+def main(args=None):
+    options = get_parser().parse_args(args)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    server = FakeAgoraServer(options)
+    _logger.info("Fake Agora listening on http://%s:%s", options.host, options.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+"""
+Concurrent download of Agora payloads.
+The requests are made in a bounded thread pool and each body is saved in a spooled temporary file,
+so the ORM processing can be done later in the main thread (or in its own cursor) without keep the
+network connections waiting.
+This module doesn't use the ORM, the jobs only contain plain data.
+"""
+
+import hashlib
+import json
+import logging
+import tempfile
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import http_session, json_stream
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+# Bodies bigger than this size are moved from memory to a temporary file
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+
+# group: Jobs of the same group are returned together (usually the api.connection id)
+# key: Identifier of the job inside of the group (usually the Agora filter)
+FetchJob = namedtuple('FetchJob', ['group', 'key', 'endpoint', 'method', 'end_point', 'params', 'json', 'headers'])
+
+
+def make_job(group, key, endpoint, end_point, params=None, method='GET', json=None, headers=None):
+    return FetchJob(group, key, endpoint, method, end_point, params, json, headers)
+
+
+class FetchResult(object):
+    """
+    Downloaded payload of a FetchJob
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.status_code = False
+        self.headers = {}
+        self.body = None
+        self.fingerprint = False
+        self.error = False
+
+    @property
+    def ok(self):
+        return not self.error and self.status_code in (200, 304)
+
+    @property
+    def not_modified(self):
+        """
+        True when the server confirmed that the content didn't change since the validators sent in the request
+        """
+        return self.status_code == 304
+
+    def _chunks(self):
+        self.body.seek(0)
+        return iter(lambda: self.body.read(json_stream.CHUNK_SIZE), b'')
+
+    def iter_records(self, key):
+        """
+        Return: Generator with the records of the list 'key', decoded from the saved body
+        """
+        if not self.body:
+            return iter([])
+        return json_stream.iter_json_array(self._chunks(), key)
+
+    def json(self):
+        """
+        Return: The whole body decoded, only for small payloads
+        """
+        if not self.body:
+            return None
+        self.body.seek(0)
+        content = self.body.read()
+        return json.loads(content) if content else None
+
+    def close(self):
+        if self.body:
+            self.body.close()
+            self.body = None
+
+
+def fetch(job):
+    """
+    Make the request of the job and save the body
+    Return: FetchResult, the errors are never raised but saved in the result
+    """
+    result = FetchResult(job)
+    try:
+        response = http_session.send(job.endpoint, job.method, job.end_point, headers=job.headers,
+                                     params=job.params, json=job.json, stream=True)
+        try:
+            result.status_code = response.status_code
+            result.headers = response.headers
+            body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+            digest = hashlib.sha256()
+            for chunk in response.iter_content(chunk_size=json_stream.CHUNK_SIZE):
+                body.write(chunk)
+                digest.update(chunk)
+            result.body = body
+            result.fingerprint = digest.hexdigest()
+        finally:
+            response.close()
+        if response.status_code not in (200, 304):
+            result.error = 'Agora server answered with status {}'.format(response.status_code)
+    except Exception as e:
+        _logger.error("Agora request %s %s failed: %s", job.method, job.end_point, e)
+        result.error = str(e) or e.__class__.__name__
+    return result
+
+
+def fetch_by_group(jobs, max_workers=DEFAULT_WORKERS):
+    """
+    Download all the jobs concurrently
+    Params:
+        jobs: List of FetchJob
+        max_workers: Max number of requests at the same time
+    Return: Generator of (group, {key: FetchResult}), each group is returned as soon as all its jobs are done,
+            so one slow server doesn't delay the processing of the others
+    """
+    pending = defaultdict(int)
+    for job in jobs:
+        pending[job.group] += 1
+    done = defaultdict(dict)
+    if not jobs:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        futures = [executor.submit(fetch, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            group = result.job.group
+            done[group][result.job.key] = result
+            pending[group] -= 1
+            if not pending[group]:
+                yield group, done.pop(group)
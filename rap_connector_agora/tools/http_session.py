@@ -0,0 +1,131 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+"""
+Pooled HTTP sessions used to talk with the Agora servers.
+There is one keep-alive session per API connection (so per company) and per worker process.
+This module doesn't use the ORM, it can be called from any thread.
+"""
+
+import logging
+import threading
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import rate_guard
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 120.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+# Server errors and throttling answers that should be retried before giving up (Retry-After is respected)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# key: Identifier of the connection, usually (dbname, api.connection id)
+# rate_limit: Max requests by second (0 means no limit), rate_burst: Requests allowed at once
+# failure_threshold: Consecutive failures that open the circuit (0 disables it), recovery_time: Seconds open
+AgoraEndpoint = namedtuple('AgoraEndpoint', [
+    'key', 'url', 'token', 'pool_size', 'connect_timeout', 'read_timeout', 'max_retries', 'retry_backoff',
+    'rate_limit', 'rate_burst', 'failure_threshold', 'recovery_time'
+], defaults=[0.0, 1, rate_guard.DEFAULT_FAILURE_THRESHOLD, rate_guard.DEFAULT_RECOVERY_TIME])
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _get_retry(endpoint):
+    """
+    Return: Retry policy for the endpoint (connection resets and 5xx responses)
+    Only the GET requests are retried after a read error or an error status. A POST (Ex. /import) could be
+    already applied by the server when the answer is slow or a 5xx, so it's only retried if the connection
+    was not established (connect retries apply to any method)
+    """
+    values = {
+        'total': endpoint.max_retries,
+        'connect': endpoint.max_retries,
+        'read': endpoint.max_retries,
+        'status': endpoint.max_retries,
+        'backoff_factor': endpoint.retry_backoff,
+        'status_forcelist': RETRY_STATUS,
+        'raise_on_status': False,
+    }
+    methods = frozenset(['GET'])
+    try:
+        return Retry(allowed_methods=methods, **values)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=methods, **values)
+
+
+def _new_session(endpoint):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=endpoint.pool_size, max_retries=_get_retry(endpoint))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'Accept': 'application/json',
+        'Accept-Encoding': 'gzip',
+        'Content-Type': 'application/json; charset=utf-8',
+    })
+    session.verify = False
+    return session
+
+
+def get_session(endpoint):
+    """
+    Return the session related with the endpoint, creating it when its need it.
+    The session is recreated if the pool or the retry config changed.
+    """
+    signature = (endpoint.pool_size, endpoint.max_retries, endpoint.retry_backoff)
+    with _sessions_lock:
+        current = _sessions.get(endpoint.key)
+        if current and current[0] == signature:
+            return current[1]
+        session = _new_session(endpoint)
+        _sessions[endpoint.key] = (signature, session)
+    if current:
+        current[1].close()
+    _logger.debug("New Agora HTTP session for %s", endpoint.key)
+    return session
+
+
+def close_session(key):
+    with _sessions_lock:
+        current = _sessions.pop(key, None)
+    if current:
+        current[1].close()
+
+
+def send(endpoint, method, end_point, headers=None, **kwargs):
+    """
+    Make a request to Agora using the pooled session of the endpoint
+    Params:
+        endpoint: AgoraEndpoint with the connection config
+        method: 'GET' or 'POST'
+        end_point: Endpoint to complement the Host. Ex. '/export-master'
+        headers: Extra headers for this request
+        kwargs: Any other argument accepted by requests (params, json, stream)
+    Return: requests.Response. Network errors are raised as requests exceptions,
+            rate_guard.CircuitOpenError if the server is failing and rate_guard.RateLimitError if the rate limit
+            didn't allow the request
+    """
+    guard = rate_guard.get_guard(endpoint)
+    guard.before_request()
+    request_headers = {'Api-Token': endpoint.token}
+    if headers:
+        request_headers.update(headers)
+    url = '{}{}'.format(endpoint.url, end_point)
+    try:
+        response = get_session(endpoint).request(method, url, headers=request_headers,
+                                                 timeout=(endpoint.connect_timeout, endpoint.read_timeout), **kwargs)
+    except Exception as e:
+        guard.after_request(error=e)
+        raise
+    guard.after_request(response=response)
+    return response
@@ -0,0 +1,90 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+"""
+Blocks of Agora IDs reserved for the new products and formats created in Odoo.
+A block is reserved once in the database (see api.connection._reserve_agora_ids) and its IDs
+are handed out from memory, so two pushes never get the same ID and no write is needed by product.
+The blocks are kept by connection, kind of ID and worker process. They expire after DEFAULT_TTL
+seconds, so the next block is aligned again with Agora. The IDs not used of an expired block are given
+to the reservation function, to be handed back if no other block was reserved after it.
+This module doesn't use the ORM, the reservation function is provided by the caller.
+"""
+
+import threading
+import time
+
+DEFAULT_TTL = 300
+
+
+class IdBlock(object):
+
+    def __init__(self, first, last):
+        """
+        Params:
+            first, last: Range of IDs reserved, both included
+        """
+        self.next_id = first
+        self.last = last
+        self.loaded_at = time.monotonic()
+
+    def take(self):
+        """
+        Return: Next ID of the block, None if the block is used up
+        """
+        if self.next_id > self.last:
+            return None
+        value = self.next_id
+        self.next_id += 1
+        return value
+
+    def is_expired(self, ttl=DEFAULT_TTL):
+        return time.monotonic() - self.loaded_at > ttl
+
+    def unused(self):
+        """
+        Return: (first, last) IDs of the block not handed out, None if the block is used up
+        """
+        if self.next_id > self.last:
+            return None
+        return self.next_id, self.last
+
+
+_blocks = {}
+# One lock by connection and kind, so a slow reservation only blocks the requests of the same block
+_locks = {}
+_blocks_lock = threading.Lock()
+
+
+def _get_lock(key, kind):
+    with _blocks_lock:
+        return _locks.setdefault((key, kind), threading.Lock())
+
+
+def next_id(key, kind, reserve, ttl=DEFAULT_TTL):
+    """
+    Params:
+        key: Identifier of the connection, usually (dbname, api.connection id)
+        kind: Kind of ID, Ex. 'product' or 'format'
+        reserve: function(kind, unused) -> (first, last), called when there is no block, it's used up or expired.
+                 unused is the (first, last) range not handed out of the expired block, or None
+        ttl: Seconds to keep a block
+    Return: New ID
+    """
+    with _get_lock(key, kind):
+        with _blocks_lock:
+            block = _blocks.get((key, kind))
+        value = block.take() if block and not block.is_expired(ttl) else None
+        if value is None:
+            # The reservation is made out of the global lock, the other connections are not blocked
+            block = IdBlock(*reserve(kind, block and block.unused()))
+            value = block.take()
+            with _blocks_lock:
+                _blocks[(key, kind)] = block
+        return value
+
+
+def invalidate(key):
+    with _blocks_lock:
+        for block_key in [block_key for block_key in _blocks if block_key[0] == key]:
+            del _blocks[block_key]
@@ -0,0 +1,121 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+"""
+Incremental decoding of the Agora export payloads.
+Agora always answer with an object like {"Invoices": [{...}, {...}]}, so the records of the list
+can be decoded one by one while the body is downloaded, without keep the whole list in memory.
+"""
+
+import codecs
+import json
+
+CHUNK_SIZE = 64 * 1024
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',:]}'
+
+
+class _StreamReader(object):
+    """
+    Text buffer over an iterable of chunks (bytes or str) that is filled only when need it
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        Read the next chunk in the buffer
+        Return: False when there is nothing more to read
+        """
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        for chunk in self._chunks:
+            text = chunk if isinstance(chunk, str) else self._utf8.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self._utf8.decode(b'', final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        """
+        Return: Next character that is not a whitespace, '' at the end of the stream
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof or not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("Invalid JSON stream, expected '{}' at position {}".format(char, self.pos))
+        self.pos += 1
+
+    def value(self):
+        """
+        Decode the next JSON value of the stream, reading more chunks while the value is incomplete
+        """
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof or not self.fill():
+                    raise
+                continue
+            if not self.eof and (end == len(self.buffer) or self.buffer[end] not in _DELIMITERS) and self.fill():
+                # A number or a literal could continue in the next chunk
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_json_array(chunks, key):
+    """
+    Generator to get one by one the records of the list saved in 'key'
+    Params:
+        chunks: Iterable of bytes, for example response.iter_content()
+        key: Key of the main object with the list. Ex. 'Invoices'
+    Return: Generator of records (dicts)
+    """
+    reader = _StreamReader(chunks)
+    char = reader.peek()
+    if not char:
+        return
+    reader.expect('{')
+    while True:
+        char = reader.peek()
+        if char in ('}', ''):
+            return
+        if char == ',':
+            reader.pos += 1
+            continue
+        name = reader.value()
+        reader.expect(':')
+        if name != key or reader.peek() != '[':
+            reader.value()
+            continue
+        reader.pos += 1
+        while True:
+            char = reader.peek()
+            if char == ']':
+                reader.pos += 1
+                break
+            if char == ',':
+                reader.pos += 1
+                continue
+            if not char:
+                raise ValueError("Invalid JSON stream, the list '{}' is not complete".format(key))
+            yield reader.value()
+
@@ -0,0 +1,61 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+"""
+Minimal scheduler of dependent stages, used to import the Agora masters in parallel.
+Each stage is started as soon as all its prerequisites are done, so the total time is
+about the longest chain of dependencies. When a stage fails, the stages depending on it are skipped.
+This module doesn't use the ORM, each stage should open its own cursor.
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+
+
+def run(graph, run_stage, max_workers=DEFAULT_WORKERS):
+    """
+    Params:
+        graph: Dict {stage: [prerequisite stages]}. The prerequisites not in the graph are ignored
+        run_stage: function(stage), any exception means the stage failed
+        max_workers: Max number of stages running at the same time
+    Return: Dict {stage: error message} of the stages failed or skipped, empty if all went OK
+    """
+    pending = {stage: [dep for dep in deps if dep in graph] for stage, deps in graph.items()}
+    done = set()
+    errors = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+
+        def submit_ready():
+            changed = True
+            while changed:
+                changed = False
+                for stage, deps in list(pending.items()):
+                    failed = [dep for dep in deps if dep in errors]
+                    if failed:
+                        errors[stage] = 'Skipped because {} failed'.format(', '.join(str(dep) for dep in failed))
+                        del pending[stage]
+                        changed = True
+                    elif all(dep in done for dep in deps):
+                        running[executor.submit(run_stage, stage)] = stage
+                        del pending[stage]
+
+        submit_ready()
+        while running:
+            finished, __ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    future.result()
+                    done.add(stage)
+                except Exception as e:
+                    _logger.error("Stage %s failed: %s", stage, e)
+                    errors[stage] = str(e) or e.__class__.__name__
+            submit_ready()
+    for stage in pending:
+        errors[stage] = 'Never started, circular dependency'
+    return errors
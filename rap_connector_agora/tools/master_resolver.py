@@ -0,0 +1,62 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+"""
+In-memory lookups of the small Agora masters of one connection (families, taxes, preparation types...).
+The tables are loaded once by run and the lookups are served from dicts, without queries.
+The resolvers are kept by connection and worker process, they expire after DEFAULT_TTL seconds
+and are invalidated when the masters are imported.
+This module doesn't use the ORM, the resolver only contains ids.
+"""
+
+import threading
+import time
+
+DEFAULT_TTL = 300
+
+
+class MasterResolver(object):
+
+    def __init__(self, masters):
+        """
+        Params:
+            masters: Dict {master name: {agora_id: value}}. Ex. {'category': {12: 5}}
+        """
+        self.masters = masters
+        self.loaded_at = time.monotonic()
+
+    def get(self, master, agora_id, default=False):
+        """
+        Return: Value of the Agora Id in the master, default if not exist
+        """
+        return self.masters.get(master, {}).get(agora_id, default)
+
+    def is_expired(self, ttl=DEFAULT_TTL):
+        return time.monotonic() - self.loaded_at > ttl
+
+
+_resolvers = {}
+_resolvers_lock = threading.Lock()
+
+
+def get_resolver(key, ttl=DEFAULT_TTL):
+    """
+    Return: MasterResolver of the connection, None if not loaded or expired
+    """
+    with _resolvers_lock:
+        resolver = _resolvers.get(key)
+        if resolver and resolver.is_expired(ttl):
+            del _resolvers[key]
+            resolver = None
+        return resolver
+
+
+def set_resolver(key, resolver):
+    with _resolvers_lock:
+        _resolvers[key] = resolver
+    return resolver
+
+
+def invalidate(key):
+    with _resolvers_lock:
+        _resolvers.pop(key, None)
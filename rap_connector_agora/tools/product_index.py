@@ -0,0 +1,74 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+"""
+In-memory index of the products of one company by their Agora identifiers.
+It's loaded once before importing the Agora Products, so the existence checks of each record
+don't need a query. This module doesn't use the ORM, it's built from search_read rows.
+"""
+
+# Fields of product.template needed to build the index
+INDEX_FIELDS = ['agora_id', 'base_format_id', 'sale_format', 'active', 'agora_hash']
+
+
+class ProductRef(object):
+    __slots__ = ('id', 'active', 'hash')
+
+    def __init__(self, product_id, active, record_hash=False):
+        self.id = product_id
+        self.active = active
+        self.hash = record_hash
+
+
+class ProductIndex(object):
+
+    def __init__(self, rows=()):
+        self.by_agora_id = {}
+        self.by_base_format = {}
+        self.by_sale_format = {}
+        for row in rows:
+            self.add(row)
+
+    @staticmethod
+    def _set(mapping, key, ref):
+        # The active products win, like the searches done without active_test
+        if key and (key not in mapping or (ref.active and not mapping[key].active)):
+            mapping[key] = ref
+
+    def add(self, row):
+        """
+        Params:
+            row: Dict with 'id' and INDEX_FIELDS, as returned by search_read
+        Return: ProductRef added
+        """
+        ref = ProductRef(row['id'], row['active'], row.get('agora_hash'))
+        self._set(self.by_agora_id, row['agora_id'], ref)
+        self._set(self.by_base_format, row['base_format_id'], ref)
+        self._set(self.by_sale_format, row['sale_format'], ref)
+        return ref
+
+    def get_product(self, agora_id):
+        """
+        Return: ProductRef of the main product with the Agora Id, None if not exist
+        """
+        return self.by_agora_id.get(agora_id)
+
+    def get_format(self, format_id, is_format=None, active_only=True):
+        """
+        Params:
+            format_id: Agora sale format Id
+            is_format: True to look only the formats (sale_format), False only the main products (base_format_id),
+                       None for both
+            active_only: Ignore the archived products
+        Return: ProductRef of the product with the sale format, None if not exist
+        """
+        mappings = []
+        if is_format is not False:
+            mappings.append(self.by_sale_format)
+        if is_format is not True:
+            mappings.append(self.by_base_format)
+        for mapping in mappings:
+            ref = mapping.get(format_id)
+            if ref and (ref.active or not active_only):
+                return ref
+        return None
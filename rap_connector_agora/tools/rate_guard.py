@@ -0,0 +1,294 @@
+# Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
+
+"""
+Client side protection of the Agora servers: rate limiter (token bucket) and circuit breaker by connection.
+When a server fails several times in a row the circuit is opened and the requests fail instantly,
+after the recovery time one request at a time is allowed (half open) to probe the server.
+The state is kept in memory, by worker process. When a store is set (see set_store) the state of the
+circuit breakers is also saved there each time it changes, and loaded from it, so all the processes share it.
+This module doesn't use the ORM, the store is provided by the caller.
+"""
+
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RECOVERY_TIME = 300
+# Max seconds a request waits for the rate limiter before failing
+MAX_RATE_WAIT = 60.0
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class TokenBucket(object):
+    """
+    Allow 'rate' requests by second with bursts of 'burst' requests. rate=0 means no limit
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, rate, burst):
+        with self._lock:
+            self.rate = rate
+            self.burst = max(burst, 1)
+            self.tokens = min(self.tokens, self.burst)
+
+    def acquire(self, max_wait=MAX_RATE_WAIT):
+        """
+        Wait until a token is available
+        Return: False if the token was not available in max_wait seconds
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                if self.rate <= 0:
+                    return True
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, failure_threshold, recovery_time):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = ''
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def configure(self, failure_threshold, recovery_time):
+        with self._lock:
+            self.failure_threshold = failure_threshold
+            self.recovery_time = recovery_time
+
+    @property
+    def retry_at(self):
+        """
+        Return: Epoch time when the circuit will allow a probe, False if its not open
+        """
+        if self.state != OPEN:
+            return False
+        return time.time() + max(0.0, self.opened_at + self.recovery_time - time.monotonic())
+
+    def current_state(self):
+        with self._lock:
+            if self.state == OPEN and time.monotonic() >= self.opened_at + self.recovery_time:
+                return HALF_OPEN
+            return self.state
+
+    def allow(self):
+        """
+        Raise CircuitOpenError if the request should not be done
+        """
+        with self._lock:
+            if self.failure_threshold <= 0 or self.state == CLOSED:
+                return
+            if self.state == OPEN:
+                if time.monotonic() < self.opened_at + self.recovery_time:
+                    raise CircuitOpenError('Circuit open after {} failures: {}'.format(self.failures, self.last_error))
+                self.state = HALF_OPEN
+                self._probing = False
+            if self._probing:
+                raise CircuitOpenError('Circuit half open, waiting for the probe request')
+            self._probing = True
+
+    def release_probe(self):
+        """
+        Let another request probe the server, when the probe allowed was finally not sent
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            self._probing = False
+            if self.failure_threshold > 0 and (self.state == HALF_OPEN or self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.last_error = ''
+            self._probing = False
+
+    def signature(self):
+        """
+        Return: Tuple that changes each time the state of the circuit changes
+        """
+        return self.state, self.failures, self.last_error, self.opened_at
+
+    def snapshot(self):
+        """
+        Return: Dict with the state of the circuit, to be saved in the store.
+                retry_at is an epoch time, False if the circuit is not open
+        """
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'retry_at': self.retry_at,
+                    'last_error': self.last_error}
+
+    def restore(self, snapshot):
+        """
+        Function to set the state saved by other process. A half open circuit is restored as open
+        and already recovered, so this process can send its own probe
+        """
+        with self._lock:
+            self.state = snapshot.get('state') or CLOSED
+            self.failures = snapshot.get('failures') or 0
+            self.last_error = snapshot.get('last_error') or ''
+            self._probing = False
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+            if self.state == OPEN:
+                pending = max(0.0, (snapshot.get('retry_at') or 0) - time.time())
+                self.opened_at = time.monotonic() - self.recovery_time + pending
+
+
+class RateGuard(object):
+    """
+    Rate limiter and circuit breaker of one connection
+    """
+
+    def __init__(self, endpoint):
+        self.key = endpoint.key
+        self.bucket = TokenBucket(endpoint.rate_limit, endpoint.rate_burst)
+        self.breaker = CircuitBreaker(endpoint.failure_threshold, endpoint.recovery_time)
+        self._saved = self.breaker.signature()
+        self.load()
+
+    def load(self):
+        """
+        Function to load the state of the circuit saved in the store
+        Return: True if a state was loaded
+        """
+        if not _store:
+            return False
+        try:
+            snapshot = _store[0](self.key)
+        except Exception as e:
+            _logger.warning("Circuit state of %s not loaded: %s", self.key, e)
+            return False
+        if not snapshot:
+            return False
+        self.breaker.restore(snapshot)
+        self._saved = self.breaker.signature()
+        return True
+
+    def save(self):
+        """
+        Function to save the state of the circuit in the store, only if it changed since the last save
+        """
+        signature = self.breaker.signature()
+        if not _store or signature == self._saved:
+            return
+        try:
+            if _store[1](self.key, self.breaker.snapshot()):
+                self._saved = signature
+        except Exception as e:
+            _logger.warning("Circuit state of %s not saved: %s", self.key, e)
+
+    def configure(self, endpoint):
+        self.bucket.configure(endpoint.rate_limit, endpoint.rate_burst)
+        self.breaker.configure(endpoint.failure_threshold, endpoint.recovery_time)
+
+    def before_request(self):
+        try:
+            self.breaker.allow()
+        except CircuitOpenError:
+            # The circuit could be closed meanwhile by other process (Ex. reset by hand)
+            if not self.load() or self.breaker.current_state() == OPEN:
+                raise
+            self.breaker.allow()
+        if not self.bucket.acquire():
+            # The probe was not sent, let another request try it
+            self.breaker.release_probe()
+            raise RateLimitError('Rate limit of {} requests by second reached'.format(self.bucket.rate))
+
+    def after_request(self, response=None, error=None):
+        """
+        Function to record the result of a request in the circuit breaker.
+        Network errors and 5xx answers count as failures
+        """
+        if error is not None:
+            self.breaker.record_failure(error)
+        elif response.status_code >= 500:
+            self.breaker.record_failure('Status {}'.format(response.status_code))
+        else:
+            self.breaker.record_success()
+        self.save()
+
+    def reset(self):
+        self.breaker.reset()
+        self._saved = self.breaker.signature()
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+# (load, save) functions of the shared state of the circuits, see set_store
+_store = None
+
+
+def set_store(load, save):
+    """
+    Params:
+        load: function(key) -> snapshot dict (see CircuitBreaker.snapshot) or None
+        save: function(key, snapshot) -> True if saved. If not, it's saved again with the next request
+    """
+    global _store
+    _store = (load, save) if load and save else None
+
+
+def get_guard(endpoint):
+    with _guards_lock:
+        guard = _guards.get(endpoint.key)
+        if not guard:
+            guard = _guards[endpoint.key] = RateGuard(endpoint)
+        else:
+            guard.configure(endpoint)
+        return guard
+
+
+def find_guard(key):
+    """
+    Return: RateGuard of the connection, None if there was no request yet
+    """
+    return _guards.get(key)
@@ -1,6 +1,7 @@
 # Copyright 2022-TODAY Rapsodoo Iberia S.r.L. (www.rapsodoo.com)
 # License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
 from odoo import models, api, fields, _
+from ..models.agora_connector import FIRST_SYNC_MASTERS
 
 
 class ImportDataManually(models.TransientModel):
@@ -12,7 +13,8 @@ class ImportDataManually(models.TransientModel):
                    ('workplace', 'Work Places'),
                    ('salecenter', 'Sale Centers'),
                    ('category', 'Categories'),
-                   ('product', 'Products')],
+                   ('product', 'Products'),
+                   ('all', 'All Masters')],
         required=True,
         default='category',
         string="Import Data"
@@ -38,3 +40,6 @@ class ImportDataManually(models.TransientModel):
             self.instance_id.get_master_categories()
         if self.data_model == 'product':
             self.instance_id.get_master_products()
+        if self.data_model == 'all':
+            # The masters are imported in parallel, each one in its own transaction
+            self.instance_id.sync_masters(FIRST_SYNC_MASTERS)